@@ -0,0 +1,121 @@
+"""initial schema
+
+Revision ID: 3f1c2a9b7d10
+Revises: 
+Create Date: 2025-02-03 10:00:00.000000
+
+Existing databases created with metadata.create_all() should be marked
+with `alembic stamp 3f1c2a9b7d10` instead of running this revision.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f1c2a9b7d10'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'User',
+        sa.Column('id', sa.Text(), nullable=False),
+        sa.Column('name', sa.Text(), nullable=True),
+        sa.Column('email', sa.Text(), nullable=True),
+        sa.Column('email_verified', sa.TIMESTAMP(), nullable=True),
+        sa.Column('image', sa.Text(), nullable=True),
+        sa.Column('password', sa.Text(), nullable=True),
+        sa.Column('role', sa.Enum('ADMIN', 'USER', name='user_role_enum'), nullable=False),
+        sa.Column('isTwoFactorEnabled', sa.Boolean(), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'charging_stations',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('name', sa.String(length=255), nullable=False),
+        sa.Column('latitude', sa.Float(), nullable=False),
+        sa.Column('longitude', sa.Float(), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'discounts',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('code', sa.String(length=255), nullable=False),
+        sa.Column('description', sa.String(length=255), nullable=False),
+        sa.Column('discount_percentage', sa.BigInteger(), nullable=False),
+        sa.Column('expiration_date', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'vehicles',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.Text(), nullable=False),
+        sa.Column('license_plate', sa.String(length=255), nullable=False),
+        sa.Column('brand', sa.String(length=255), nullable=False),
+        sa.Column('battery_capacity_kwh', sa.Integer(), nullable=True),
+        sa.Column('battery_condition', sa.Float(), nullable=True),
+        sa.Column('max_charging_powerkwh', sa.BigInteger(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('current_battery_capacity_kw', sa.Float(), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['User.id']),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('license_plate')
+    )
+    op.create_table(
+        'charging_ports',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('station_id', sa.BigInteger(), nullable=False),
+        sa.Column('power_kw', sa.BigInteger(), nullable=False),
+        sa.Column('status', sa.String(length=255), nullable=False),
+        sa.Column('last_service_date', sa.Date(), nullable=True),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['station_id'], ['charging_stations.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'charging_sessions',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.String(), nullable=False),
+        sa.Column('vehicle_id', sa.BigInteger(), nullable=False),
+        sa.Column('port_id', sa.BigInteger(), nullable=False),
+        sa.Column('start_time', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('end_time', sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column('energy_used_kwh', sa.Float(), nullable=False),
+        sa.Column('total_cost', sa.Float(), nullable=False),
+        sa.Column('status', sa.String(length=255), nullable=False),
+        sa.Column('payment_status', sa.String(length=255), nullable=False),
+        sa.ForeignKeyConstraint(['port_id'], ['charging_ports.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['User.id']),
+        sa.ForeignKeyConstraint(['vehicle_id'], ['vehicles.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table(
+        'payments',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('user_id', sa.Text(), nullable=False),
+        sa.Column('session_id', sa.BigInteger(), nullable=False),
+        sa.Column('status', sa.String(length=255), nullable=False),
+        sa.Column('transaction_id', sa.BigInteger(), nullable=False),
+        sa.Column('payment_method', sa.String(length=255), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.ForeignKeyConstraint(['session_id'], ['charging_sessions.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['User.id']),
+        sa.PrimaryKeyConstraint('id')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('payments')
+    op.drop_table('charging_sessions')
+    op.drop_table('charging_ports')
+    op.drop_table('vehicles')
+    op.drop_table('discounts')
+    op.drop_table('charging_stations')
+    op.drop_table('User')
+    sa.Enum(name='user_role_enum').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,29 @@
+"""payment claim lease
+
+Revision ID: 9a1e4c7b2d58
+Revises: f4b8d2c6e1a3
+Create Date: 2025-03-17 09:00:00.000000
+
+payments.claimed_until is set by the process that is about to charge a
+PENDING payment. Other processes skip the payment until the lease
+expires, so recovery in several workers cannot charge it twice.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a1e4c7b2d58'
+down_revision: Union[str, None] = 'f4b8d2c6e1a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('payments', sa.Column('claimed_until', sa.TIMESTAMP(timezone=True), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('payments', 'claimed_until')
@@ -0,0 +1,52 @@
+"""hot path indexes and unique discount codes
+
+Revision ID: a84e61c0f2d3
+Revises: 3f1c2a9b7d10
+Create Date: 2025-02-03 10:30:00.000000
+
+Indexes are built CONCURRENTLY so the migration does not block writes.
+The unique index on discounts(code) fails if the existing data already
+contains duplicate discount codes.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a84e61c0f2d3'
+down_revision: Union[str, None] = '3f1c2a9b7d10'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+IN_PROGRESS = sa.text("status = 'IN_PROGRESS'")
+
+
+def upgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.create_index('ix_charging_sessions_user_id_status', 'charging_sessions', ['user_id', 'status'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_charging_sessions_port_id_in_progress', 'charging_sessions', ['port_id'],
+                        postgresql_where=IN_PROGRESS, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_charging_sessions_vehicle_id_in_progress', 'charging_sessions', ['vehicle_id'],
+                        postgresql_where=IN_PROGRESS, postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_payments_user_id_created_at', 'payments', ['user_id', 'created_at'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_vehicles_user_id', 'vehicles', ['user_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_charging_ports_station_id', 'charging_ports', ['station_id'],
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ux_discounts_code', 'discounts', ['code'], unique=True,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ux_discounts_code', table_name='discounts', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_charging_ports_station_id', table_name='charging_ports', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_vehicles_user_id', table_name='vehicles', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_payments_user_id_created_at', table_name='payments', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_charging_sessions_vehicle_id_in_progress', table_name='charging_sessions', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_charging_sessions_port_id_in_progress', table_name='charging_sessions', postgresql_concurrently=True, if_exists=True)
+        op.drop_index('ix_charging_sessions_user_id_status', table_name='charging_sessions', postgresql_concurrently=True, if_exists=True)
@@ -0,0 +1,42 @@
+"""shared idempotency key store
+
+Revision ID: b3f7a9c1e5d2
+Revises: 9a1e4c7b2d58
+Create Date: 2025-03-24 09:00:00.000000
+
+Idempotency-Key responses move from a per-process memory store to this
+table, so a retry handled by another worker is replayed as well.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3f7a9c1e5d2'
+down_revision: Union[str, None] = '9a1e4c7b2d58'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'idempotency_keys',
+        sa.Column('path', sa.Text(), nullable=False),
+        sa.Column('auth_hash', sa.String(length=64), nullable=False),
+        sa.Column('key', sa.Text(), nullable=False),
+        sa.Column('fingerprint', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.Integer(), nullable=True),
+        sa.Column('headers', postgresql.JSONB(astext_type=sa.Text()), nullable=True),
+        sa.Column('body', sa.LargeBinary(), nullable=True),
+        sa.Column('expires_at', sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.PrimaryKeyConstraint('path', 'auth_hash', 'key')
+    )
+    op.create_index('ix_idempotency_keys_expires_at', 'idempotency_keys', ['expires_at'])
+
+
+def downgrade() -> None:
+    op.drop_index('ix_idempotency_keys_expires_at', table_name='idempotency_keys')
+    op.drop_table('idempotency_keys')
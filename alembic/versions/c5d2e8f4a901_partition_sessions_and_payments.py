@@ -0,0 +1,163 @@
+"""monthly partitioning of charging_sessions and payments
+
+Revision ID: c5d2e8f4a901
+Revises: a84e61c0f2d3
+Create Date: 2025-02-10 09:00:00.000000
+
+Rebuilds both tables as RANGE partitioned by month (start_time and
+created_at) and copies the existing rows. The copy takes an exclusive
+lock on both tables, so run it in a maintenance window.
+
+Partitioned tables cannot carry unique constraints without the partition
+key, therefore:
+- primary keys become (id, start_time) and (id, created_at)
+- payments.session_id loses its foreign key to charging_sessions
+POST /sessions/start serializes starts per vehicle with a row lock
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d2e8f4a901'
+down_revision: Union[str, None] = 'a84e61c0f2d3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+MONTHS_AHEAD = 3
+
+CREATE_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, from_month timestamptz, months_ahead integer)
+RETURNS integer AS $$
+DECLARE
+    month_start timestamptz := date_trunc('month', from_month AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    last_month timestamptz := (date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+                              + make_interval(months => months_ahead);
+    partition_name text;
+    created integer := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('%s_y%sm%s', parent,
+                                 to_char(month_start AT TIME ZONE 'UTC', 'YYYY'),
+                                 to_char(month_start AT TIME ZONE 'UTC', 'MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, parent, month_start, month_start + interval '1 month');
+            created := created + 1;
+        END IF;
+        month_start := month_start + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+SESSION_COLUMNS = "id, user_id, vehicle_id, port_id, start_time, end_time, energy_used_kwh, total_cost, status, payment_status"
+PAYMENT_COLUMNS = "id, user_id, session_id, status, transaction_id, payment_method, created_at"
+
+
+def _rebuild_partitioned(table: str, columns_ddl: str, partition_key: str, columns: str):
+    old = f"{table}_unpartitioned"
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(f"ALTER TABLE {old} RENAME CONSTRAINT {table}_pkey TO {old}_pkey")
+    op.execute(f"""
+        CREATE TABLE {table} (
+            id BIGINT NOT NULL DEFAULT nextval('{table}_id_seq'),
+            {columns_ddl},
+            PRIMARY KEY (id, {partition_key})
+        ) PARTITION BY RANGE ({partition_key})
+    """)
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"""
+        SELECT create_monthly_partitions(
+            '{table}', COALESCE((SELECT min({partition_key}) FROM {old}), now()), {MONTHS_AHEAD}
+        )
+    """)
+    op.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}")
+    op.execute(f"DROP TABLE {old}")
+
+
+def upgrade() -> None:
+    op.execute(CREATE_PARTITION_FUNCTION)
+    op.drop_constraint('payments_session_id_fkey', 'payments', type_='foreignkey')
+
+    op.drop_index('ix_charging_sessions_user_id_status', table_name='charging_sessions')
+    op.drop_index('ix_charging_sessions_port_id_in_progress', table_name='charging_sessions')
+    # Databases indexed by an earlier a84e61c0f2d3 have the unique variant, which goes with the old table
+    op.drop_index('ix_charging_sessions_vehicle_id_in_progress', table_name='charging_sessions', if_exists=True)
+    _rebuild_partitioned('charging_sessions', """
+            user_id VARCHAR NOT NULL REFERENCES "User" (id),
+            vehicle_id BIGINT NOT NULL REFERENCES vehicles (id),
+            port_id BIGINT NOT NULL REFERENCES charging_ports (id),
+            start_time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            end_time TIMESTAMP WITH TIME ZONE,
+            energy_used_kwh FLOAT NOT NULL,
+            total_cost FLOAT NOT NULL,
+            status VARCHAR(255) NOT NULL,
+            payment_status VARCHAR(255) NOT NULL""", 'start_time', SESSION_COLUMNS)
+    op.create_index('ix_charging_sessions_user_id_status', 'charging_sessions', ['user_id', 'status'])
+    op.create_index('ix_charging_sessions_port_id_in_progress', 'charging_sessions', ['port_id'],
+                    postgresql_where=sa.text("status = 'IN_PROGRESS'"))
+    op.create_index('ix_charging_sessions_vehicle_id_in_progress', 'charging_sessions', ['vehicle_id'],
+                    postgresql_where=sa.text("status = 'IN_PROGRESS'"))
+
+    op.drop_index('ix_payments_user_id_created_at', table_name='payments')
+    _rebuild_partitioned('payments', """
+            user_id TEXT NOT NULL REFERENCES "User" (id),
+            session_id BIGINT NOT NULL,
+            status VARCHAR(255) NOT NULL,
+            transaction_id BIGINT NOT NULL,
+            payment_method VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()""", 'created_at', PAYMENT_COLUMNS)
+    op.create_index('ix_payments_user_id_created_at', 'payments', ['user_id', 'created_at'])
+
+
+def _rebuild_plain(table: str, columns_ddl: str, columns: str):
+    old = f"{table}_partitioned"
+    op.execute(f"ALTER TABLE {table} RENAME TO {old}")
+    op.execute(f"ALTER TABLE {old} RENAME CONSTRAINT {table}_pkey TO {old}_pkey")
+    op.execute(f"""
+        CREATE TABLE {table} (
+            id BIGINT NOT NULL DEFAULT nextval('{table}_id_seq') PRIMARY KEY,
+            {columns_ddl}
+        )
+    """)
+    op.execute(f"ALTER SEQUENCE {table}_id_seq OWNED BY {table}.id")
+    op.execute(f"INSERT INTO {table} ({columns}) SELECT {columns} FROM {old}")
+    op.execute(f"DROP TABLE {old}")
+
+
+def downgrade() -> None:
+    op.drop_index('ix_payments_user_id_created_at', table_name='payments')
+    _rebuild_plain('payments', """
+            user_id TEXT NOT NULL REFERENCES "User" (id),
+            session_id BIGINT NOT NULL,
+            status VARCHAR(255) NOT NULL,
+            transaction_id BIGINT NOT NULL,
+            payment_method VARCHAR(255) NOT NULL,
+            created_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now()""", PAYMENT_COLUMNS)
+    op.create_index('ix_payments_user_id_created_at', 'payments', ['user_id', 'created_at'])
+
+    op.drop_index('ix_charging_sessions_user_id_status', table_name='charging_sessions')
+    op.drop_index('ix_charging_sessions_port_id_in_progress', table_name='charging_sessions')
+    op.drop_index('ix_charging_sessions_vehicle_id_in_progress', table_name='charging_sessions')
+    _rebuild_plain('charging_sessions', """
+            user_id VARCHAR NOT NULL REFERENCES "User" (id),
+            vehicle_id BIGINT NOT NULL REFERENCES vehicles (id),
+            port_id BIGINT NOT NULL REFERENCES charging_ports (id),
+            start_time TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT now(),
+            end_time TIMESTAMP WITH TIME ZONE,
+            energy_used_kwh FLOAT NOT NULL,
+            total_cost FLOAT NOT NULL,
+            status VARCHAR(255) NOT NULL,
+            payment_status VARCHAR(255) NOT NULL""", SESSION_COLUMNS)
+    op.create_index('ix_charging_sessions_user_id_status', 'charging_sessions', ['user_id', 'status'])
+    op.create_index('ix_charging_sessions_port_id_in_progress', 'charging_sessions', ['port_id'],
+                    postgresql_where=sa.text("status = 'IN_PROGRESS'"))
+    op.create_index('ix_charging_sessions_vehicle_id_in_progress', 'charging_sessions', ['vehicle_id'],
+                    postgresql_where=sa.text("status = 'IN_PROGRESS'"))
+    op.create_foreign_key('payments_session_id_fkey', 'payments', 'charging_sessions', ['session_id'], ['id'])
+
+    op.execute("DROP FUNCTION IF EXISTS create_monthly_partitions(text, timestamptz, integer)")
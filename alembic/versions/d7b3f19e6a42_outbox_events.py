@@ -0,0 +1,50 @@
+"""transactional outbox of domain events
+
+Revision ID: d7b3f19e6a42
+Revises: c5d2e8f4a901
+Create Date: 2025-02-17 09:00:00.000000
+
+outbox_events.txid defaults to the writing transaction id, which the
+relay uses to publish only events of finished transactions
+(requires PostgreSQL 13+ for pg_current_xact_id).
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd7b3f19e6a42'
+down_revision: Union[str, None] = 'c5d2e8f4a901'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        'outbox_events',
+        sa.Column('id', sa.BigInteger(), nullable=False),
+        sa.Column('txid', sa.BigInteger(), server_default=sa.text('pg_current_xact_id()::text::bigint'), nullable=False),
+        sa.Column('event_type', sa.String(length=255), nullable=False),
+        sa.Column('aggregate_id', sa.BigInteger(), nullable=False),
+        sa.Column('payload', postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_outbox_events_txid_id', 'outbox_events', ['txid', 'id'])
+    op.create_table(
+        'outbox_offsets',
+        sa.Column('consumer', sa.String(length=255), nullable=False),
+        sa.Column('last_txid', sa.BigInteger(), nullable=False),
+        sa.Column('last_event_id', sa.BigInteger(), nullable=False),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.PrimaryKeyConstraint('consumer')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('outbox_offsets')
+    op.drop_index('ix_outbox_events_txid_id', table_name='outbox_events')
+    op.drop_table('outbox_events')
@@ -0,0 +1,33 @@
+"""charged amount and discount on payments
+
+Revision ID: e2c91f5a7b13
+Revises: d7b3f19e6a42
+Create Date: 2025-03-03 09:00:00.000000
+
+payments.amount stores the amount actually charged (after discount), so
+payments recovered after a restart are charged the same amount.
+payments.discount_id references the discount consumed when the payment
+settles. Both are nullable; payments created before this revision fall
+back to charging_sessions.total_cost.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2c91f5a7b13'
+down_revision: Union[str, None] = 'd7b3f19e6a42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('payments', sa.Column('amount', sa.Float(), nullable=True))
+    op.add_column('payments', sa.Column('discount_id', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('payments', 'discount_id')
+    op.drop_column('payments', 'amount')
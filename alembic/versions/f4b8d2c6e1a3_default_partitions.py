@@ -0,0 +1,107 @@
+"""default partitions and automatic partition maintenance
+
+Revision ID: f4b8d2c6e1a3
+Revises: e2c91f5a7b13
+Create Date: 2025-03-10 09:00:00.000000
+
+Adds a DEFAULT partition to charging_sessions and payments, so inserts
+for a month without a partition still succeed. create_monthly_partitions()
+now moves rows that landed in the DEFAULT partition into the month
+partition it creates, which the partition maintenance job (cron, or one
+application process) runs periodically.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4b8d2c6e1a3'
+down_revision: Union[str, None] = 'e2c91f5a7b13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+PARTITIONED_TABLES = ("charging_sessions", "payments")
+
+CREATE_PARTITION_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, from_month timestamptz, months_ahead integer)
+RETURNS integer AS $$
+DECLARE
+    month_start timestamptz := date_trunc('month', from_month AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    last_month timestamptz := (date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+                              + make_interval(months => months_ahead);
+    default_name text := parent || '_default';
+    partition_key text := substring(pg_get_partkeydef(parent::regclass) FROM '\((\w+)\)');
+    partition_name text;
+    has_rows boolean;
+    created integer := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('%s_y%sm%s', parent,
+                                 to_char(month_start AT TIME ZONE 'UTC', 'YYYY'),
+                                 to_char(month_start AT TIME ZONE 'UTC', 'MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            has_rows := false;
+            IF to_regclass(default_name) IS NOT NULL THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                               default_name, partition_key, month_start, partition_key, month_start + interval '1 month')
+                INTO has_rows;
+            END IF;
+            IF has_rows THEN
+                -- Rows that landed in the DEFAULT partition move to the new month partition
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+                EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                               default_name, partition_key, month_start, partition_key, month_start + interval '1 month', partition_name);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                               parent, partition_name, month_start, month_start + interval '1 month');
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_start + interval '1 month');
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := month_start + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+PREVIOUS_PARTITION_FUNCTION = """
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, from_month timestamptz, months_ahead integer)
+RETURNS integer AS $$
+DECLARE
+    month_start timestamptz := date_trunc('month', from_month AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    last_month timestamptz := (date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+                              + make_interval(months => months_ahead);
+    partition_name text;
+    created integer := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('%s_y%sm%s', parent,
+                                 to_char(month_start AT TIME ZONE 'UTC', 'YYYY'),
+                                 to_char(month_start AT TIME ZONE 'UTC', 'MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                           partition_name, parent, month_start, month_start + interval '1 month');
+            created := created + 1;
+        END IF;
+        month_start := month_start + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+
+def upgrade() -> None:
+    op.execute(CREATE_PARTITION_FUNCTION)
+    for table in PARTITIONED_TABLES:
+        op.execute(f"CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT")
+
+
+def downgrade() -> None:
+    # Detached rather than dropped, so rows that landed there are kept as a standalone table
+    for table in PARTITIONED_TABLES:
+        op.execute(f"ALTER TABLE {table} DETACH PARTITION {table}_default")
+    op.execute(PREVIOUS_PARTITION_FUNCTION)
@@ -0,0 +1,283 @@
+import argparse
+import logging
+import os
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from itertools import groupby
+from typing import Callable, Iterable, Iterator, List, Optional
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import select, delete
+from . import models
+from .config import settings
+from .database import SessionLocal, init_engine
+
+"""
+Cold archive of completed charging sessions
+Paid sessions older than settings.archive_after_days are moved in batches
+from charging_sessions to zstd-compressed Parquet files, one directory per
+month, and deleted from the live table in the same transaction. A crash
+after the files are written but before the DELETE commits leaves a batch in
+both places, so readers pass merged rows through unique_sessions
+Usage (nightly cron):
+    python -m app.archive [--before 2024-01] [--batch-size 5000]
+"""
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_TABLE = "charging_sessions"
+ARCHIVED_STATUS = "COMPLETED"
+ARCHIVED_PAYMENT_STATUS = "PAID"
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("user_id", pa.string()),
+    ("vehicle_id", pa.int64()),
+    ("port_id", pa.int64()),
+    ("start_time", pa.timestamp("us", tz="UTC")),
+    ("end_time", pa.timestamp("us", tz="UTC")),
+    ("energy_used_kwh", pa.float64()),
+    ("total_cost", pa.float64()),
+    ("status", pa.string()),
+    ("payment_status", pa.string()),
+])
+
+ArchivedSession = namedtuple("ArchivedSession", ARCHIVE_SCHEMA.names)
+
+def _month_dir(archive_dir: str, month: datetime) -> str:
+    return os.path.join(archive_dir, ARCHIVE_TABLE, month.strftime("%Y-%m"))
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+def _month_of(value: datetime) -> datetime:
+    return _utc(value).astimezone(timezone.utc).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def _write_month(directory: str, rows: List) -> str:
+    os.makedirs(directory, exist_ok=True)
+    # Named after the id range so a batch re-run after a failed delete overwrites its own file
+    path = os.path.join(directory, f"part-{rows[0].id}-{rows[-1].id}.parquet")
+    columns = {name: [getattr(row, name) for row in rows] for name in ARCHIVE_SCHEMA.names}
+    columns["start_time"] = [_utc(value) for value in columns["start_time"]]
+    columns["end_time"] = [_utc(value) for value in columns["end_time"]]
+    table = pa.table(columns, schema=ARCHIVE_SCHEMA)
+    tmp_path = f"{path}.tmp"
+    pq.write_table(table, tmp_path, compression="zstd")
+    os.replace(tmp_path, path)
+    return path
+
+def archive_batch(before: datetime, batch_size: int, archive_dir: str) -> int:
+    """
+    Moves one batch of archivable sessions to Parquet and deletes them from the live table
+    Args:
+        before: Only sessions started before this instant are archived
+        batch_size: Maximum number of sessions moved
+        archive_dir: Root directory of the archive
+    Returns:
+        int: Number of sessions archived
+    """
+    session_model = models.ChargingSession
+    db = SessionLocal()
+    written = []
+    try:
+        rows = db.execute(
+            select(*(getattr(session_model, name) for name in ARCHIVE_SCHEMA.names))
+            .where(
+                session_model.status == ARCHIVED_STATUS,
+                session_model.payment_status == ARCHIVED_PAYMENT_STATUS,
+                session_model.start_time < before
+            )
+            .order_by(session_model.start_time, session_model.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+        ).all()
+        if not rows:
+            return 0
+
+        for month, month_rows in groupby(rows, key=lambda row: _month_of(row.start_time)):
+            written.append(_write_month(_month_dir(archive_dir, month), list(month_rows)))
+
+        db.execute(
+            delete(session_model)
+            .where(session_model.id.in_([row.id for row in rows]), session_model.start_time < before)
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return len(rows)
+    except Exception:
+        db.rollback()
+        # Rows stay in the live table, so their files must not be read as well;
+        # after a crash here readers drop the copies with unique_sessions
+        for path in written:
+            os.remove(path)
+        raise
+    finally:
+        db.close()
+
+def archive_sessions(before: datetime = None, batch_size: int = None, archive_dir: str = None) -> int:
+    """
+    Archives all completed and paid sessions started before a cutoff
+    Args:
+        before: Cutoff, defaults to settings.archive_after_days ago
+        batch_size: Sessions per transaction, defaults to settings.archive_batch_size
+        archive_dir: Root directory of the archive, defaults to settings.archive_dir
+    Returns:
+        int: Number of sessions archived
+    """
+    before = before or datetime.now(timezone.utc) - timedelta(days=settings.archive_after_days)
+    batch_size = batch_size or settings.archive_batch_size
+    archive_dir = archive_dir or settings.archive_dir
+    total = 0
+    while True:
+        archived = archive_batch(before, batch_size, archive_dir)
+        if not archived:
+            return total
+        total += archived
+        logger.info(f"Archived {total} sessions")
+
+def archived_months(start: Optional[datetime] = None, end: Optional[datetime] = None, archive_dir: str = None) -> List[str]:
+    """
+    Lists archive month directories overlapping [start, end)
+    Args:
+        start: Lower bound, unbounded when None
+        end: Exclusive upper bound, unbounded when None
+        archive_dir: Root directory of the archive, defaults to settings.archive_dir
+    Returns:
+        List[str]: Month directories, oldest first
+    """
+    root = os.path.join(archive_dir or settings.archive_dir, ARCHIVE_TABLE)
+    if not os.path.isdir(root):
+        return []
+    start, end = _utc(start), _utc(end)
+    months = []
+    for name in sorted(os.listdir(root)):
+        try:
+            month = datetime.strptime(name, "%Y-%m").replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        if (start is None or next_month > start) and (end is None or month < end):
+            months.append(os.path.join(root, name))
+    return months
+
+def _filter(
+    start: Optional[datetime],
+    end: Optional[datetime],
+    user_id: Optional[str],
+    lower: Optional[str],
+    upper: Optional[str],
+) -> Optional[ds.Expression]:
+    conditions = []
+    if start is not None:
+        conditions.append(ds.field("start_time") >= pa.scalar(_utc(start), ARCHIVE_SCHEMA.field("start_time").type))
+    if end is not None:
+        conditions.append(ds.field("start_time") < pa.scalar(_utc(end), ARCHIVE_SCHEMA.field("start_time").type))
+    if user_id is not None:
+        conditions.append(ds.field("user_id") == user_id)
+    if lower is not None:
+        conditions.append(ds.field("user_id") > lower)
+    if upper is not None:
+        conditions.append(ds.field("user_id") <= upper)
+    expression = None
+    for condition in conditions:
+        expression = condition if expression is None else expression & condition
+    return expression
+
+def _read(months: List[str], expression: Optional[ds.Expression]) -> pa.Table:
+    files = [
+        os.path.join(month, name)
+        for month in months
+        for name in sorted(os.listdir(month))
+        if name.endswith(".parquet")
+    ]
+    if not files:
+        return ARCHIVE_SCHEMA.empty_table()
+    table = ds.dataset(files, schema=ARCHIVE_SCHEMA, format="parquet").to_table(filter=expression)
+    # Binary string ordering, the same as the C collation used by the live queries
+    return table.take(pc.sort_indices(table, sort_keys=[("user_id", "ascending"), ("start_time", "ascending")]))
+
+def read_archived_sessions(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    lower: Optional[str] = None,
+    upper: Optional[str] = None,
+    archive_dir: str = None,
+) -> pa.Table:
+    """
+    Reads archived sessions, opening only the months overlapping the range
+    Args:
+        start: Earliest start_time, unbounded when None
+        end: Exclusive latest start_time, unbounded when None
+        user_id: Only sessions of this user
+        lower: Exclusive lower user_id bound
+        upper: Inclusive upper user_id bound
+        archive_dir: Root directory of the archive, defaults to settings.archive_dir
+    Returns:
+        pa.Table: Matching sessions ordered by user_id and start_time
+    """
+    return _read(archived_months(start, end, archive_dir), _filter(start, end, user_id, lower, upper))
+
+def iter_archived_sessions(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    user_id: Optional[str] = None,
+    lower: Optional[str] = None,
+    upper: Optional[str] = None,
+    archive_dir: str = None,
+) -> Iterator[ArchivedSession]:
+    """
+    Yields archived sessions as rows with the same attributes as live session rows
+    Months are read one at a time and each is ordered by user_id and start_time,
+    so the rows are ordered by start_time for a single user and by user_id within
+    a single month, without holding more than one month in memory
+    Takes the same arguments as read_archived_sessions
+    """
+    expression = _filter(start, end, user_id, lower, upper)
+    for month in archived_months(start, end, archive_dir):
+        for batch in _read([month], expression).to_batches():
+            for row in batch.to_pylist():
+                yield ArchivedSession(**row)
+
+def unique_sessions(rows: Iterable, key: Callable) -> Iterator:
+    """
+    Drops repeated session ids from archived and live rows merged on key
+    A crash between writing a batch's Parquet files and committing its DELETE
+    leaves the batch both archived and live, and the next run archives it again
+    under another file name. Copies of a session share its key, so only the ids
+    seen for the current key value are remembered
+    Args:
+        rows: Sessions ordered by key
+        key: Merge key, start_time or user_id
+    Yields:
+        Each session once, the first copy merged
+    """
+    current, seen = object(), set()
+    for row in rows:
+        value = key(row)
+        if value != current:
+            current, seen = value, set()
+        if row.id in seen:
+            continue
+        seen.add(row.id)
+        yield row
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old charging sessions to Parquet")
+    parser.add_argument("--before", help="Archive sessions started before this month, YYYY-MM")
+    parser.add_argument("--batch-size", type=int, default=settings.archive_batch_size)
+    parser.add_argument("--out", default=settings.archive_dir, help="Archive directory")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_engine()
+    before = datetime.strptime(args.before, "%Y-%m").replace(tzinfo=timezone.utc) if args.before else None
+    archived = archive_sessions(before, args.batch_size, args.out)
+    logger.info(f"Archived {archived} sessions in total")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+from sqlalchemy import update
+from sqlalchemy.orm.attributes import set_committed_value
+from . import models
+from .config import settings
+from .database import SessionLocal
+from .metrics import BATTERY_PENDING
+
+"""
+Write coalescing for vehicle battery levels
+Routes record the latest current_battery_capacity_kw per vehicle and a
+background task writes all pending values with one bulk UPDATE per interval.
+The buffer lives in one process: with several uvicorn workers, pending
+values are only overlaid on reads served by the worker that buffered them,
+and a direct write handled by another worker cannot discard them, so a
+buffered level may overwrite it up to flush_interval later. Deployments
+that need strict last-writer ordering per vehicle run a single worker or
+route a vehicle's requests to one worker
+"""
+
+logger = logging.getLogger(__name__)
+
+class BatteryWriteBuffer:
+    """
+    Keeps the latest pending battery level per vehicle and flushes them periodically
+    Attributes:
+        flush_interval: Seconds between bulk writes
+    """
+
+    def __init__(self, flush_interval: float = 2.0, session_factory=SessionLocal):
+        self.flush_interval = flush_interval
+        self.session_factory = session_factory
+        self._pending: Dict[int, float] = {}
+        self._inflight: Dict[int, float] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    async def start(self):
+        """Starts the periodic flush task on the running event loop"""
+        self._task = asyncio.create_task(self._flusher())
+
+    async def stop(self):
+        """Stops the flush task and writes all pending values"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await asyncio.to_thread(self.flush)
+
+    def set(self, vehicle_id: int, capacity: float):
+        """
+        Records a new battery level; written immediately when the flush task is not running
+        Args:
+            vehicle_id: Vehicle ID
+            capacity: New current_battery_capacity_kw
+        """
+        with self._lock:
+            self._pending[vehicle_id] = capacity
+            BATTERY_PENDING.set(len(self._pending))
+        if not self.running:
+            self.flush()
+
+    def get(self, vehicle_id: int) -> Optional[float]:
+        """Returns the pending battery level of a vehicle, if any"""
+        with self._lock:
+            capacity = self._pending.get(vehicle_id)
+            return capacity if capacity is not None else self._inflight.get(vehicle_id)
+
+    def pending(self) -> Dict[int, float]:
+        """Returns a snapshot of all pending battery levels, including those being written"""
+        with self._lock:
+            return {**self._inflight, **self._pending}
+
+    def discard(self, vehicle_id: int):
+        """
+        Drops a pending value superseded by a direct write
+        Waits for a flush in progress, so a batch taken before the direct
+        write commits first and cannot overwrite it afterwards. Call it
+        before the direct write locks the vehicle row, otherwise the flush
+        waits for that lock and both block
+        Args:
+            vehicle_id: Vehicle ID
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._pending.pop(vehicle_id, None)
+                BATTERY_PENDING.set(len(self._pending))
+
+    def apply(self, vehicles: Iterable[models.Vehicle]):
+        """
+        Overlays pending battery levels on loaded vehicles without marking them dirty
+        Args:
+            vehicles: Vehicle ORM objects
+        """
+        pending = self.pending()
+        if not pending:
+            return
+        for vehicle in vehicles:
+            capacity = pending.get(vehicle.id)
+            if capacity is not None:
+                set_committed_value(vehicle, "current_battery_capacity_kw", capacity)
+
+    def apply_rows(self, rows: Iterable[dict]):
+        """
+        Overlays pending battery levels on projected vehicle rows
+        Args:
+            rows: Vehicle dicts from read_models.fetch
+        """
+        pending = self.pending()
+        if not pending:
+            return
+        for row in rows:
+            capacity = pending.get(row["id"])
+            if capacity is not None:
+                row["current_battery_capacity_kw"] = capacity
+
+    def flush(self):
+        """Writes all pending battery levels with one bulk UPDATE"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                self._inflight = batch
+                BATTERY_PENDING.set(0)
+            if not batch:
+                return
+            db = self.session_factory()
+            try:
+                db.execute(update(models.Vehicle), [
+                    {"id": vehicle_id, "current_battery_capacity_kw": capacity}
+                    for vehicle_id, capacity in batch.items()
+                ])
+                db.commit()
+            except Exception:
+                db.rollback()
+                with self._lock:
+                    # Newer values recorded during the failed write take precedence
+                    self._pending = {**batch, **self._pending}
+                    BATTERY_PENDING.set(len(self._pending))
+                raise
+            finally:
+                with self._lock:
+                    self._inflight = {}
+                db.close()
+
+    async def _flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await asyncio.to_thread(self.flush)
+            except Exception:
+                logger.exception("Failed to flush battery levels, will retry")
+
+battery_buffer = BatteryWriteBuffer(flush_interval=settings.battery_flush_interval)
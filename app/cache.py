@@ -0,0 +1,241 @@
+import logging
+import select
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, Optional, Tuple
+from sqlalchemy import event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from .config import settings
+from .metrics import CACHE_REQUESTS
+
+"""
+Per-worker cache of catalog reads with cross-worker invalidation
+Mutating routes call notify(), which evicts the local entries once the
+session commits and sends a PostgreSQL NOTIFY committed with the change;
+every worker LISTENs on the channel and evicts the same entries. While the listener connection
+is down the cache falls back to a short TTL
+"""
+
+logger = logging.getLogger(__name__)
+
+INVALIDATION_CHANNEL = "cache_invalidation"
+ALL = "*"
+
+STATION = "station"
+PORT = "port"
+DISCOUNT = "discount"
+USER = "user"
+
+class LocalCache:
+    """
+    Thread-safe LRU cache with a TTL, keyed by (entity, key)
+    Attributes:
+        ttl: Seconds an entry is served while invalidations are received
+        fallback_ttl: Seconds an entry is served while the listener is down
+        max_entries: Maximum number of entries, least recently used are evicted first
+        connected: Whether invalidation notifications are currently received
+    Every invalidation also bumps a change counter of its entity, so derived
+    values such as cached responses can tell whether they are still current
+    """
+
+    def __init__(self, ttl: float = 300, fallback_ttl: float = 5, max_entries: int = 10000):
+        self.ttl = ttl
+        self.fallback_ttl = fallback_ttl
+        self.max_entries = max_entries
+        self.connected = False
+        self._entries: "OrderedDict[Tuple[str, Hashable], Tuple[float, Any]]" = OrderedDict()
+        self._versions: Dict[str, int] = {}
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def get(self, entity: str, key: Hashable) -> Optional[Any]:
+        ttl = self.ttl if self.connected else self.fallback_ttl
+        with self._lock:
+            entry = self._entries.get((entity, key))
+            if entry is None:
+                return None
+            if entry[0] + ttl < time.monotonic():
+                del self._entries[(entity, key)]
+                return None
+            self._entries.move_to_end((entity, key))
+            return entry[1]
+
+    def set(self, entity: str, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[(entity, key)] = (time.monotonic(), value)
+            self._entries.move_to_end((entity, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, entity: str, key: Hashable, load: Callable[[], Any]) -> Any:
+        """
+        Returns a cached value or loads and caches it
+        Args:
+            entity: Entity type
+            key: Entity ID, or ALL for a list of the entity
+            load: Loader called on a miss; None results are not cached
+        Returns:
+            Any: Cached or loaded value
+        """
+        value = self.get(entity, key)
+        CACHE_REQUESTS.labels(entity, "miss" if value is None else "hit").inc()
+        if value is None:
+            # An invalidation during load() may have evicted what load() read, so the stale value is not cached
+            versions = self.versions((entity,))
+            value = load()
+            if value is not None and self.versions((entity,)) == versions:
+                self.set(entity, key, value)
+        return value
+
+    def invalidate(self, entity: str, key: Optional[str] = None):
+        """
+        Evicts an entity's entry and its lists, or all its entries when key is None
+        Args:
+            entity: Entity type
+            key: Entity ID as sent in the notification
+        """
+        with self._lock:
+            self._versions[entity] = self._versions.get(entity, 0) + 1
+            if key is None:
+                for cached in [cached for cached in self._entries if cached[0] == entity]:
+                    del self._entries[cached]
+                return
+            for cached in [cached for cached in self._entries if cached[0] == entity and str(cached[1]) in (key, ALL)]:
+                del self._entries[cached]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._generation += 1
+
+    def versions(self, entities: Iterable[str]) -> tuple:
+        """
+        Returns the change counters of entities
+        Args:
+            entities: Entity types
+        Returns:
+            tuple: Counters, preceded by one bumped whenever the whole cache is cleared
+        """
+        with self._lock:
+            return (self._generation, *[self._versions.get(entity, 0) for entity in entities])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+cache = LocalCache(
+    ttl=settings.cache_ttl_seconds,
+    fallback_ttl=settings.cache_fallback_ttl_seconds,
+    max_entries=settings.cache_max_entries,
+)
+
+PENDING_INVALIDATIONS = "cache_invalidations"
+
+def notify(db: Session, entity: str, entity_id: Any = None):
+    """
+    Invalidates an entity in this and all other workers when the session commits
+    The local eviction waits for the commit too: evicted earlier, a concurrent
+    read could load the old row and cache it again before the change is visible
+    Args:
+        db: Database session of the write; the NOTIFY is sent when it commits
+        entity: Entity type
+        entity_id: Changed entity ID, None for all entities of the type
+    """
+    db.info.setdefault(PENDING_INVALIDATIONS, []).append((entity, None if entity_id is None else str(entity_id)))
+    if db.get_bind().dialect.name == "postgresql":
+        payload = entity if entity_id is None else f"{entity}:{entity_id}"
+        db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": INVALIDATION_CHANNEL, "payload": payload})
+
+def _invalidate_committed(db: Session):
+    for entity, key in db.info.pop(PENDING_INVALIDATIONS, ()):
+        cache.invalidate(entity, key)
+
+def _discard_rolled_back(db: Session, previous_transaction):
+    # A rolled back savepoint keeps the outer transaction's invalidations
+    if previous_transaction.parent is None:
+        db.info.pop(PENDING_INVALIDATIONS, None)
+
+event.listen(Session, "after_commit", _invalidate_committed)
+event.listen(Session, "after_soft_rollback", _discard_rolled_back)
+
+def _apply(payload: str):
+    entity, _, key = payload.partition(":")
+    cache.invalidate(entity, key or None)
+
+class InvalidationListener:
+    """
+    Background thread LISTENing for invalidations on a dedicated connection
+    Attributes:
+        engine: Engine the listener connection is taken from
+        reconnect_delay: Seconds between reconnection attempts
+        poll_timeout: Seconds between checks of the stop flag
+    """
+
+    def __init__(self, engine: Engine, reconnect_delay: float = 5.0, poll_timeout: float = 1.0):
+        self.engine = engine
+        self.reconnect_delay = reconnect_delay
+        self.poll_timeout = poll_timeout
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self.engine.dialect.name != "postgresql":
+            return
+        if settings.db_pgbouncer:
+            # LISTEN needs a session-level connection, which transaction pooling does not provide
+            logger.warning("Cache invalidation disabled behind PgBouncer, entries expire after the fallback TTL")
+            return
+        self._thread = threading.Thread(target=self._run, name="cache-invalidation", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.poll_timeout + 1)
+            self._thread = None
+        cache.connected = False
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._listen()
+            except Exception as e:
+                if cache.connected:
+                    logger.warning(f"Cache invalidation listener disconnected: {str(e)}")
+            # Notifications may have been missed; drop everything and serve short-lived entries
+            cache.connected = False
+            cache.clear()
+            self._stop.wait(self.reconnect_delay)
+
+    def _listen(self):
+        connection = self.engine.raw_connection()
+        # The listener keeps its connection for good, outside the pool
+        connection.detach()
+        dbapi_connection = connection.driver_connection
+        try:
+            dbapi_connection.autocommit = True
+            cursor = dbapi_connection.cursor()
+            cursor.execute(f"LISTEN {INVALIDATION_CHANNEL}")
+            cursor.close()
+            cache.clear()
+            cache.connected = True
+            if self.engine.dialect.driver == "psycopg2":
+                self._poll_psycopg2(dbapi_connection)
+            else:
+                self._poll_psycopg(dbapi_connection)
+        finally:
+            connection.close()
+
+    def _poll_psycopg2(self, dbapi_connection):
+        while not self._stop.is_set():
+            if select.select([dbapi_connection], [], [], self.poll_timeout) == ([], [], []):
+                continue
+            dbapi_connection.poll()
+            while dbapi_connection.notifies:
+                _apply(dbapi_connection.notifies.pop(0).payload)
+
+    def _poll_psycopg(self, dbapi_connection):
+        while not self._stop.is_set():
+            for notification in dbapi_connection.notifies(timeout=self.poll_timeout):
+                _apply(notification.payload)
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field
+from typing import Literal, Optional
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -11,10 +12,96 @@ class Settings(BaseSettings):
         secret_key: Secret key for JWT token generation
         algorithm: Algorithm used for JWT token encryption
         database_url: Database connection string
+        payment_gateway: Registered name of the payment gateway
+        payment_workers: Number of async payment workers
+        payment_max_retries: Gateway attempts before a payment is marked FAILED
+        payment_backoff_base: Base retry delay in seconds, doubled per attempt
+        payment_claim_lease_seconds: Seconds a worker owns a payment it is charging; must exceed
+            the longest charge, retries included, plus the time until its outcome is written
+        invoice_dir: Local directory for generated monthly invoices
+        idempotency_ttl_seconds: How long a response is replayed for its Idempotency-Key
+        battery_flush_interval: Seconds between bulk writes of coalesced battery levels
+        schema_check: Startup schema handling - "alembic" (verify head), "create" (create_all, development) or "off"
+        db_pool_size: Persistent connections kept per worker
+        db_max_overflow: Extra connections opened under load
+        db_pool_timeout: Seconds to wait for a free connection
+        db_pool_recycle: Seconds after which a connection is replaced
+        db_pool_pre_ping: Test connections before handing them out
+        db_pgbouncer: PgBouncer transaction pooling mode (NullPool, no prepared statements)
+        read_database_url: Read-only replica connection string, reads use the primary when unset
+        read_after_write_seconds: Seconds a caller's reads stay on the primary after its own write
+        read_max_lag_seconds: Replica lag above which all reads fall back to the primary
+        archive_dir: Local directory of the Parquet archive of old charging sessions
+        archive_after_days: Age in days after which paid sessions are archived
+        archive_batch_size: Sessions moved to the archive per transaction
+        outbox_sink: Event sink of the outbox relay - "file", "socket" or "memory"
+        outbox_file: Output file of the file sink
+        outbox_socket_address: host:port the socket sink connects to
+        outbox_batch_size: Events published per relay batch
+        outbox_poll_interval: Seconds the relay waits when no events are pending
+        cache_ttl_seconds: Lifetime of cached catalog reads while invalidations are received
+        cache_fallback_ttl_seconds: Lifetime of cached reads while the invalidation listener is down
+        cache_max_entries: Maximum number of cached reads per worker
+        partition_maintenance: Create upcoming monthly partitions from this process; enable it in one
+            process only, or run python -m app.partitions ensure from cron instead
+        partition_maintenance_interval: Seconds between checks that upcoming monthly partitions exist
+        http_cache_max_age: Seconds clients may reuse catalog responses without revalidating their ETag
+        query_stats: Count SQL statements and database time per request (Server-Timing header)
+        n_plus_one_threshold: Executions of one statement per request above which an N+1 warning is logged
+        metrics: Record Prometheus metrics and serve them at /metrics
+        slow_query_ms: Duration in milliseconds above which a statement goes to the slow-query log, 0 disables it
+        slow_query_log_size: Number of statement fingerprints kept in the slow-query log
+        slow_query_explain: Capture EXPLAIN plans of slow statements on PostgreSQL
+        profile_dir: Local directory of request profiles
+        profile_keep: Number of newest request profiles kept
+        profile_sample_rate: Profile one in this many requests per route, 0 profiles only on request (X-Profile header);
+            sampling matches the route of every request, and while a sample runs yappi traces
+            all threads and slows every concurrent request, so samples never overlap other profiles
     """
     secret_key: str = Field(alias="AUTH_SECRET")
     algorithm: str
     database_url: str
+    payment_gateway: str = "local"
+    payment_workers: int = 4
+    payment_max_retries: int = 5
+    payment_backoff_base: float = 0.5
+    payment_claim_lease_seconds: float = 600
+    invoice_dir: str = "invoices"
+    idempotency_ttl_seconds: int = 86400
+    battery_flush_interval: float = 2.0
+    schema_check: Literal["alembic", "create", "off"] = "alembic"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout: float = 30
+    db_pool_recycle: int = 1800
+    db_pool_pre_ping: bool = True
+    db_pgbouncer: bool = False
+    read_database_url: Optional[str] = None
+    read_after_write_seconds: float = 5.0
+    read_max_lag_seconds: float = 5.0
+    archive_dir: str = "archive"
+    archive_after_days: int = 365
+    archive_batch_size: int = 5000
+    outbox_sink: Literal["file", "socket", "memory"] = "file"
+    outbox_file: str = "outbox/events.ndjson"
+    outbox_socket_address: str = "localhost:9009"
+    outbox_batch_size: int = 500
+    outbox_poll_interval: float = 1.0
+    cache_ttl_seconds: float = 300
+    cache_fallback_ttl_seconds: float = 5
+    cache_max_entries: int = 10000
+    partition_maintenance: bool = False
+    partition_maintenance_interval: float = 3600
+    http_cache_max_age: int = 0
+    query_stats: bool = True
+    n_plus_one_threshold: int = 10
+    metrics: bool = True
+    slow_query_ms: float = 200
+    slow_query_log_size: int = 100
+    slow_query_explain: bool = True
+    profile_dir: str = "profiles"
+    profile_keep: int = 50
+    profile_sample_rate: int = 0
 
     class Config:
         env_file = ".env"
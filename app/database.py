@@ -1,14 +1,177 @@
-from sqlalchemy import create_engine
+import os
+import threading
+import time
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool, QueuePool
 from .config import settings
+from .query_stats import instrument_engine
+from .metrics import DB_POOL_WAIT, instrument_pool
+from .slow_queries import slow_query_log
 
 DATABASE_URL = settings.database_url
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Created by init_engine() from the application lifespan, not at import time
+engine = None
+read_engine = None
+SessionLocal = sessionmaker(autocommit=False, autoflush=False)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 Base = declarative_base()
 
+REPLICA_LAG_QUERY = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+REPLICA_LAG_CHECK_INTERVAL = 1.0
+_replica_lag = {"checked_at": 0.0, "lag": None}
+
+class PoolWaitStats:
+    """
+    Time spent waiting for a pooled connection in this worker process
+    Attributes:
+        count: Number of checkouts
+        total: Total wait time in seconds
+        max: Longest single wait in seconds
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+pool_wait_stats = PoolWaitStats()
+
+class TimedQueuePool(QueuePool):
+    """QueuePool recording how long each checkout waited for a connection"""
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            pool_wait_stats.record(waited)
+            DB_POOL_WAIT.observe(waited)
+
+def engine_options(url: str = DATABASE_URL) -> dict:
+    """
+    Builds create_engine() keyword arguments from the pool settings
+    Args:
+        url: Database connection string
+    Returns:
+        dict: Engine options
+    """
+    if settings.db_pgbouncer:
+        # PgBouncer owns pooling; server-side prepared statements break in transaction mode
+        options = {"poolclass": NullPool}
+        if make_url(url).get_driver_name() == "psycopg":
+            options["connect_args"] = {"prepare_threshold": None}
+        return options
+    return {
+        "poolclass": TimedQueuePool,
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout,
+        "pool_recycle": settings.db_pool_recycle,
+        "pool_pre_ping": settings.db_pool_pre_ping,
+    }
+
+def init_engine():
+    """
+    Creates the database engine and binds SessionLocal to it
+    Returns:
+        Engine: Created engine, or the existing one when already initialized
+    """
+    global engine, read_engine
+    if engine is None:
+        engine = create_engine(DATABASE_URL, **engine_options())
+        SessionLocal.configure(bind=engine)
+        if settings.read_database_url:
+            read_engine = create_engine(settings.read_database_url, **engine_options(settings.read_database_url))
+            ReadSessionLocal.configure(bind=read_engine)
+        for created in (engine, read_engine):
+            if created is None:
+                continue
+            if settings.query_stats:
+                instrument_engine(created)
+            if settings.metrics:
+                instrument_pool(created)
+            if settings.slow_query_ms > 0:
+                slow_query_log.instrument(created)
+    return engine
+
+def get_engine():
+    """
+    Returns the initialized engine
+    Raises:
+        RuntimeError: When init_engine() has not been called
+    """
+    if engine is None:
+        raise RuntimeError("Database engine is not initialized, call init_engine() first")
+    return engine
+
+def dispose_engine():
+    """Closes all pooled connections and releases the engines"""
+    global engine, read_engine
+    if read_engine is not None:
+        read_engine.dispose()
+        read_engine = None
+    if engine is not None:
+        engine.dispose()
+        engine = None
+
+def replica_lag():
+    """
+    Returns the replica replay lag in seconds, probed at most once per second
+    Returns:
+        Optional[float]: Lag in seconds, None when the replica cannot be queried
+    """
+    now = time.monotonic()
+    if now - _replica_lag["checked_at"] >= REPLICA_LAG_CHECK_INTERVAL:
+        _replica_lag["checked_at"] = now
+        try:
+            with read_engine.connect() as connection:
+                lag = connection.execute(REPLICA_LAG_QUERY).scalar()
+            _replica_lag["lag"] = float(lag or 0)
+        except Exception:
+            _replica_lag["lag"] = None
+    return _replica_lag["lag"]
+
+def pool_status() -> dict:
+    """
+    Reports connection pool usage of this worker process
+    Returns:
+        dict: Pool size, checked out, idle and overflow connections and checkout wait times
+    """
+    pool = get_engine().pool
+    status = {"pid": os.getpid(), "pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        status.update({
+            "size": pool.size(),
+            "checked_out": pool.checkedout(),
+            "idle": pool.checkedin(),
+            "overflow": max(pool.overflow(), 0),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+    status["wait"] = {
+        "checkouts": pool_wait_stats.count,
+        "total_seconds": round(pool_wait_stats.total, 6),
+        "avg_seconds": round(pool_wait_stats.total / pool_wait_stats.count, 6) if pool_wait_stats.count else 0.0,
+        "max_seconds": round(pool_wait_stats.max, 6),
+    }
+    return status
+
 def get_db():
     """
     Creates a database session and handles cleanup
@@ -19,4 +182,4 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
@@ -0,0 +1,123 @@
+import json
+import os
+import socket
+from typing import Dict, List, Optional, Type
+
+"""
+Destinations for domain events published by the outbox relay
+A sink receives batches of events in publish order; the relay only
+advances its offset after publish() returns, so a sink may see a batch
+again after a crash and consumers must deduplicate by event id
+"""
+
+class SinkError(Exception):
+    """Failed to deliver a batch - the relay retries it"""
+    pass
+
+class EventSink:
+    """Base class for event sinks"""
+    name = "base"
+
+    def publish(self, events: List[dict]):
+        """
+        Delivers a batch of events
+        Args:
+            events: Events in publish order
+        Raises:
+            SinkError: When the batch was not delivered
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Releases resources held by the sink"""
+        pass
+
+class FileSink(EventSink):
+    """
+    Appends events as JSON lines to a local file
+    Attributes:
+        path: Output file
+    """
+    name = "file"
+
+    def __init__(self, path: str = "outbox/events.ndjson"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def publish(self, events: List[dict]):
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(json.dumps(event, ensure_ascii=False) + "\n" for event in events)
+                f.flush()
+                os.fsync(f.fileno())
+        except OSError as e:
+            raise SinkError(f"Failed to write events to {self.path}: {str(e)}")
+
+class SocketSink(EventSink):
+    """
+    Streams events as JSON lines over a TCP connection
+    Attributes:
+        address: host:port of the consumer
+        timeout: Connect and send timeout in seconds
+    """
+    name = "socket"
+
+    def __init__(self, address: str = "localhost:9009", timeout: float = 5.0):
+        host, port = address.rsplit(":", 1)
+        self.address = (host, int(port))
+        self.timeout = timeout
+        self._socket: Optional[socket.socket] = None
+
+    def publish(self, events: List[dict]):
+        data = "".join(json.dumps(event, ensure_ascii=False) + "\n" for event in events).encode()
+        try:
+            if self._socket is None:
+                self._socket = socket.create_connection(self.address, timeout=self.timeout)
+            self._socket.sendall(data)
+        except OSError as e:
+            # The consumer may have received part of the batch; it is sent again in full
+            self.close()
+            raise SinkError(f"Failed to send events to {self.address[0]}:{self.address[1]}: {str(e)}")
+
+    def close(self):
+        if self._socket is not None:
+            self._socket.close()
+            self._socket = None
+
+class MemorySink(EventSink):
+    """
+    Keeps published events in memory, for development and testing
+    Attributes:
+        events: All published events
+    """
+    name = "memory"
+
+    def __init__(self):
+        self.events: List[dict] = []
+
+    def publish(self, events: List[dict]):
+        self.events.extend(events)
+
+SINKS: Dict[str, Type[EventSink]] = {
+    FileSink.name: FileSink,
+    SocketSink.name: SocketSink,
+    MemorySink.name: MemorySink,
+}
+
+def get_sink(name: str, **options) -> EventSink:
+    """
+    Creates an event sink by its registered name
+    Args:
+        name: Registered sink name
+        options: Sink constructor arguments
+    Returns:
+        EventSink: Sink instance
+    Raises:
+        ValueError: When no sink is registered under the name
+    """
+    try:
+        return SINKS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown event sink: {name}")
@@ -0,0 +1,69 @@
+import hashlib
+from typing import Callable, Hashable, Optional, Tuple
+from fastapi import Request, Response, status
+from .cache import cache
+from .config import settings
+from .metrics import CACHE_REQUESTS
+
+"""
+Conditional GET for catalog responses
+Encoded responses are cached per worker, keyed by path and the route's
+normalized parameters, together with the change counters of the tables they were built from.
+notify() bumps those counters in every worker, so an entry is served only
+while none of its tables changed since it was built. The ETag is a hash of
+the body rather than of the counters, which differ between workers, so a
+client revalidating against any worker gets a 304 for unchanged data.
+Undeclared query parameters are not part of the key, so arbitrary query
+strings cannot flood the cache with copies of one response
+"""
+
+RESPONSE = "response"
+
+def _etag(body: bytes) -> str:
+    return f'"{hashlib.sha1(body).hexdigest()[:24]}"'
+
+def _matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # Weak comparison, as required for If-None-Match
+    candidates = (candidate.strip() for candidate in if_none_match.split(","))
+    return etag in (candidate[2:] if candidate.startswith("W/") else candidate for candidate in candidates)
+
+def _cache_control(max_age: int) -> str:
+    return f"public, max-age={max_age}" if max_age > 0 else "no-cache"
+
+def conditional_response(request: Request, entities: Tuple[str, ...], load: Callable[[], Optional[bytes]],
+                         params: Tuple[Hashable, ...] = (),
+                         max_age: int = settings.http_cache_max_age) -> Optional[Response]:
+    """
+    Serves a cached JSON response, or 304 when the client already has it
+    Args:
+        request: Incoming request, provides the path and If-None-Match
+        entities: Entity types the response is built from
+        load: Returns the encoded body, or None when the resource does not exist
+        params: Normalized query parameters the body depends on, the rest of the key after the path
+        max_age: Seconds clients may reuse the response without revalidating
+    Returns:
+        Optional[Response]: 200 or 304 response, None when load found nothing
+    """
+    key = (request.url.path, params)
+    versions = cache.versions(entities)
+    entry = cache.get(RESPONSE, key)
+    if entry is not None and entry[0] != versions:
+        entry = None
+    CACHE_REQUESTS.labels(RESPONSE, "miss" if entry is None else "hit").inc()
+    if entry is None:
+        body = load()
+        if body is None:
+            return None
+        # Stored with the counters read before loading, so a change made meanwhile invalidates it
+        entry = (versions, _etag(body), body)
+        cache.set(RESPONSE, key, entry)
+
+    _, etag, body = entry
+    headers = {"ETag": etag, "Cache-Control": _cache_control(max_age)}
+    if _matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,237 @@
+import hashlib
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Pattern, Tuple
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from starlette.concurrency import run_in_threadpool
+from . import models
+from .database import SessionLocal
+
+"""
+Idempotency-Key support for mutating endpoints
+The first response for a key is stored in the idempotency_keys table and
+replayed on retries before routing, so retries never reach the route.
+The table is shared by all workers, so a retry is replayed whichever
+worker handles it. Keys are scoped by path and Authorization header
+"""
+
+IDEMPOTENCY_HEADER = b"idempotency-key"
+REPLAYED_HEADER = b"idempotent-replayed"
+# A reservation whose request never finished, e.g. after a crash, can be taken over after this
+RESERVATION_SECONDS = 300
+PURGE_INTERVAL = 600
+
+IDEMPOTENT_ROUTES = [
+    re.compile(r"^/sessions/start/?$"),
+    re.compile(r"^/sessions/\d+/stop/?$"),
+    re.compile(r"^/payments/?$"),
+]
+
+@dataclass
+class StoredResponse:
+    """
+    Response recorded for an idempotency key
+    Attributes:
+        fingerprint: Hash of the request body the key was first used with
+        status: HTTP status, None while the first request is still running
+        headers: Raw response headers
+        body: Response body
+    """
+    fingerprint: str
+    status: Optional[int] = None
+    headers: List[Tuple[bytes, bytes]] = field(default_factory=list)
+    body: bytes = b""
+
+class IdempotencyStore:
+    """
+    Database store of responses with a TTL, keyed by (path, auth hash, key)
+    Attributes:
+        ttl: Seconds a stored response is replayed
+        session_factory: Creates the sessions the store runs its statements in
+    """
+
+    def __init__(self, ttl: float = 86400, session_factory=SessionLocal):
+        self.ttl = ttl
+        self.session_factory = session_factory
+        self._purged_at = time.monotonic()
+
+    @staticmethod
+    def _where(table, key: tuple) -> tuple:
+        path, auth_hash, idempotency_key = key
+        return table.c.path == path, table.c.auth_hash == auth_hash, table.c.key == idempotency_key
+
+    def reserve(self, key: tuple, fingerprint: str) -> Optional[StoredResponse]:
+        """
+        Reserves a key for a new request unless it is already in use
+        The primary key makes the reservation atomic across workers; an
+        expired entry is taken over with a conditional UPDATE
+        Args:
+            key: (path, auth hash, Idempotency-Key)
+            fingerprint: Hash of the request body
+        Returns:
+            Optional[StoredResponse]: None when reserved for this request, else the current entry
+        """
+        table = models.IdempotencyKey.__table__
+        path, auth_hash, idempotency_key = key
+        db = self.session_factory()
+        try:
+            while True:
+                now = datetime.now(timezone.utc)
+                reservation = {"fingerprint": fingerprint, "status": None, "headers": None, "body": None,
+                               "expires_at": now + timedelta(seconds=RESERVATION_SECONDS)}
+                try:
+                    db.execute(insert(table).values(path=path, auth_hash=auth_hash, key=idempotency_key, **reservation))
+                    db.commit()
+                    return None
+                except IntegrityError:
+                    db.rollback()
+                taken_over = db.execute(
+                    update(table).where(*self._where(table, key), table.c.expires_at < now).values(**reservation)
+                ).rowcount
+                db.commit()
+                if taken_over:
+                    return None
+                row = db.execute(
+                    select(table.c.fingerprint, table.c.status, table.c.headers, table.c.body)
+                    .where(*self._where(table, key))
+                ).first()
+                if row is not None:
+                    headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in row.headers or []]
+                    return StoredResponse(fingerprint=row.fingerprint, status=row.status, headers=headers, body=row.body or b"")
+                # Released by its request in the meantime, try again
+        finally:
+            db.close()
+            self._purge()
+
+    def complete(self, key: tuple, status: int, headers: List[Tuple[bytes, bytes]], body: bytes):
+        table = models.IdempotencyKey.__table__
+        db = self.session_factory()
+        try:
+            db.execute(update(table).where(*self._where(table, key)).values(
+                status=status,
+                headers=[[name.decode("latin-1"), value.decode("latin-1")] for name, value in headers],
+                body=body,
+                expires_at=datetime.now(timezone.utc) + timedelta(seconds=self.ttl),
+            ))
+            db.commit()
+        finally:
+            db.close()
+
+    def release(self, key: tuple):
+        table = models.IdempotencyKey.__table__
+        db = self.session_factory()
+        try:
+            db.execute(delete(table).where(*self._where(table, key), table.c.status.is_(None)))
+            db.commit()
+        finally:
+            db.close()
+
+    def _purge(self):
+        # Expired entries are taken over on reuse; this only keeps the table small
+        if time.monotonic() - self._purged_at < PURGE_INTERVAL:
+            return
+        self._purged_at = time.monotonic()
+        table = models.IdempotencyKey.__table__
+        db = self.session_factory()
+        try:
+            db.execute(delete(table).where(table.c.expires_at < datetime.now(timezone.utc)))
+            db.commit()
+        finally:
+            db.close()
+
+class IdempotencyMiddleware:
+    """
+    ASGI middleware replaying stored responses for repeated Idempotency-Key requests
+    Attributes:
+        store: Response store
+        routes: Path patterns of POST routes that honour the header
+    """
+
+    def __init__(self, app, store: IdempotencyStore, routes: List[Pattern] = None):
+        self.app = app
+        self.store = store
+        self.routes = routes if routes is not None else IDEMPOTENT_ROUTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        idempotency_key = headers.get(IDEMPOTENCY_HEADER)
+        if not idempotency_key or not any(route.match(scope["path"]) for route in self.routes):
+            return await self.app(scope, receive, send)
+
+        body = await self._read_body(receive)
+        fingerprint = hashlib.sha256(body).hexdigest()
+        auth = hashlib.sha256(headers.get(b"authorization", b"")).hexdigest()
+        key = (scope["path"], auth, idempotency_key)
+
+        entry = await run_in_threadpool(self.store.reserve, key, fingerprint)
+        if entry is not None:
+            if entry.fingerprint != fingerprint:
+                return await self._error(send, 422, "Idempotency-Key was already used with a different request body")
+            if entry.status is None:
+                return await self._error(send, 409, "A request with this Idempotency-Key is still being processed")
+            return await self._replay(send, entry)
+
+        response = {"status": None, "headers": [], "body": []}
+
+        async def replay_receive():
+            nonlocal body
+            if body is not None:
+                message = {"type": "http.request", "body": body, "more_body": False}
+                body = None
+                return message
+            return await receive()
+
+        async def capture_send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = list(message.get("headers", []))
+            elif message["type"] == "http.response.body":
+                response["body"].append(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, replay_receive, capture_send)
+        except Exception:
+            await run_in_threadpool(self.store.release, key)
+            raise
+
+        if response["status"] is not None and response["status"] < 500:
+            await run_in_threadpool(self.store.complete, key, response["status"], response["headers"], b"".join(response["body"]))
+        else:
+            await run_in_threadpool(self.store.release, key)
+
+    @staticmethod
+    async def _read_body(receive) -> bytes:
+        chunks = []
+        more_body = True
+        while more_body:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            more_body = message.get("more_body", False)
+        return b"".join(chunks)
+
+    @staticmethod
+    async def _replay(send, entry: StoredResponse):
+        await send({
+            "type": "http.response.start",
+            "status": entry.status,
+            "headers": entry.headers + [(REPLAYED_HEADER, b"true")],
+        })
+        await send({"type": "http.response.body", "body": entry.body})
+
+    @staticmethod
+    async def _error(send, status_code: int, detail: str):
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": status_code,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode())],
+        })
+        await send({"type": "http.response.body", "body": body})
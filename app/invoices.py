@@ -0,0 +1,379 @@
+import argparse
+import csv
+import heapq
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Iterable, Iterator, List, Optional, Tuple
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+from . import models
+from .archive import iter_archived_sessions, unique_sessions
+from .config import settings
+from .database import SessionLocal, init_engine
+from .payment_queue import PAYMENT_COMPLETED
+
+"""
+Monthly invoice generation pipeline
+Streams the month's sessions (live and archived) and payments ordered by
+user, aggregates them in a single pass and writes one JSON and one CSV
+document per user. Each payment lists the amount charged and the
+discount applied, the difference to its session's cost. With --workers
+the user ranges are stored on the first run, so a resumed run finds the
+checkpoint of every worker
+Usage:
+    python -m app.invoices --month 2025-01 [--workers 4] [--out invoices]
+"""
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_EVERY = 100
+STREAM_BATCH_SIZE = 1000
+
+def month_bounds(month: str) -> Tuple[datetime, datetime]:
+    """
+    Returns the [start, end) UTC bounds of a YYYY-MM month
+    Args:
+        month: Month in YYYY-MM format
+    Returns:
+        Tuple[datetime, datetime]: First instant of the month and of the next month
+    """
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+    else:
+        end = start.replace(month=start.month + 1)
+    return start, end
+
+def _user_key(db: Session, column):
+    # Byte-wise ordering so the SQL ORDER BY matches Python string comparison in the merge
+    if db.get_bind().dialect.name == "postgresql":
+        return column.collate("C")
+    return column
+
+def _in_range(db: Session, column, lower: Optional[str], upper: Optional[str]):
+    key = _user_key(db, column)
+    conditions = []
+    if lower is not None:
+        conditions.append(key > lower)
+    if upper is not None:
+        conditions.append(key <= upper)
+    return conditions
+
+def _stream(db: Session, statement) -> Iterator:
+    """Yields the rows of a statement in batches of STREAM_BATCH_SIZE"""
+    return db.execute(statement.execution_options(yield_per=STREAM_BATCH_SIZE))
+
+def _group(result: Iterable) -> Iterator[Tuple[str, List]]:
+    """Yields (user_id, rows) groups from rows ordered by user_id"""
+    current_user, rows = None, []
+    for row in result:
+        if row.user_id != current_user and rows:
+            yield current_user, rows
+            rows = []
+        current_user = row.user_id
+        rows.append(row)
+    if rows:
+        yield current_user, rows
+
+def _merge(sessions: Iterator, payments: Iterator) -> Iterator[Tuple[str, List, List]]:
+    """Merges two user-ordered group streams into (user_id, sessions, payments)"""
+    session_group = next(sessions, None)
+    payment_group = next(payments, None)
+    while session_group or payment_group:
+        if payment_group is None or (session_group and session_group[0] < payment_group[0]):
+            yield session_group[0], session_group[1], []
+            session_group = next(sessions, None)
+        elif session_group is None or payment_group[0] < session_group[0]:
+            yield payment_group[0], [], payment_group[1]
+            payment_group = next(payments, None)
+        else:
+            yield session_group[0], session_group[1], payment_group[1]
+            session_group = next(sessions, None)
+            payment_group = next(payments, None)
+
+def _payment_item(row, session_costs: dict) -> dict:
+    """
+    Builds the invoice entry of a payment with its charged amount and discount
+    Args:
+        row: Payment row, session_cost is None when its session is not in the live table
+        session_costs: Costs of the invoiced sessions by ID, used for archived sessions
+    Returns:
+        dict: Payment entry; amount and discount are None when they cannot be determined
+    """
+    session_cost = row.session_cost if row.session_cost is not None else session_costs.get(row.session_id)
+    # Payments created before amounts were stored were charged the full session cost
+    amount = row.amount if row.amount is not None else session_cost
+    discount = None
+    if amount is not None and session_cost is not None:
+        discount = round(session_cost - amount, 2) if row.discount_id is not None else 0.0
+    return {
+        "id": row.id,
+        "session_id": row.session_id,
+        "status": row.status,
+        "transaction_id": row.transaction_id,
+        "payment_method": row.payment_method,
+        "created_at": row.created_at.isoformat(),
+        "amount": amount,
+        "discount_id": row.discount_id,
+        "discount": discount,
+    }
+
+def build_invoice(user_id: str, month: str, sessions: List, payments: List) -> dict:
+    """
+    Aggregates a user's monthly sessions and payments into an invoice document
+    Args:
+        user_id: Invoiced user
+        month: Month in YYYY-MM format
+        sessions: Session rows of the month
+        payments: Payment rows of the month
+    Returns:
+        dict: Invoice document
+    """
+    energy = sum(row.energy_used_kwh for row in sessions)
+    cost = sum(row.total_cost for row in sessions)
+    session_costs = {row.id: row.total_cost for row in sessions}
+    payment_items = [_payment_item(row, session_costs) for row in payments]
+    settled = [item for item in payment_items if item["status"] == PAYMENT_COMPLETED]
+    return {
+        "user_id": user_id,
+        "period": month,
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "sessions": [
+            {
+                "id": row.id,
+                "vehicle_id": row.vehicle_id,
+                "port_id": row.port_id,
+                "start_time": row.start_time.isoformat(),
+                "end_time": row.end_time.isoformat() if row.end_time else None,
+                "energy_used_kwh": row.energy_used_kwh,
+                "total_cost": row.total_cost,
+                "payment_status": row.payment_status,
+            }
+            for row in sessions
+        ],
+        "payments": payment_items,
+        "totals": {
+            "sessions": len(sessions),
+            "energy_used_kwh": round(energy, 3),
+            "total_cost": round(cost, 2),
+            "payments": len(payments),
+            "charged_amount": round(sum(item["amount"] or 0 for item in settled), 2),
+            "discount_amount": round(sum(item["discount"] or 0 for item in settled), 2),
+        },
+    }
+
+def _write_atomic(path: str, write):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+def write_invoice(directory: str, invoice: dict):
+    """
+    Writes an invoice as <user_id>.json and <user_id>.csv
+    Args:
+        directory: Output directory of the month
+        invoice: Invoice document from build_invoice
+    """
+    base = os.path.join(directory, invoice["user_id"])
+    _write_atomic(f"{base}.json", lambda f: json.dump(invoice, f, ensure_ascii=False, indent=2))
+
+    def write_csv(f):
+        writer = csv.writer(f)
+        writer.writerow(["type", "id", "date", "energy_used_kwh", "amount", "discount", "status"])
+        for item in invoice["sessions"]:
+            writer.writerow(["session", item["id"], item["start_time"], item["energy_used_kwh"], item["total_cost"], "", item["payment_status"]])
+        for item in invoice["payments"]:
+            writer.writerow(["payment", item["id"], item["created_at"], "", item["amount"], item["discount"], item["status"]])
+    _write_atomic(f"{base}.csv", write_csv)
+
+def _checkpoint_path(directory: str, part: int, parts: int) -> str:
+    return os.path.join(directory, f"checkpoint_{part + 1}_of_{parts}.json")
+
+def _ranges_path(directory: str, parts: int) -> str:
+    return os.path.join(directory, f"ranges_{parts}.json")
+
+def _read_checkpoint(path: str) -> Optional[str]:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)["last_user_id"]
+    except FileNotFoundError:
+        return None
+
+def _write_checkpoint(path: str, last_user_id: str, done: bool = False):
+    _write_atomic(path, lambda f: json.dump({"last_user_id": last_user_id, "done": done}, f))
+
+def generate_range(month: str, out_dir: str, lower: Optional[str] = None, upper: Optional[str] = None,
+                   part: int = 0, parts: int = 1) -> int:
+    """
+    Generates invoices for users with lower < user_id <= upper, resuming from its checkpoint
+    Args:
+        month: Month in YYYY-MM format
+        out_dir: Root output directory
+        lower: Exclusive lower user_id bound, None for unbounded
+        upper: Inclusive upper user_id bound, None for unbounded
+        part: Index of the range among the month's ranges, names its checkpoint
+        parts: Number of ranges the month is split into
+    Returns:
+        int: Number of invoices written
+    """
+    start, end = month_bounds(month)
+    directory = os.path.join(out_dir, month)
+    os.makedirs(directory, exist_ok=True)
+    checkpoint = _checkpoint_path(directory, part, parts)
+    resume_from = _read_checkpoint(checkpoint)
+    if resume_from is not None:
+        logger.info(f"Resuming invoices {month} ({lower}, {upper}] after user {resume_from}")
+        lower = resume_from
+
+    db = SessionLocal()
+    try:
+        session_model = models.ChargingSession
+        payment_model = models.Payment
+        live_sessions = _stream(db, select(
+            session_model.user_id, session_model.id, session_model.vehicle_id, session_model.port_id,
+            session_model.start_time, session_model.end_time, session_model.energy_used_kwh,
+            session_model.total_cost, session_model.payment_status
+        ).where(
+            session_model.start_time >= start,
+            session_model.start_time < end,
+            *_in_range(db, session_model.user_id, lower, upper)
+        ).order_by(_user_key(db, session_model.user_id), session_model.start_time))
+        # Archived months hold the month's older sessions; both sources are ordered by user
+        archived_sessions = iter_archived_sessions(start, end, lower=lower, upper=upper)
+        sessions = _group(unique_sessions(
+            heapq.merge(archived_sessions, live_sessions, key=lambda row: row.user_id),
+            key=lambda row: row.user_id
+        ))
+        payments = _group(_stream(db, select(
+            payment_model.user_id, payment_model.id, payment_model.session_id, payment_model.status,
+            payment_model.transaction_id, payment_model.payment_method, payment_model.created_at,
+            payment_model.amount, payment_model.discount_id, session_model.total_cost.label("session_cost")
+        ).select_from(payment_model).outerjoin(
+            session_model, session_model.id == payment_model.session_id
+        ).where(
+            payment_model.created_at >= start,
+            payment_model.created_at < end,
+            *_in_range(db, payment_model.user_id, lower, upper)
+        ).order_by(_user_key(db, payment_model.user_id), payment_model.created_at)))
+
+        written = 0
+        last_user = resume_from
+        for user_id, user_sessions, user_payments in _merge(sessions, payments):
+            write_invoice(directory, build_invoice(user_id, month, user_sessions, user_payments))
+            written += 1
+            last_user = user_id
+            if written % CHECKPOINT_EVERY == 0:
+                _write_checkpoint(checkpoint, last_user)
+        if last_user is not None:
+            _write_checkpoint(checkpoint, last_user, done=True)
+        return written
+    finally:
+        db.close()
+
+def split_user_ranges(month: str, parts: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Splits the month's invoiced users into contiguous user_id ranges
+    Args:
+        month: Month in YYYY-MM format
+        parts: Number of ranges
+    Returns:
+        List[Tuple[Optional[str], Optional[str]]]: (exclusive lower, inclusive upper) bounds
+    """
+    start, end = month_bounds(month)
+    db = SessionLocal()
+    try:
+        user_key = _user_key(db, models.ChargingSession.user_id)
+        # Approximate, equally sized buckets of sessions; payments follow their user
+        ranked = select(
+            models.ChargingSession.user_id.label("user_id"),
+            func.ntile(parts).over(order_by=user_key).label("bucket")
+        ).where(
+            models.ChargingSession.start_time >= start,
+            models.ChargingSession.start_time < end
+        ).subquery()
+        uppers = [
+            row.upper for row in db.execute(
+                select(ranked.c.bucket, func.max(_user_key(db, ranked.c.user_id)).label("upper"))
+                .group_by(ranked.c.bucket)
+                .order_by(ranked.c.bucket)
+            )
+        ]
+    finally:
+        db.close()
+
+    ranges = []
+    lower = None
+    for upper in sorted(set(uppers))[:-1]:
+        ranges.append((lower, upper))
+        lower = upper
+    ranges.append((lower, None))
+    return ranges
+
+def load_user_ranges(month: str, out_dir: str, parts: int) -> List[Tuple[Optional[str], Optional[str]]]:
+    """
+    Returns the month's user_id ranges, splitting them on the first run only
+    The ranges are stored next to the invoices, so a resumed run gives each
+    worker the same range its checkpoint was written for
+    Args:
+        month: Month in YYYY-MM format
+        out_dir: Root output directory
+        parts: Number of ranges
+    Returns:
+        List[Tuple[Optional[str], Optional[str]]]: (exclusive lower, inclusive upper) bounds
+    """
+    directory = os.path.join(out_dir, month)
+    path = _ranges_path(directory, parts)
+    try:
+        with open(path, encoding="utf-8") as f:
+            return [tuple(bounds) for bounds in json.load(f)]
+    except FileNotFoundError:
+        pass
+    ranges = split_user_ranges(month, parts)
+    os.makedirs(directory, exist_ok=True)
+    _write_atomic(path, lambda f: json.dump(ranges, f))
+    return ranges
+
+def _init_worker():
+    # Connections inherited from a forked parent process must not be reused
+    init_engine().dispose(close=False)
+
+def generate_month(month: str, out_dir: str = None, workers: int = 1) -> int:
+    """
+    Generates all invoices of a month, optionally with a process pool
+    Args:
+        month: Month in YYYY-MM format
+        out_dir: Root output directory, defaults to settings.invoice_dir
+        workers: Number of worker processes, each handling one user_id range
+    Returns:
+        int: Number of invoices written
+    """
+    out_dir = out_dir or settings.invoice_dir
+    if workers <= 1:
+        return generate_range(month, out_dir)
+
+    ranges = load_user_ranges(month, out_dir, workers)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [
+            pool.submit(generate_range, month, out_dir, lower, upper, part, workers)
+            for part, (lower, upper) in enumerate(ranges)
+        ]
+        return sum(future.result() for future in futures)
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate monthly invoices")
+    parser.add_argument("--month", required=True, help="Month in YYYY-MM format")
+    parser.add_argument("--out", default=settings.invoice_dir, help="Output directory")
+    parser.add_argument("--workers", type=int, default=1, help="Number of worker processes")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_engine()
+    written = generate_month(args.month, args.out, args.workers)
+    logger.info(f"Generated {written} invoices for {args.month}")
+
+if __name__ == "__main__":
+    main()
@@ -1,23 +1,88 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
 from . import models
-from .database import engine
-from .routers import stations, user, vehicles, auth, sessions, ports, payments, discount
+from .database import init_engine, dispose_engine
+from .migrations import check_schema_head
+from .partitions import install_partition_function, ensure_partitions, PartitionMaintenance
+from .payment_queue import payment_queue
+from .battery_buffer import battery_buffer
+from .cache import InvalidationListener
+from .idempotency import IdempotencyMiddleware, IdempotencyStore
+from .read_routing import ReadAfterWriteMiddleware, recent_writers
+from .query_stats import QueryStatsMiddleware
+from .metrics import MetricsMiddleware, process_exited
+from .profiling import ProfilingMiddleware, profiler
+from .config import settings
+from .routers import stations, user, vehicles, auth, sessions, ports, payments, discount, admin, metrics
 from fastapi.middleware.cors import CORSMiddleware
 
 """
 Main application module for the FastAPI backend
-Initializes the database and sets up API routes
+Sets up API routes; the database is initialized by the lifespan handler
 """
 
-# Create database tables
-models.Base.metadata.create_all(bind=engine)
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Creates the engine and verifies the schema on startup, starts background
+    workers, and drains them and disposes the engine on shutdown
+    """
+    engine = init_engine()
+    if settings.schema_check == "alembic":
+        check_schema_head(engine)
+    elif settings.schema_check == "create":
+        models.Base.metadata.create_all(bind=engine)
+        if engine.dialect.name == "postgresql":
+            install_partition_function(engine)
+            ensure_partitions(engine)
+
+    # Off by default so worker startup stays one query; see settings.partition_maintenance
+    partition_maintenance = None
+    if settings.partition_maintenance and engine.dialect.name == "postgresql":
+        partition_maintenance = PartitionMaintenance(engine, interval=settings.partition_maintenance_interval)
+        partition_maintenance.start()
+    invalidation_listener = InvalidationListener(engine)
+    invalidation_listener.start()
+    await payment_queue.start()
+    await battery_buffer.start()
+    yield
+    if partition_maintenance is not None:
+        await partition_maintenance.stop()
+    await battery_buffer.stop()
+    await payment_queue.stop()
+    invalidation_listener.stop()
+    dispose_engine()
+    process_exited()
 
 app = FastAPI(
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse,
     title="Charging Station API",
     description="API for managing electric vehicle charging stations",
     version="1.0.0"
 )
 
+# Replay stored responses for retried POST requests carrying an Idempotency-Key
+app.add_middleware(
+    IdempotencyMiddleware,
+    store=IdempotencyStore(ttl=settings.idempotency_ttl_seconds),
+)
+
+# Keep a caller's reads on the primary right after its own writes
+app.add_middleware(ReadAfterWriteMiddleware, writers=recent_writers)
+
+# Profile requests of administrators sending X-Profile: 1, and sampled requests
+app.add_middleware(ProfilingMiddleware, profiler=profiler, sample_rate=settings.profile_sample_rate)
+
+# Count SQL statements and database time per request
+if settings.query_stats:
+    app.add_middleware(QueryStatsMiddleware, n_plus_one_threshold=settings.n_plus_one_threshold)
+
+# Request counts and latency per route template
+if settings.metrics:
+    app.add_middleware(MetricsMiddleware)
+
 # Configure CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -35,4 +100,7 @@ app.include_router(stations.router)
 app.include_router(ports.router)
 app.include_router(sessions.router)
 app.include_router(payments.router)
-app.include_router(discount.router)
\ No newline at end of file
+app.include_router(discount.router)
+app.include_router(admin.router)
+if settings.metrics:
+    app.include_router(metrics.router)
\ No newline at end of file
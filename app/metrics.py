@@ -0,0 +1,139 @@
+import os
+import time
+from sqlalchemy import event
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, CollectorRegistry, Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+)
+
+"""
+Prometheus metrics of the API and its background jobs
+With several uvicorn workers set PROMETHEUS_MULTIPROC_DIR to an empty
+directory shared by all of them (and by the outbox relay); every process
+then writes its values to memory-mapped files there and /metrics
+aggregates them. Wipe the directory before starting the server. Without
+the variable the metrics of the scraped process alone are reported, so the
+relay lag, set in the separate outbox relay process, is only exported in
+multiprocess mode
+"""
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+UNMATCHED_ROUTE = "unmatched"
+
+REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"]
+)
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"]
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "HTTP requests being handled",
+    ["method"], multiprocess_mode="livesum"
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "db_pool_checked_out", "Database connections checked out of the pool",
+    multiprocess_mode="livesum"
+)
+DB_POOL_WAIT = Histogram(
+    "db_pool_wait_seconds", "Time spent waiting for a pooled database connection",
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 30.0)
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Worker cache lookups by entity and result (hit or miss)",
+    ["entity", "result"]
+)
+PAYMENT_QUEUE_DEPTH = Gauge(
+    "payment_queue_depth", "Payment intents waiting for a worker",
+    multiprocess_mode="livesum"
+)
+PAYMENT_QUEUE_LAG = Histogram(
+    "payment_queue_lag_seconds", "Time a payment intent waited in the queue before processing",
+    buckets=(0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0)
+)
+BATTERY_PENDING = Gauge(
+    "battery_buffer_pending", "Coalesced battery levels waiting for the next bulk write",
+    multiprocess_mode="livesum"
+)
+# Written by the outbox relay process, visible on /metrics only in multiprocess mode
+OUTBOX_LAG = Gauge(
+    "outbox_relay_lag_seconds", "Age of the newest event published by the outbox relay",
+    ["consumer"], multiprocess_mode="livemax"
+)
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    DB_POOL_CHECKED_OUT.inc()
+
+def _checkin(dbapi_connection, connection_record):
+    DB_POOL_CHECKED_OUT.dec()
+
+def _detach(dbapi_connection, connection_record):
+    # Detached connections leave the pool without a checkin
+    DB_POOL_CHECKED_OUT.dec()
+
+def instrument_pool(engine):
+    """
+    Tracks checked out connections of an engine's pool
+    Args:
+        engine: SQLAlchemy engine
+    """
+    if not event.contains(engine, "checkout", _checkout):
+        event.listen(engine, "checkout", _checkout)
+        event.listen(engine, "checkin", _checkin)
+        event.listen(engine, "detach", _detach)
+
+def render() -> tuple:
+    """
+    Renders all metrics in the Prometheus text format
+    Returns:
+        tuple: (body, content type)
+    """
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
+
+def process_exited():
+    """Drops the live gauges of this process from the shared directory"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(os.getpid())
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts and latency per route template
+    Paths that match no route share one label so unknown URLs cannot grow
+    the number of series
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        method = scope["method"]
+        status_code = 500
+        in_progress = REQUESTS_IN_PROGRESS.labels(method)
+
+        async def status_send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        in_progress.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, status_send)
+        finally:
+            elapsed = time.perf_counter() - start
+            in_progress.dec()
+            # The router stores the matched route in the shared scope
+            route = scope.get("route")
+            template = getattr(route, "path", UNMATCHED_ROUTE)
+            REQUESTS.labels(method, template, str(status_code)).inc()
+            REQUEST_LATENCY.labels(method, template).observe(elapsed)
@@ -0,0 +1,45 @@
+import os
+from alembic.config import Config
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import DBAPIError
+
+"""
+Startup schema verification against the Alembic migration chain
+"""
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+class SchemaMismatchError(RuntimeError):
+    """Raised when the database is not at the Alembic head revision"""
+    pass
+
+def expected_head() -> str:
+    """
+    Reads the head revision from the migration scripts on disk
+    Returns:
+        str: Head revision ID
+    """
+    config = Config(ALEMBIC_INI)
+    config.set_main_option("script_location", os.path.join(os.path.dirname(ALEMBIC_INI), "alembic"))
+    return ScriptDirectory.from_config(config).get_current_head()
+
+def check_schema_head(engine: Engine):
+    """
+    Verifies with a single query that the database is at the Alembic head
+    Args:
+        engine: Database engine
+    Raises:
+        SchemaMismatchError: When the database revision differs from the head
+    """
+    head = expected_head()
+    try:
+        with engine.connect() as connection:
+            current = connection.execute(text("SELECT version_num FROM alembic_version")).scalar()
+    except DBAPIError as e:
+        raise SchemaMismatchError(f"Cannot read alembic_version, run `alembic upgrade head`: {str(e.orig)}")
+    if current != head:
+        raise SchemaMismatchError(
+            f"Database is at revision {current}, application expects {head}; run `alembic upgrade head`"
+        )
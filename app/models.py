@@ -1,8 +1,8 @@
-from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Float, Date, ForeignKey, CheckConstraint, Text, Enum
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, Float, Date, ForeignKey, CheckConstraint, Text, Enum, Index, LargeBinary
 from sqlalchemy.dialects.postgresql import *
 from sqlalchemy.sql.sqltypes import TIMESTAMP
 from sqlalchemy.sql.expression import text
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, foreign
 from .database import Base
 import enum
 
@@ -45,6 +45,9 @@ class Vehicle(Base):
         current_battery_capacity_kw: Current charge level
     """
     __tablename__ = "vehicles"
+    __table_args__ = (
+        Index("ix_vehicles_user_id", "user_id"),
+    )
     
     id = Column(BigInteger, primary_key=True, nullable=False)
     user_id = Column(Text, ForeignKey("User.id"), nullable=False)
@@ -84,6 +87,9 @@ class ChargingPort(Base):
         last_service_date: Last maintenance date
     """
     __tablename__ = "charging_ports"
+    __table_args__ = (
+        Index("ix_charging_ports_station_id", "station_id"),
+    )
     
     id = Column(BigInteger, primary_key=True, nullable=False)
     station_id = Column(BigInteger, ForeignKey("charging_stations.id"), nullable=False)
@@ -95,6 +101,8 @@ class ChargingPort(Base):
 class ChargingSession(Base):
     """
     Charging session model tracking individual charging events
+    The table is range-partitioned by start_time month, so the database
+    primary key is (id, start_time); ids stay unique through the sequence
     Attributes:
         id: Unique session identifier
         user_id: User who started the session
@@ -108,12 +116,19 @@ class ChargingSession(Base):
         payment_status: Payment status
     """
     __tablename__ = "charging_sessions"
+    __table_args__ = (
+        Index("ix_charging_sessions_user_id_status", "user_id", "status"),
+        Index("ix_charging_sessions_port_id_in_progress", "port_id", postgresql_where=text("status = 'IN_PROGRESS'")),
+        Index("ix_charging_sessions_vehicle_id_in_progress", "vehicle_id", postgresql_where=text("status = 'IN_PROGRESS'")),
+        {"postgresql_partition_by": "RANGE (start_time)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
     
-    id = Column(BigInteger, primary_key=True, nullable=False)
+    id = Column(BigInteger, primary_key=True, autoincrement=True, nullable=False)
     user_id = Column(String, ForeignKey("User.id"), nullable=False)
     vehicle_id = Column(BigInteger, ForeignKey("vehicles.id"), nullable=False)
     port_id = Column(BigInteger, ForeignKey("charging_ports.id"), nullable=False)
-    start_time = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    start_time = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False, server_default=text('now()'))
     end_time = Column(TIMESTAMP(timezone=True), nullable=True)
     energy_used_kwh = Column(Float, nullable=False, default=0.0)
     total_cost = Column(Float, nullable=False, default=0.0)
@@ -135,6 +150,8 @@ class ChargingSession(Base):
 class Payment(Base):
     """
     Payment model for tracking charging session payments
+    The table is range-partitioned by created_at month; session_id has no
+    database foreign key because charging_sessions is partitioned as well
     Attributes:
         id: Unique payment identifier
         user_id: User making the payment
@@ -142,18 +159,34 @@ class Payment(Base):
         status: Payment status
         transaction_id: External payment reference
         payment_method: Method of payment
+        amount: Amount charged after discount, None for payments created before it was stored
+        discount_id: Discount consumed when the payment settles
+        claimed_until: End of the lease of the process charging the payment, None when unclaimed
     """
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_user_id_created_at", "user_id", "created_at"),
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
+    __mapper_args__ = {"primary_key": ["id"]}
     
-    id = Column(BigInteger, primary_key=True, nullable=False)
+    id = Column(BigInteger, primary_key=True, autoincrement=True, nullable=False)
     user_id = Column(Text, ForeignKey("User.id"), nullable=False)
-    session_id = Column(BigInteger, ForeignKey("charging_sessions.id"), nullable=False)
+    session_id = Column(BigInteger, nullable=False)
     status = Column(String(255), nullable=False)
     transaction_id = Column(BigInteger, nullable=False)
     payment_method = Column(String(255), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+    amount = Column(Float, nullable=True)
+    discount_id = Column(BigInteger, nullable=True)
+    claimed_until = Column(TIMESTAMP(timezone=True), nullable=True)
+    created_at = Column(TIMESTAMP(timezone=True), primary_key=True, nullable=False, server_default=text('now()'))
     
-    charging_session = relationship("ChargingSession", backref="payment", lazy="joined")
+    charging_session = relationship(
+        "ChargingSession",
+        primaryjoin="ChargingSession.id == foreign(Payment.session_id)",
+        backref="payment",
+        lazy="joined"
+    )
 
 class Discount(Base):
     """
@@ -166,10 +199,79 @@ class Discount(Base):
         expiration_date: Code validity end date
     """
     __tablename__ = "discounts"
+    __table_args__ = (
+        Index("ux_discounts_code", "code", unique=True),
+    )
     
     id = Column(BigInteger, primary_key=True, nullable=False)
     code = Column(String(255), nullable=False)
     description = Column(String(255), nullable=False)
     discount_percentage = Column(BigInteger, nullable=False)
     expiration_date = Column(TIMESTAMP(timezone=True), nullable=False)
-    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
\ No newline at end of file
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+class OutboxEvent(Base):
+    """
+    Domain event written in the same transaction as the change it describes
+    Attributes:
+        id: Unique event identifier
+        txid: ID of the writing transaction, the relay publishes in (txid, id) order
+        event_type: Event name, e.g. session.started
+        aggregate_id: ID of the session, port or payment the event is about
+        payload: Event data
+        created_at: Event creation time
+    """
+    __tablename__ = "outbox_events"
+    __table_args__ = (
+        Index("ix_outbox_events_txid_id", "txid", "id"),
+    )
+
+    id = Column(BigInteger, primary_key=True, nullable=False)
+    txid = Column(BigInteger, nullable=False, server_default=text('pg_current_xact_id()::text::bigint'))
+    event_type = Column(String(255), nullable=False)
+    aggregate_id = Column(BigInteger, nullable=False)
+    payload = Column(JSONB, nullable=False)
+    created_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+class OutboxOffset(Base):
+    """
+    Position of an outbox consumer in the event stream
+    Attributes:
+        consumer: Relay consumer name
+        last_txid: Transaction ID of the last published event
+        last_event_id: ID of the last published event
+        updated_at: Time of the last published batch
+    """
+    __tablename__ = "outbox_offsets"
+
+    consumer = Column(String(255), primary_key=True, nullable=False)
+    last_txid = Column(BigInteger, nullable=False, default=0)
+    last_event_id = Column(BigInteger, nullable=False, default=0)
+    updated_at = Column(TIMESTAMP(timezone=True), nullable=False, server_default=text('now()'))
+
+class IdempotencyKey(Base):
+    """
+    Response recorded for an Idempotency-Key, shared by all workers
+    Attributes:
+        path: Request path the key was used on
+        auth_hash: SHA-256 of the Authorization header the key is scoped to
+        key: Idempotency-Key header value
+        fingerprint: SHA-256 of the request body the key was first used with
+        status: HTTP status, None while the first request is still running
+        headers: Raw response headers as [name, value] pairs
+        body: Response body
+        expires_at: End of the replay period, or of the reservation while running
+    """
+    __tablename__ = "idempotency_keys"
+    __table_args__ = (
+        Index("ix_idempotency_keys_expires_at", "expires_at"),
+    )
+
+    path = Column(Text, primary_key=True, nullable=False)
+    auth_hash = Column(String(64), primary_key=True, nullable=False)
+    key = Column(Text, primary_key=True, nullable=False)
+    fingerprint = Column(String(64), nullable=False)
+    status = Column(Integer, nullable=True)
+    headers = Column(JSONB, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    expires_at = Column(TIMESTAMP(timezone=True), nullable=False)
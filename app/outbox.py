@@ -0,0 +1,182 @@
+import argparse
+import logging
+import time
+from datetime import datetime, timezone
+from typing import Optional
+from sqlalchemy import select, func, text, tuple_
+from sqlalchemy.orm import Session
+from . import models
+from .config import settings
+from .database import SessionLocal, init_engine
+from .event_sinks import EventSink, SinkError, get_sink
+from .metrics import OUTBOX_LAG, process_exited
+
+"""
+Transactional outbox of domain events
+Routes add an outbox_events row in the same transaction as the change
+itself, and a separate relay process publishes committed events in
+batches to an event sink, recording its offset after each batch
+Usage:
+    python -m app.outbox [--sink file|socket|memory] [--consumer default]
+"""
+
+logger = logging.getLogger(__name__)
+
+SESSION_STARTED = "session.started"
+SESSION_STOPPED = "session.stopped"
+PORT_STATUS_CHANGED = "port.status_changed"
+PAYMENT_CREATED = "payment.created"
+
+def _json_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+def record_event(db: Session, event_type: str, aggregate_id: int, payload: dict):
+    """
+    Adds an event to the outbox; it is committed or rolled back with the caller's transaction
+    Args:
+        db: Database session of the change the event describes
+        event_type: Event name
+        aggregate_id: ID of the session, port or payment the event is about
+        payload: Event data, datetimes are stored as ISO 8601 strings
+    """
+    db.add(models.OutboxEvent(
+        event_type=event_type,
+        aggregate_id=aggregate_id,
+        payload={key: _json_value(value) for key, value in payload.items()}
+    ))
+
+def _visible_horizon(db: Session) -> Optional[int]:
+    # Event ids are assigned before commit, so a transaction can commit an
+    # event with a lower id after a higher one was published. Transactions
+    # older than the snapshot xmin have all finished, so publishing only
+    # those in (txid, id) order never skips an event
+    if db.get_bind().dialect.name != "postgresql":
+        return None
+    return db.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint")).scalar()
+
+class OutboxRelay:
+    """
+    Publishes committed outbox events to a sink, at least once
+    Attributes:
+        sink: Destination of the events
+        consumer: Name under which the offset is stored
+        batch_size: Maximum number of events per batch
+        poll_interval: Seconds to wait when no events are pending
+    """
+
+    def __init__(
+        self,
+        sink: EventSink,
+        consumer: str = "default",
+        batch_size: int = 500,
+        poll_interval: float = 1.0,
+        session_factory=SessionLocal,
+    ):
+        self.sink = sink
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.session_factory = session_factory
+
+    def relay_batch(self) -> int:
+        """
+        Publishes the next batch of events and advances the offset
+        Returns:
+            int: Number of events published
+        Raises:
+            SinkError: When the sink rejects the batch; the offset is not advanced
+        """
+        db = self.session_factory()
+        try:
+            horizon = _visible_horizon(db)
+            # The row lock keeps two relays of the same consumer from publishing the same batch
+            offset = db.get(models.OutboxOffset, self.consumer, with_for_update=True)
+            if offset is None:
+                offset = models.OutboxOffset(consumer=self.consumer, last_txid=0, last_event_id=0)
+                db.add(offset)
+                db.flush()
+
+            event = models.OutboxEvent
+            query = select(event).where(
+                tuple_(event.txid, event.id) > tuple_(offset.last_txid, offset.last_event_id)
+            )
+            if horizon is not None:
+                query = query.where(event.txid < horizon)
+            events = db.execute(query.order_by(event.txid, event.id).limit(self.batch_size)).scalars().all()
+            if not events:
+                db.rollback()
+                OUTBOX_LAG.labels(self.consumer).set(0)
+                return 0
+
+            self.sink.publish([
+                {
+                    "id": row.id,
+                    "type": row.event_type,
+                    "aggregate_id": row.aggregate_id,
+                    "payload": row.payload,
+                    "created_at": row.created_at.isoformat(),
+                }
+                for row in events
+            ])
+            offset.last_txid = events[-1].txid
+            offset.last_event_id = events[-1].id
+            offset.updated_at = func.now()
+            db.commit()
+            OUTBOX_LAG.labels(self.consumer).set(
+                (datetime.now(timezone.utc) - events[-1].created_at).total_seconds()
+            )
+            return len(events)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def run(self, stop_after_idle: bool = False):
+        """
+        Relays events until interrupted
+        Args:
+            stop_after_idle: Return once no events are pending instead of polling
+        """
+        while True:
+            try:
+                published = self.relay_batch()
+            except SinkError as e:
+                logger.warning(f"Outbox relay {self.consumer}: {str(e)}, retrying")
+                published = 0
+            if published:
+                logger.info(f"Outbox relay {self.consumer} published {published} events")
+                continue
+            if stop_after_idle:
+                return
+            time.sleep(self.poll_interval)
+
+def _sink_options(name: str) -> dict:
+    if name == "file":
+        return {"path": settings.outbox_file}
+    if name == "socket":
+        return {"address": settings.outbox_socket_address}
+    return {}
+
+def main():
+    parser = argparse.ArgumentParser(description="Relay outbox events to an event sink")
+    parser.add_argument("--sink", default=settings.outbox_sink, help="file, socket or memory")
+    parser.add_argument("--consumer", default="default", help="Consumer name the offset is stored under")
+    parser.add_argument("--batch-size", type=int, default=settings.outbox_batch_size)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    init_engine()
+    sink = get_sink(args.sink, **_sink_options(args.sink))
+    relay = OutboxRelay(sink, args.consumer, args.batch_size, settings.outbox_poll_interval)
+    try:
+        relay.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        sink.close()
+        # Otherwise the lag gauge of the stopped relay is still reported as live
+        process_exited()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+import argparse
+import asyncio
+import logging
+import re
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from .database import init_engine
+
+"""
+Maintenance of the monthly partitions of charging_sessions and payments
+Upcoming partitions are created by a daily cron job, or by the one
+application process started with settings.partition_maintenance, every
+partition_maintenance_interval seconds. A DEFAULT partition catches rows
+of months that have no partition yet; they are moved to the month
+partition once it is created. Usage:
+    python -m app.partitions ensure [--months-ahead 3]
+    python -m app.partitions detach --before 2024-01 [--drop]
+"""
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("charging_sessions", "payments")
+MONTHS_AHEAD = 3
+# Serializes partition creation between workers
+PARTITION_LOCK_ID = 7342001
+DETACH_LOCK_TIMEOUT = "5s"
+
+PARTITION_NAME = re.compile(r"^(?P<parent>\w+)_y(?P<year>\d{4})m(?P<month>\d{2})$")
+
+# Same function as installed by migration f4b8d2c6e1a3, for databases built with create_all
+CREATE_PARTITION_FUNCTION = r"""
+CREATE OR REPLACE FUNCTION create_monthly_partitions(parent text, from_month timestamptz, months_ahead integer)
+RETURNS integer AS $$
+DECLARE
+    month_start timestamptz := date_trunc('month', from_month AT TIME ZONE 'UTC') AT TIME ZONE 'UTC';
+    last_month timestamptz := (date_trunc('month', now() AT TIME ZONE 'UTC') AT TIME ZONE 'UTC')
+                              + make_interval(months => months_ahead);
+    default_name text := parent || '_default';
+    partition_key text := substring(pg_get_partkeydef(parent::regclass) FROM '\((\w+)\)');
+    partition_name text;
+    has_rows boolean;
+    created integer := 0;
+BEGIN
+    WHILE month_start <= last_month LOOP
+        partition_name := format('%s_y%sm%s', parent,
+                                 to_char(month_start AT TIME ZONE 'UTC', 'YYYY'),
+                                 to_char(month_start AT TIME ZONE 'UTC', 'MM'));
+        IF to_regclass(partition_name) IS NULL THEN
+            has_rows := false;
+            IF to_regclass(default_name) IS NOT NULL THEN
+                EXECUTE format('SELECT EXISTS (SELECT 1 FROM %I WHERE %I >= %L AND %I < %L)',
+                               default_name, partition_key, month_start, partition_key, month_start + interval '1 month')
+                INTO has_rows;
+            END IF;
+            IF has_rows THEN
+                -- Rows that landed in the DEFAULT partition move to the new month partition
+                EXECUTE format('CREATE TABLE %I (LIKE %I INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name, parent);
+                EXECUTE format('WITH moved AS (DELETE FROM %I WHERE %I >= %L AND %I < %L RETURNING *) INSERT INTO %I SELECT * FROM moved',
+                               default_name, partition_key, month_start, partition_key, month_start + interval '1 month', partition_name);
+                EXECUTE format('ALTER TABLE %I ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                               parent, partition_name, month_start, month_start + interval '1 month');
+            ELSE
+                EXECUTE format('CREATE TABLE %I PARTITION OF %I FOR VALUES FROM (%L) TO (%L)',
+                               partition_name, parent, month_start, month_start + interval '1 month');
+            END IF;
+            created := created + 1;
+        END IF;
+        month_start := month_start + interval '1 month';
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+def install_partition_function(engine: Engine):
+    """
+    Installs create_monthly_partitions() on a database created without migrations
+    Args:
+        engine: Database engine
+    """
+    with engine.begin() as connection:
+        connection.execute(text(CREATE_PARTITION_FUNCTION))
+
+def ensure_partitions(engine: Engine, months_ahead: int = MONTHS_AHEAD) -> int:
+    """
+    Creates the DEFAULT partitions and missing partitions from the current month up to months_ahead months ahead
+    Args:
+        engine: Database engine
+        months_ahead: Number of future months that must have a partition
+    Returns:
+        int: Number of month partitions created
+    """
+    created = 0
+    with engine.begin() as connection:
+        connection.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": PARTITION_LOCK_ID})
+        for table in PARTITIONED_TABLES:
+            connection.execute(text(f'CREATE TABLE IF NOT EXISTS "{table}_default" PARTITION OF "{table}" DEFAULT'))
+            created += connection.execute(
+                text("SELECT create_monthly_partitions(:parent, now(), :months_ahead)"),
+                {"parent": table, "months_ahead": months_ahead}
+            ).scalar()
+    return created
+
+class PartitionMaintenance:
+    """
+    Background task creating upcoming partitions periodically
+    Attributes:
+        engine: Database engine
+        interval: Seconds between runs
+        months_ahead: Number of future months that must have a partition
+    """
+
+    def __init__(self, engine: Engine, interval: float = 3600, months_ahead: int = MONTHS_AHEAD):
+        self.engine = engine
+        self.interval = interval
+        self.months_ahead = months_ahead
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Starts the periodic task, which creates missing partitions right away"""
+        self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def run(self):
+        try:
+            created = await asyncio.to_thread(ensure_partitions, self.engine, self.months_ahead)
+            if created:
+                logger.info(f"Created {created} partitions")
+        except Exception:
+            # Inserts still land in the DEFAULT partition until the next run
+            logger.exception("Failed to create partitions, will retry")
+
+    async def _loop(self):
+        while True:
+            await self.run()
+            await asyncio.sleep(self.interval)
+
+def list_partitions(engine: Engine, table: str) -> List[Tuple[str, datetime]]:
+    """
+    Lists the monthly partitions attached to a table
+    Args:
+        engine: Database engine
+        table: Partitioned parent table
+    Returns:
+        List[Tuple[str, datetime]]: (partition name, first day of its month), oldest first
+    """
+    with engine.connect() as connection:
+        names = connection.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE parent.relname = :table"
+        ), {"table": table}).scalars().all()
+
+    partitions = []
+    for name in names:
+        match = PARTITION_NAME.match(name)
+        if match and match.group("parent") == table:
+            month = datetime(int(match.group("year")), int(match.group("month")), 1, tzinfo=timezone.utc)
+            partitions.append((name, month))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def detach_partitions(engine: Engine, before: datetime, drop: bool = False) -> List[str]:
+    """
+    Detaches partitions of months before a cutoff; detaching only updates the catalog
+    Args:
+        engine: Database engine
+        before: First month to keep
+        drop: Drop the detached tables instead of keeping them as standalone tables
+    Returns:
+        List[str]: Detached partition names
+    """
+    detached = []
+    for table in PARTITIONED_TABLES:
+        for name, month in list_partitions(engine, table):
+            if month >= before:
+                continue
+            # DETACH ... CONCURRENTLY is rejected while the parent has a DEFAULT partition, so
+            # each partition is detached in its own short transaction; the lock timeout keeps
+            # the exclusive lock request from queueing traffic behind a long-running query
+            with engine.begin() as connection:
+                connection.execute(text(f"SET LOCAL lock_timeout = '{DETACH_LOCK_TIMEOUT}'"))
+                connection.execute(text(f'ALTER TABLE "{table}" DETACH PARTITION "{name}"'))
+                if drop:
+                    connection.execute(text(f'DROP TABLE "{name}"'))
+            detached.append(name)
+    return detached
+
+def main():
+    parser = argparse.ArgumentParser(description="Maintain monthly table partitions")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ensure = commands.add_parser("ensure", help="Create partitions for upcoming months")
+    ensure.add_argument("--months-ahead", type=int, default=MONTHS_AHEAD)
+    detach = commands.add_parser("detach", help="Detach partitions older than a month")
+    detach.add_argument("--before", required=True, help="First month to keep, YYYY-MM")
+    detach.add_argument("--drop", action="store_true", help="Drop detached partitions")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    engine = init_engine()
+    if args.command == "ensure":
+        logger.info(f"Created {ensure_partitions(engine, args.months_ahead)} partitions")
+    else:
+        before = datetime.strptime(args.before, "%Y-%m").replace(tzinfo=timezone.utc)
+        for name in detach_partitions(engine, before, args.drop):
+            logger.info(f"Detached {name}")
+
+if __name__ == "__main__":
+    main()
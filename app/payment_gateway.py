@@ -0,0 +1,112 @@
+import asyncio
+import random
+import itertools
+from dataclasses import dataclass
+from typing import Dict, Optional, Type
+
+"""
+Payment gateway interface used by the payment processing queue
+A gateway settles a single payment intent; the queue takes care of
+retries, backoff and persisting the outcome
+"""
+
+class GatewayError(Exception):
+    """Transient gateway failure (timeout, 5xx, network) - the intent may be retried"""
+    pass
+
+@dataclass
+class PaymentIntent:
+    """
+    Payment waiting for settlement
+    Attributes:
+        payment_id: ID of the PENDING payments row
+        session_id: Charging session being paid for
+        user_id: Paying user
+        amount: Amount to charge
+        payment_method: Method of payment
+        discount_id: Discount consumed when the charge is approved
+        attempt: Number of failed attempts so far
+    """
+    payment_id: int
+    session_id: int
+    user_id: str
+    amount: float
+    payment_method: str
+    discount_id: Optional[int] = None
+    attempt: int = 0
+
+@dataclass
+class GatewayResult:
+    """
+    Final answer from the gateway for a single intent
+    Attributes:
+        approved: Whether the charge went through
+        transaction_id: Gateway transaction reference
+        reason: Decline reason, if any
+    """
+    approved: bool
+    transaction_id: int
+    reason: str = ""
+
+class PaymentGateway:
+    """Base class for payment gateways"""
+    name = "base"
+
+    async def charge(self, intent: PaymentIntent) -> GatewayResult:
+        """
+        Settles a payment intent
+        Args:
+            intent: Payment to settle
+        Returns:
+            GatewayResult: Approval or decline
+        Raises:
+            GatewayError: On transient failure
+        """
+        raise NotImplementedError
+
+class LocalGateway(PaymentGateway):
+    """
+    In-process fake gateway for development and testing
+    Attributes:
+        latency: Simulated network latency in seconds
+        failure_rate: Probability of a transient GatewayError
+        decline_rate: Probability of a declined charge
+    """
+    name = "local"
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, decline_rate: float = 0.0, seed: int = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.decline_rate = decline_rate
+        self._random = random.Random(seed)
+        self._transaction_ids = itertools.count(1_000_000)
+
+    async def charge(self, intent: PaymentIntent) -> GatewayResult:
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self._random.random() < self.failure_rate:
+            raise GatewayError("Simulated gateway timeout")
+        transaction_id = next(self._transaction_ids)
+        if intent.amount < 0 or self._random.random() < self.decline_rate:
+            return GatewayResult(approved=False, transaction_id=transaction_id, reason="declined")
+        return GatewayResult(approved=True, transaction_id=transaction_id)
+
+GATEWAYS: Dict[str, Type[PaymentGateway]] = {
+    LocalGateway.name: LocalGateway,
+}
+
+def get_gateway(name: str, **options) -> PaymentGateway:
+    """
+    Creates a gateway by its registered name
+    Args:
+        name: Registered gateway name
+        options: Gateway constructor arguments
+    Returns:
+        PaymentGateway: Gateway instance
+    Raises:
+        ValueError: When no gateway is registered under the name
+    """
+    try:
+        return GATEWAYS[name](**options)
+    except KeyError:
+        raise ValueError(f"Unknown payment gateway: {name}")
@@ -0,0 +1,283 @@
+import asyncio
+import logging
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Tuple
+from sqlalchemy import delete, func, or_, update, bindparam
+from . import models
+from .cache import notify, DISCOUNT
+from .config import settings
+from .database import SessionLocal
+from .payment_gateway import PaymentGateway, PaymentIntent, GatewayResult, GatewayError, get_gateway
+from .metrics import PAYMENT_QUEUE_DEPTH, PAYMENT_QUEUE_LAG
+
+"""
+Asynchronous payment processing queue
+Routes only insert a PENDING payment and submit an intent; a pool of
+async workers settles intents against the gateway and outcomes are
+written back to payments and charging_sessions in bulk. The charged
+amount is stored on the payment, and its discount is consumed only
+together with an approved outcome. Every worker process re-submits the
+PENDING payments on startup, so a payment is claimed with a lease in
+payments.claimed_until right before it is charged, and a process that
+loses the claim drops its intent
+"""
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_PENDING = "PENDING"
+PAYMENT_COMPLETED = "COMPLETED"
+PAYMENT_FAILED = "FAILED"
+
+SESSION_PROCESSING = "PROCESSING"
+SESSION_PAID = "PAID"
+SESSION_FAILED = "FAILED"
+
+def _update_by_id(model, *columns: str):
+    table = model.__table__
+    return (
+        update(table)
+        .where(table.c.id == bindparam("id_"))
+        .values({column: bindparam(column) for column in columns})
+    )
+
+class PaymentQueue:
+    """
+    Job queue settling payment intents with a pool of async workers
+    Attributes:
+        gateway: Gateway used to settle intents
+        workers: Number of concurrent worker tasks
+        max_retries: Attempts before an intent is marked FAILED
+        backoff_base: Base delay in seconds for exponential backoff
+        flush_interval: Seconds between bulk writes of outcomes
+        flush_size: Number of outcomes that triggers an early flush
+        claim_lease: Seconds a claimed payment is left to this process
+    """
+
+    def __init__(
+        self,
+        gateway: PaymentGateway,
+        workers: int = 4,
+        max_retries: int = 5,
+        backoff_base: float = 0.5,
+        flush_interval: float = 0.5,
+        flush_size: int = 500,
+        claim_lease: float = 600,
+        session_factory=SessionLocal,
+    ):
+        self.gateway = gateway
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self.claim_lease = claim_lease
+        self.session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._results: List[Tuple[PaymentIntent, Optional[GatewayResult]]] = []
+        self._flush_needed: Optional[asyncio.Event] = None
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def start(self, recover: bool = True):
+        """
+        Starts worker and flusher tasks on the running event loop
+        Args:
+            recover: Re-submit payments left PENDING by a previous process
+        """
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._flush_needed = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._flusher()))
+        if recover:
+            for intent in await asyncio.to_thread(self._load_pending):
+                self._enqueue(intent)
+
+    async def stop(self, timeout: float = 10.0):
+        """
+        Drains queued intents, flushes outcomes and stops all tasks
+        Args:
+            timeout: Seconds to wait for the queue to drain
+        """
+        if not self.running:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Payment queue stopped with {self._queue.qsize()} intents left PENDING")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self._flush()
+        self._tasks = []
+        self._loop = None
+
+    def submit(self, intent: PaymentIntent):
+        """
+        Enqueues an intent; safe to call from sync routes running in the threadpool
+        Args:
+            intent: Payment to settle
+        Raises:
+            RuntimeError: When the queue is not running
+        """
+        if not self.running:
+            raise RuntimeError("Payment queue is not running")
+        self._loop.call_soon_threadsafe(self._enqueue, intent)
+
+    def _enqueue(self, intent: PaymentIntent):
+        self._queue.put_nowait((time.monotonic(), intent))
+        PAYMENT_QUEUE_DEPTH.inc()
+
+    async def _worker(self):
+        while True:
+            enqueued_at, intent = await self._queue.get()
+            PAYMENT_QUEUE_DEPTH.dec()
+            PAYMENT_QUEUE_LAG.observe(time.monotonic() - enqueued_at)
+            try:
+                await self._process(intent)
+            except Exception:
+                logger.exception(f"Unexpected error processing payment {intent.payment_id}")
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, intent: PaymentIntent):
+        if not await asyncio.to_thread(self._claim, intent.payment_id):
+            logger.info(f"Payment {intent.payment_id} is settled or claimed by another process, skipped")
+            return
+        while True:
+            try:
+                result = await self.gateway.charge(intent)
+                break
+            except GatewayError as e:
+                intent.attempt += 1
+                if intent.attempt >= self.max_retries:
+                    logger.error(f"Payment {intent.payment_id} failed after {intent.attempt} attempts: {str(e)}")
+                    result = None
+                    break
+                delay = self.backoff_base * (2 ** (intent.attempt - 1))
+                await asyncio.sleep(delay + random.uniform(0, delay / 2))
+        self._results.append((intent, result))
+        if len(self._results) >= self.flush_size:
+            self._flush_needed.set()
+
+    async def _flusher(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_needed.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_needed.clear()
+            await self._flush()
+
+    async def _flush(self):
+        if not self._results:
+            return
+        batch, self._results = self._results, []
+        try:
+            await asyncio.to_thread(self._write_results, batch)
+        except Exception:
+            logger.exception(f"Failed to write {len(batch)} payment results, will retry")
+            self._results[:0] = batch
+
+    def _write_results(self, batch: List[Tuple[PaymentIntent, Optional[GatewayResult]]]):
+        payment_rows = []
+        session_rows = []
+        used_discounts = set()
+        for intent, result in batch:
+            if result is not None and result.approved:
+                payment_rows.append({"id_": intent.payment_id, "status": PAYMENT_COMPLETED, "transaction_id": result.transaction_id})
+                session_rows.append({"id_": intent.session_id, "payment_status": SESSION_PAID})
+                if intent.discount_id is not None:
+                    used_discounts.add(intent.discount_id)
+            else:
+                payment_rows.append({"id_": intent.payment_id, "status": PAYMENT_FAILED})
+                session_rows.append({"id_": intent.session_id, "payment_status": SESSION_FAILED})
+
+        db = self.session_factory()
+        try:
+            # Executemany keyed by id only: the partitioned tables' primary keys also
+            # include the partition column, which ORM bulk UPDATE by primary key would require
+            completed = [row for row in payment_rows if "transaction_id" in row]
+            failed = [row for row in payment_rows if "transaction_id" not in row]
+            if completed:
+                db.execute(_update_by_id(models.Payment, "status", "transaction_id"), completed)
+            if failed:
+                db.execute(_update_by_id(models.Payment, "status"), failed)
+            db.execute(_update_by_id(models.ChargingSession, "payment_status"), session_rows)
+            if used_discounts:
+                db.execute(delete(models.Discount).where(models.Discount.id.in_(used_discounts)))
+                notify(db, DISCOUNT)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _claim(self, payment_id: int) -> bool:
+        """
+        Takes the lease of a PENDING payment unless another process holds it
+        Args:
+            payment_id: Payment to claim
+        Returns:
+            bool: True when this process may charge the payment
+        """
+        table = models.Payment.__table__
+        now = datetime.now(timezone.utc)
+        db = self.session_factory()
+        try:
+            # A concurrent claim re-evaluates the WHERE clause after the row lock and finds the lease taken
+            claimed = db.execute(
+                update(table)
+                .where(
+                    table.c.id == payment_id,
+                    table.c.status == PAYMENT_PENDING,
+                    or_(table.c.claimed_until.is_(None), table.c.claimed_until < now)
+                )
+                .values(claimed_until=now + timedelta(seconds=self.claim_lease))
+                .returning(table.c.id)
+            ).first()
+            db.commit()
+            return claimed is not None
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _load_pending(self) -> List[PaymentIntent]:
+        db = self.session_factory()
+        try:
+            rows = (
+                db.query(models.Payment.id, models.Payment.session_id, models.Payment.user_id,
+                         models.Payment.payment_method, models.Payment.discount_id,
+                         func.coalesce(models.Payment.amount, models.ChargingSession.total_cost).label("amount"))
+                .join(models.ChargingSession, models.ChargingSession.id == models.Payment.session_id)
+                .filter(
+                    models.Payment.status == PAYMENT_PENDING,
+                    # Payments being charged by a live process are left to it
+                    or_(models.Payment.claimed_until.is_(None), models.Payment.claimed_until < datetime.now(timezone.utc))
+                )
+                .all()
+            )
+            return [
+                PaymentIntent(payment_id=row.id, session_id=row.session_id, user_id=row.user_id,
+                              amount=row.amount, payment_method=row.payment_method, discount_id=row.discount_id)
+                for row in rows
+            ]
+        finally:
+            db.close()
+
+payment_queue = PaymentQueue(
+    gateway=get_gateway(settings.payment_gateway),
+    workers=settings.payment_workers,
+    max_retries=settings.payment_max_retries,
+    backoff_base=settings.payment_backoff_base,
+    claim_lease=settings.payment_claim_lease_seconds,
+)
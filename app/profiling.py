@@ -0,0 +1,223 @@
+import itertools
+import logging
+import os
+import re
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import List, Optional
+import yappi
+from jose import JWTError, jwt
+from starlette.concurrency import run_in_threadpool
+from starlette.routing import Match
+from . import models
+from .config import settings
+from .database import SessionLocal
+
+"""
+On-demand request profiling
+An administrator sends X-Profile: 1 with a request, or profile_sample_rate
+selects one in N requests per route. While at least one profiled request
+is running yappi traces all threads, which slows every concurrent request,
+so a sample is skipped while any other request is being profiled. A tag
+callback attributes every call to the profiled request through a ContextVar,
+which is also set in the threadpool workers running sync routes and
+dependencies. Profiles are
+saved in pstat format to a rotating directory; open them with pstats,
+snakeviz or another flame graph viewer. Without the header and with
+sampling off a request only pays for one header lookup; with sampling on
+it also pays for matching its route template
+"""
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_ID_HEADER = b"x-profile-id"
+PROFILE_SUFFIX = ".pstat"
+PROFILE_NAME = re.compile(r"^[\w.-]+\.pstat$")
+
+current_tag: ContextVar[int] = ContextVar("profile_tag", default=0)
+
+def _tag() -> int:
+    return current_tag.get()
+
+class Profiler:
+    """
+    Shares one running yappi session between concurrently profiled requests
+    Attributes:
+        directory: Directory the profiles are written to
+        keep: Number of newest profiles kept, older ones are deleted
+    """
+
+    def __init__(self, directory: str = "profiles", keep: int = 50):
+        self.directory = directory
+        self.keep = keep
+        self._lock = threading.Lock()
+        self._active = 0
+        self._tags = itertools.count(1)
+
+    @property
+    def active(self) -> bool:
+        return self._active > 0
+
+    def begin(self, exclusive: bool = False) -> Optional[int]:
+        """
+        Starts tracing when no other request is being profiled
+        Args:
+            exclusive: Only begin when no other request is being profiled
+        Returns:
+            Optional[int]: Tag to set in current_tag for the profiled request,
+            None when exclusive and another request is being profiled
+        """
+        with self._lock:
+            if exclusive and self._active:
+                return None
+            if self._active == 0:
+                yappi.set_clock_type("wall")
+                yappi.set_tag_callback(_tag)
+                yappi.start(builtins=False, profile_threads=True)
+            self._active += 1
+            return next(self._tags)
+
+    def end(self, tag: int, name: str):
+        """
+        Saves the calls recorded for a tag and stops tracing after the last profiled request
+        Args:
+            tag: Tag returned by begin()
+            name: File name of the profile
+        """
+        with self._lock:
+            try:
+                stats = yappi.get_func_stats(filter={"tag": tag})
+                if not stats.empty():
+                    os.makedirs(self.directory, exist_ok=True)
+                    stats.save(os.path.join(self.directory, name), type="pstat")
+            finally:
+                self._active -= 1
+                if self._active == 0:
+                    yappi.stop()
+                    yappi.clear_stats()
+        self._rotate()
+
+    def _rotate(self):
+        profiles = self.list()
+        for profile in profiles[self.keep:]:
+            try:
+                os.remove(os.path.join(self.directory, profile["name"]))
+            except OSError:
+                pass
+
+    def list(self) -> List[dict]:
+        """
+        Lists stored profiles, newest first
+        Returns:
+            List[dict]: Name, size and modification time of each profile
+        """
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith(PROFILE_SUFFIX)]
+        except FileNotFoundError:
+            return []
+        profiles = []
+        for name in names:
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({"name": name, "size": stat.st_size, "modified": stat.st_mtime})
+        return sorted(profiles, key=lambda profile: profile["modified"], reverse=True)
+
+    def path(self, name: str) -> Optional[str]:
+        """
+        Resolves a stored profile by name
+        Args:
+            name: Profile file name
+        Returns:
+            Optional[str]: Path of the profile, None for unknown or invalid names
+        """
+        if not PROFILE_NAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+def _is_admin(authorization: Optional[bytes]) -> bool:
+    if not authorization or not authorization.lower().startswith(b"bearer "):
+        return False
+    try:
+        payload = jwt.decode(authorization[7:].decode(), settings.secret_key, algorithms=[settings.algorithm])
+    except (JWTError, UnicodeDecodeError):
+        return False
+    db = SessionLocal()
+    try:
+        role = db.query(models.User.role).filter(models.User.id == payload.get("sub")).scalar()
+    finally:
+        db.close()
+    return role == models.UserRoleEnum.ADMIN
+
+def _slug(path: str) -> str:
+    return re.sub(r"[^\w-]+", "_", path).strip("_") or "root"
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests on demand or by sampling
+    Attributes:
+        profiler: Shared profiler session and store
+        sample_rate: Profile one in this many requests per route, 0 disables sampling
+    """
+
+    def __init__(self, app, profiler: Profiler, sample_rate: int = 0):
+        self.app = app
+        self.profiler = profiler
+        self.sample_rate = sample_rate
+        self._seen = Counter()
+
+    def _sampled(self, scope) -> Optional[str]:
+        router = scope["app"].router
+        for route in router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                template = getattr(route, "path", scope["path"])
+                self._seen[(scope["method"], template)] += 1
+                if self._seen[(scope["method"], template)] % self.sample_rate == 0:
+                    return template
+                return None
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        on_demand = headers.get(PROFILE_HEADER) in (b"1", b"true")
+        template = None
+        if on_demand:
+            on_demand = await run_in_threadpool(_is_admin, headers.get(b"authorization"))
+        if not on_demand and self.sample_rate and not self.profiler.active:
+            template = self._sampled(scope)
+        if not on_demand and template is None:
+            return await self.app(scope, receive, send)
+
+        tag = self.profiler.begin(exclusive=not on_demand)
+        if tag is None:
+            # Another request started being profiled since the check above
+            return await self.app(scope, receive, send)
+        kind = "request" if on_demand else "sample"
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{kind}-{scope['method']}-{_slug(template or scope['path'])}-{os.getpid()}"
+        name = f"{name}-{tag}{PROFILE_SUFFIX}"
+
+        async def profile_send(message):
+            if on_demand and message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (PROFILE_ID_HEADER, name.encode())]}
+            await send(message)
+
+        token = current_tag.set(tag)
+        try:
+            await self.app(scope, receive, profile_send)
+        finally:
+            current_tag.reset(token)
+            try:
+                await run_in_threadpool(self.profiler.end, tag, name)
+            except Exception:
+                logger.exception(f"Failed to save profile {name}")
+
+profiler = Profiler(directory=settings.profile_dir, keep=settings.profile_keep)
@@ -0,0 +1,116 @@
+import logging
+import time
+from collections import Counter
+from contextvars import ContextVar
+from typing import Optional
+from sqlalchemy import event
+
+"""
+Per-request SQL instrumentation
+Cursor execution events of the application engines count statements and
+database time into the stats of the current request. The middleware
+reports them in a Server-Timing header and warns when one statement
+shape repeats often enough to suggest an N+1 query pattern. Statements
+run outside a request (background workers, CLI jobs) are not recorded
+"""
+
+logger = logging.getLogger(__name__)
+
+class QueryStats:
+    """
+    SQL statements executed while handling one request
+    Attributes:
+        count: Number of executed statements
+        duration: Total database time in seconds
+        shapes: Executions per SQL text; bound parameters are not part of it
+        scope: ASGI scope of the request
+    """
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.scope = scope or {}
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.duration += seconds
+        self.shapes[statement] += 1
+
+    @property
+    def route(self) -> Optional[str]:
+        """Route template of the request, or its path before routing"""
+        route = self.scope.get("route")
+        return getattr(route, "path", None) or self.scope.get("path")
+
+    def repeated(self, threshold: int) -> list:
+        """
+        Returns statement shapes executed more than threshold times
+        Args:
+            threshold: Allowed executions of one shape
+        Returns:
+            list: (statement, executions) pairs, most repeated first
+        """
+        return [(statement, n) for statement, n in self.shapes.most_common() if n > threshold]
+
+# Copied into threadpool workers running sync routes, so they record into the same object
+current_stats: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and current_stats.get() is not None:
+        context._query_stats_start = time.perf_counter()
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_stats.get()
+    start = getattr(context, "_query_stats_start", None)
+    if stats is not None and start is not None:
+        stats.record(statement, time.perf_counter() - start)
+
+def instrument_engine(engine):
+    """
+    Registers the cursor execution hooks on an engine
+    Args:
+        engine: SQLAlchemy engine
+    """
+    if not event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+class QueryStatsMiddleware:
+    """
+    ASGI middleware collecting the SQL statements of each HTTP request
+    The Server-Timing header carries the statement count and database time
+    up to the moment the response starts; statements of a streamed body are
+    only part of the N+1 check
+    """
+
+    def __init__(self, app, n_plus_one_threshold: int = 10):
+        self.app = app
+        self.n_plus_one_threshold = n_plus_one_threshold
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        stats = QueryStats(scope)
+        token = current_stats.set(stats)
+
+        async def timing_send(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((
+                    b"server-timing",
+                    f'db;dur={stats.duration * 1000:.2f};desc="{stats.count} queries"'.encode()
+                ))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, timing_send)
+        finally:
+            current_stats.reset(token)
+            for statement, n in stats.repeated(self.n_plus_one_threshold):
+                logger.warning(
+                    "Possible N+1 query: %s %s executed one statement %d times: %s",
+                    scope["method"], scope["path"], n, " ".join(statement.split())[:200]
+                )
@@ -0,0 +1,104 @@
+import threading
+from collections import OrderedDict
+from typing import List, Type
+from pydantic import BaseModel
+from sqlalchemy import Select, inspect, select
+from sqlalchemy.orm import Session
+from . import models, schemas
+
+"""
+Read models for list endpoints
+Core select() statements project exactly the columns an Out schema
+declares and return plain dicts, so list queries skip ORM hydration,
+the identity map and relationship loading. The dicts go straight to
+serialization.json_list_response
+"""
+
+NESTED_SEPARATOR = "__"
+# Above serialization.MAX_SUBSETS, so every cached sparse schema also keeps its projection
+MAX_PROJECTIONS = 512
+
+# Keyed by field names rather than schema class: a sparse schema evicted and
+# rebuilt by serialization.sparse_schema is a new class with the same fields
+_projections: "OrderedDict[tuple, list]" = OrderedDict()
+_projections_lock = threading.Lock()
+
+def projection(schema: Type[BaseModel], model, prefix: str = "") -> list:
+    """
+    Returns the labelled columns of a model that back a schema's fields
+    Args:
+        schema: Pydantic Out schema
+        model: ORM model the rows come from
+        prefix: Label prefix for columns of a nested schema
+    Returns:
+        list: Column expressions labelled with the field names
+    """
+    key = (tuple(schema.model_fields), model, prefix)
+    with _projections_lock:
+        columns = _projections.get(key)
+        if columns is not None:
+            _projections.move_to_end(key)
+            return columns
+    mapped = inspect(model).columns
+    columns = [mapped[name].label(f"{prefix}{name}") for name in schema.model_fields if name in mapped]
+    with _projections_lock:
+        _projections[key] = columns
+        _projections.move_to_end(key)
+        while len(_projections) > MAX_PROJECTIONS:
+            _projections.popitem(last=False)
+    return columns
+
+def select_rows(schema: Type[BaseModel], model) -> Select:
+    """
+    Builds a select() of the columns a schema needs
+    Args:
+        schema: Pydantic Out schema
+        model: ORM model the rows come from
+    Returns:
+        Select: Statement to extend with filters and ordering
+    """
+    return select(*projection(schema, model))
+
+def fetch(db: Session, statement: Select) -> List[dict]:
+    """
+    Executes a projection and returns one dict per row
+    Args:
+        db: Database session
+        statement: Statement from select_rows or a custom projection
+    Returns:
+        List[dict]: Rows keyed by schema field name
+    """
+    return [dict(row) for row in db.execute(statement).mappings()]
+
+def _nest(row: dict, name: str) -> dict:
+    prefix = f"{name}{NESTED_SEPARATOR}"
+    nested = {key[len(prefix):]: row.pop(key) for key in [key for key in row if key.startswith(prefix)]}
+    row[name] = nested if nested.get("id") is not None else None
+    return row
+
+def select_payments(schema: Type[BaseModel] = schemas.PaymentOut) -> Select:
+    """
+    Builds a select() of payments with their charging session as nested columns
+    Payments of archived sessions get charging_session None
+    Args:
+        schema: PaymentOut or a sparse subset of it, the session is only joined when it has charging_session
+    Returns:
+        Select: Statement to extend with filters and ordering
+    """
+    statement = select_rows(schema, models.Payment)
+    if "charging_session" not in schema.model_fields:
+        return statement
+    return statement.add_columns(
+        *projection(schemas.ChargingSessionBase, models.ChargingSession, f"charging_session{NESTED_SEPARATOR}")
+    ).select_from(models.Payment).outerjoin(models.ChargingSession, models.ChargingSession.id == models.Payment.session_id)
+
+def fetch_payments(db: Session, statement: Select) -> List[dict]:
+    """
+    Executes a select_payments() statement
+    Args:
+        db: Database session
+        statement: Statement from select_payments
+    Returns:
+        List[dict]: Payment rows with a nested charging_session dict
+    """
+    return [_nest(row, "charging_session") for row in fetch(db, statement)]
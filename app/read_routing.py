@@ -0,0 +1,155 @@
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from typing import Optional
+from fastapi import Request
+from sqlalchemy.orm import Session
+from . import database
+from .config import settings
+
+"""
+Read-replica routing with read-after-write tracking
+Successful mutating requests return the time of the write in the
+last_write cookie and the X-Last-Write header. Reads carrying it (either
+one) go to the primary until the replica has had time to catch up, in
+whichever worker they land; worker clocks are assumed to agree to well
+within read_after_write_seconds. Callers are also marked in the worker that
+handled the write, for clients that send neither back
+"""
+
+MUTATING_METHODS = {"POST", "PUT", "PATCH", "DELETE"}
+LAST_WRITE_COOKIE = "last_write"
+LAST_WRITE_HEADER = b"x-last-write"
+
+def wrote_at(value: Optional[str]) -> Optional[float]:
+    """
+    Parses a last-write marker sent back by a client
+    Args:
+        value: Cookie or header value, a Unix time
+    Returns:
+        Optional[float]: Time of the caller's last write, None when missing or invalid
+    """
+    try:
+        written = float(value)
+    except (TypeError, ValueError):
+        return None
+    return written if math.isfinite(written) else None
+
+def caller_key(authorization: Optional[bytes]) -> Optional[str]:
+    """
+    Identifies the caller by a hash of the Authorization header
+    Args:
+        authorization: Raw Authorization header value
+    Returns:
+        Optional[str]: Caller key, None for anonymous requests
+    """
+    if not authorization:
+        return None
+    return hashlib.sha256(authorization).hexdigest()
+
+class RecentWriters:
+    """
+    Bounded map of callers that wrote within the read-after-write window
+    Attributes:
+        window: Seconds reads stay on the primary after a write
+        max_entries: Maximum number of tracked callers
+    """
+
+    def __init__(self, window: float = 5.0, max_entries: int = 100000):
+        self.window = window
+        self.max_entries = max_entries
+        self._until: "OrderedDict[str, float]" = OrderedDict()
+
+    def mark(self, key: str):
+        self._until[key] = time.monotonic() + self.window
+        self._until.move_to_end(key)
+        while len(self._until) > self.max_entries:
+            self._until.popitem(last=False)
+
+    def wrote_recently(self, key: Optional[str]) -> bool:
+        if key is None:
+            return False
+        until = self._until.get(key)
+        if until is None:
+            return False
+        if until < time.monotonic():
+            self._until.pop(key, None)
+            return False
+        return True
+
+class ReadAfterWriteMiddleware:
+    """
+    ASGI middleware marking callers of successful mutating requests as recent writers
+    The marker is returned to the client as well, so all workers can honour it
+    """
+
+    def __init__(self, app, writers: RecentWriters):
+        self.app = app
+        self.writers = writers
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in MUTATING_METHODS:
+            return await self.app(scope, receive, send)
+
+        key = caller_key(dict(scope["headers"]).get(b"authorization"))
+
+        async def mark_send(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                if key is not None:
+                    self.writers.mark(key)
+                marker = f"{time.time():.3f}".encode()
+                cookie = f"{LAST_WRITE_COOKIE}={marker.decode()}; Max-Age={int(self.writers.window) + 1}; Path=/; HttpOnly; SameSite=Lax"
+                message = {**message, "headers": [
+                    *message.get("headers", []), (LAST_WRITE_HEADER, marker), (b"set-cookie", cookie.encode())
+                ]}
+            await send(message)
+
+        await self.app(scope, receive, mark_send)
+
+recent_writers = RecentWriters(window=settings.read_after_write_seconds)
+
+def use_replica(request: Request) -> bool:
+    """
+    Decides whether a read request can be served by the replica
+    Args:
+        request: Incoming request
+    Returns:
+        bool: False when no replica is configured, the caller wrote recently or the replica lags
+    """
+    if database.read_engine is None:
+        return False
+    written = wrote_at(request.headers.get(LAST_WRITE_HEADER.decode()) or request.cookies.get(LAST_WRITE_COOKIE))
+    # A marker from the future is only trusted within the window, so it cannot pin reads to the primary
+    if written is not None and abs(time.time() - written) < recent_writers.window:
+        return False
+    if recent_writers.wrote_recently(caller_key(request.headers.get("authorization", "").encode())):
+        return False
+    lag = database.replica_lag()
+    return lag is not None and lag <= settings.read_max_lag_seconds
+
+def open_read_session(request: Request) -> Session:
+    """
+    Opens a read-only database session, on the replica when it is safe
+    The caller closes it; used directly by streaming responses, which are
+    sent after the request's dependencies have been closed
+    Args:
+        request: Incoming request, used for read-after-write routing
+    Returns:
+        Session: Replica session, or a primary session as fallback
+    """
+    return database.ReadSessionLocal() if use_replica(request) else database.SessionLocal()
+
+def get_read_db(request: Request):
+    """
+    Creates a read-only database session, on the replica when it is safe
+    Args:
+        request: Incoming request, used for read-after-write routing
+    Yields:
+        Session: Replica session, or a primary session as fallback
+    """
+    db = open_read_session(request)
+    try:
+        yield db
+    finally:
+        db.close()
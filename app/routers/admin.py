@@ -0,0 +1,102 @@
+import io
+import pstats
+from fastapi import Depends, HTTPException, status, APIRouter
+from fastapi.responses import FileResponse, PlainTextResponse
+from .. import models
+from ..database import pool_status
+from ..slow_queries import slow_query_log
+from ..profiling import profiler
+from .auth import get_current_user
+
+router = APIRouter(
+    prefix="/admin",
+    tags=['Admin']
+)
+
+def get_current_admin(current_user: models.User = Depends(get_current_user)):
+    """
+    Requires the current user to have the ADMIN role
+    Args:
+        current_user: Currently authenticated user
+    Returns:
+        models.User: Authenticated administrator
+    Raises:
+        HTTPException: When the user is not an administrator
+    """
+    if current_user.role != models.UserRoleEnum.ADMIN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Administrator role required"
+        )
+    return current_user
+
+@router.get("/db-pool")
+def get_db_pool(admin: models.User = Depends(get_current_admin)):
+    """
+    Reports database connection pool usage of the worker serving the request
+    Args:
+        admin: Authenticated administrator
+    Returns:
+        dict: Pool size, checked out, idle and overflow connections and checkout wait times
+    """
+    return pool_status()
+
+@router.get("/slow-queries")
+def get_slow_queries(admin: models.User = Depends(get_current_admin)):
+    """
+    Lists slow statements of the worker serving the request, most recently seen first
+    Args:
+        admin: Authenticated administrator
+    Returns:
+        dict: Threshold and one entry per statement fingerprint with redacted parameters and EXPLAIN plan
+    """
+    return {
+        "threshold_ms": slow_query_log.threshold_ms,
+        "queries": slow_query_log.entries(),
+    }
+
+@router.delete("/slow-queries", status_code=status.HTTP_204_NO_CONTENT)
+def clear_slow_queries(admin: models.User = Depends(get_current_admin)):
+    """
+    Empties the slow-query log of the worker serving the request
+    Args:
+        admin: Authenticated administrator
+    """
+    slow_query_log.clear()
+
+@router.get("/profiles")
+def get_profiles(admin: models.User = Depends(get_current_admin)):
+    """
+    Lists stored request profiles, newest first
+    Args:
+        admin: Authenticated administrator
+    Returns:
+        list: Name, size and modification time of each profile
+    """
+    return profiler.list()
+
+@router.get("/profiles/{name}")
+def get_profile(name: str, format: str = "pstat", limit: int = 40, admin: models.User = Depends(get_current_admin)):
+    """
+    Returns a stored request profile
+    Args:
+        name: Profile name from the X-Profile-Id header or the profile list
+        format: "pstat" for the raw file, "text" for the slowest functions by cumulative time
+        limit: Number of functions in the text report
+        admin: Authenticated administrator
+    Returns:
+        Response: pstat file or text report
+    Raises:
+        HTTPException: When the profile does not exist
+    """
+    path = profiler.path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Profile {name} does not exist"
+        )
+    if format == "text":
+        report = io.StringIO()
+        pstats.Stats(path, stream=report).sort_stats("cumulative").print_stats(limit)
+        return PlainTextResponse(report.getvalue())
+    return FileResponse(path, media_type="application/octet-stream", filename=name)
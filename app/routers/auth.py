@@ -6,6 +6,10 @@ from .. import models, database
 from ..config import settings
 from typing import List
 from .. import schemas
+from ..battery_buffer import battery_buffer
+from ..serialization import json_list_response
+from ..read_models import fetch, select_rows
+from ..read_routing import get_read_db
 
 router = APIRouter(
     prefix="/auth",
@@ -50,6 +54,35 @@ def get_current_user(token: str = Depends(oauth2_scheme), db: Session = Depends(
     Raises:
         HTTPException: Gdy autoryzacja się nie powiedzie
     """
+    return load_current_user(token, db)
+
+def get_current_reader(token: str = Depends(oauth2_scheme), db: Session = Depends(get_read_db)):
+    """
+    Odpowiednik get_current_user dla ścieżek odczytu
+    Korzysta z tej samej sesji get_read_db co ścieżka (FastAPI tworzy ją
+    raz na żądanie), więc żądanie zajmuje jedno połączenie, a odczyt
+    użytkownika trafia na replikę razem z resztą odczytów
+    Args:
+        token: Token JWT
+        db: Sesja odczytu współdzielona ze ścieżką
+    Returns:
+        models.User: Obiekt użytkownika
+    Raises:
+        HTTPException: Gdy autoryzacja się nie powiedzie
+    """
+    return load_current_user(token, db)
+
+def load_current_user(token: str, db: Session) -> models.User:
+    """
+    Weryfikuje token JWT i wczytuje użytkownika z podanej sesji
+    Args:
+        token: Token JWT
+        db: Sesja bazy danych
+    Returns:
+        models.User: Obiekt użytkownika
+    Raises:
+        HTTPException: Gdy autoryzacja się nie powiedzie
+    """
     if not token:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, 
@@ -91,8 +124,8 @@ async def protected_route(user: dict = Depends(get_current_user)):
 
 @router.get("/vehicles/", response_model=List[schemas.VehicleOut])
 async def get_vehicles(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(database.get_db)
+    current_user: models.User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """
     Pobiera wszystkie pojazdy zalogowanego użytkownika
@@ -103,12 +136,11 @@ async def get_vehicles(
         List[schemas.VehicleOut]: Lista pojazdów użytkownika
     """
     try:
-        vehicles = (
-            db.query(models.Vehicle)
-            .filter(models.Vehicle.user_id == current_user.id)
-            .all()
+        vehicles = fetch(
+            db, select_rows(schemas.VehicleOut, models.Vehicle).where(models.Vehicle.user_id == current_user.id)
         )
-        return vehicles
+        battery_buffer.apply_rows(vehicles)
+        return json_list_response(schemas.VehicleOut, vehicles)
         
     except Exception as e:
         raise HTTPException(
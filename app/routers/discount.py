@@ -3,8 +3,13 @@ from app import models
 from app.schemas import DiscountIn, DiscountOut
 from .auth import get_current_user
 from app.database import get_db
+from app.read_routing import get_read_db
+from app.cache import cache, notify, DISCOUNT
+from app.serialization import json_list_response
+from app.read_models import fetch, select_rows
+from app.payment_queue import PAYMENT_PENDING
 from sqlalchemy.orm import Session
-from datetime import datetime, date
+from datetime import datetime, date, timezone
 from typing import List
 import time
 
@@ -13,6 +18,20 @@ router = APIRouter(
     tags=["discounts"]
 )
 
+def _is_expired(expiration_date) -> bool:
+    """
+    Sprawdza, czy kod wygasł; kod jest ważny do końca dnia wygaśnięcia w UTC
+    Args:
+        expiration_date: Data wygaśnięcia, daty bez strefy czasowej traktowane są jako UTC
+    Returns:
+        bool: True, gdy dzień wygaśnięcia już minął
+    """
+    if isinstance(expiration_date, datetime):
+        if expiration_date.tzinfo is not None:
+            expiration_date = expiration_date.astimezone(timezone.utc)
+        expiration_date = expiration_date.date()
+    return expiration_date < datetime.now(timezone.utc).date()
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=DiscountOut)
 def create_discount(
     discount: DiscountIn,
@@ -23,8 +42,7 @@ def create_discount(
     if (existing_discount):
         raise HTTPException(status_code=400, detail="Discount code already exists")
 
-    # Fix: Use datetime.utcnow() instead of datetime.datetime.utcnow()
-    expiration_date = datetime.utcnow().replace(hour=23, minute=59, second=59, microsecond=0)
+    expiration_date = datetime.now(timezone.utc).replace(hour=23, minute=59, second=59, microsecond=0)
     new_discount = models.Discount(
         code=discount.code,
         description=discount.description,
@@ -33,6 +51,7 @@ def create_discount(
     )
 
     db.add(new_discount)
+    notify(db, DISCOUNT, new_discount.code)
     db.commit()
     db.refresh(new_discount)
 
@@ -44,16 +63,16 @@ def get_discount(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_user) 
 ): 
-    discount = db.query(models.Discount).filter(models.Discount.code == code).first()
+    def load():
+        discount = db.query(models.Discount).filter(models.Discount.code == code).first()
+        return DiscountOut.model_validate(discount) if discount else None
+
+    # Kody są usuwane po użyciu, więc brak wpisu czytany jest z bazy głównej
+    discount = cache.get_or_load(DISCOUNT, code, load)
 
     if not discount:
         raise HTTPException(status_code=404, detail="Discount not found")
-    if isinstance(discount.expiration_date, datetime):
-        expiration_datetime = discount.expiration_date.replace(hour=23, minute=59, second=59, microsecond=0)
-    else:
-        expiration_datetime = datetime.combine(discount.expiration_date, datetime.max.time())
-
-    if expiration_datetime < datetime.utcnow():
+    if _is_expired(discount.expiration_date):
         raise HTTPException(status_code=400, detail="Discount code has expired")
 
     return discount
@@ -62,34 +81,52 @@ def get_discount(
 def delete_expired_discounts(
     db: Session = Depends(get_db)
 ):
-    expired_discounts = db.query(models.Discount).filter(models.Discount.expiration_date < datetime.utcnow()).all()
+    expired_discounts = db.query(models.Discount).filter(models.Discount.expiration_date < datetime.now(timezone.utc)).all()
 
     if not expired_discounts:
         raise HTTPException(status_code=404, detail="No expired discounts found")
 
     for discount in expired_discounts:
         db.delete(discount)
+        notify(db, DISCOUNT, discount.code)
 
     db.commit()  
 
     return {"detail": "Expired discounts deleted successfully"}
 
-def delete_discount_and_return_percentage(discount_id: int, db: Session) -> int:
-    discount = db.query(models.Discount).filter(models.Discount.id == discount_id).first()
+def reserve_discount_percentage(discount_id: int, db: Session) -> int:
+    """
+    Zwraca procent rabatu dla nowej płatności
+    Kod nie jest usuwany - kolejka płatności usuwa go dopiero po udanym
+    rozliczeniu. Wiersz rabatu jest blokowany do końca transakcji, a kod
+    zarezerwowany przez inną oczekującą płatność jest odrzucany
+    Args:
+        discount_id: ID rabatu
+        db: Sesja bazy danych, w której zapisywana jest płatność
+    Returns:
+        int: Procent rabatu
+    Raises:
+        HTTPException: Gdy rabat nie istnieje, wygasł lub jest już zarezerwowany
+    """
+    discount = db.query(models.Discount).filter(models.Discount.id == discount_id).with_for_update().first()
 
     if not discount:
         raise HTTPException(status_code=404, detail="Discount not found")
+    if _is_expired(discount.expiration_date):
+        raise HTTPException(status_code=400, detail="Discount code has expired")
 
-    discount_percentage = discount.discount_percentage
-
-    db.delete(discount)
-    db.commit() 
+    reserved = db.query(models.Payment.id).filter(
+        models.Payment.discount_id == discount_id,
+        models.Payment.status == PAYMENT_PENDING
+    ).first()
+    if reserved:
+        raise HTTPException(status_code=409, detail="Discount is already used by a pending payment")
 
-    return discount_percentage
+    return discount.discount_percentage
 
 @router.get("/", response_model=List[DiscountOut])
 def get_all_discounts(
-    db: Session = Depends(get_db)
+    db: Session = Depends(get_read_db)
 ):
     """
     Pobiera wszystkie rabaty z bazy danych
@@ -98,8 +135,8 @@ def get_all_discounts(
     Returns:
         List[schemas.DiscountOut]: Lista wszystkich rabatów
     """
-    discounts = db.query(models.Discount).all()
-    return discounts
+    discounts = fetch(db, select_rows(DiscountOut, models.Discount))
+    return json_list_response(DiscountOut, discounts)
 
 @router.post("/verify/{code}", response_model=dict)
 def verify_discount(
@@ -123,9 +160,7 @@ def verify_discount(
                 "message": "Kod rabatowy nie istnieje"
             }
 
-        # Convert datetime.utcnow() to date for comparison
-        current_date = datetime.utcnow().date()
-        if discount.expiration_date < current_date:
+        if _is_expired(discount.expiration_date):
             return {
                 "isValid": False,
                 "percentage": 0,
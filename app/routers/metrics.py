@@ -0,0 +1,16 @@
+from fastapi import APIRouter, Response
+from ..metrics import render
+
+router = APIRouter(
+    tags=['Metrics']
+)
+
+@router.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """
+    Exposes the metrics of all worker processes in the Prometheus text format
+    Returns:
+        Response: Prometheus exposition
+    """
+    body, content_type = render()
+    return Response(content=body, media_type=content_type)
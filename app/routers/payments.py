@@ -1,16 +1,64 @@
 from fastapi import APIRouter, Depends, HTTPException, status, Query
-from typing import List
+from typing import List, Optional
+from datetime import datetime
 from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import set_committed_value
+from sqlalchemy import insert, update
 from .. import models, schemas
 from ..database import get_db
-from ..routers.auth import get_current_user
-from app.routers.discount import delete_discount_and_return_percentage
+from ..read_routing import get_read_db
+from ..serialization import json_list_response, sparse_schema
+from ..read_models import fetch_payments, select_payments
+from ..routers.auth import get_current_user, get_current_reader
+from app.routers.discount import reserve_discount_percentage
+from ..payment_gateway import PaymentIntent
+from ..payment_queue import payment_queue, PAYMENT_PENDING, SESSION_PROCESSING, SESSION_PAID
+from ..outbox import record_event, PAYMENT_CREATED
+import logging
+
+logger = logging.getLogger(__name__)
+
+SESSION_COMPLETED = "COMPLETED"
 
 router = APIRouter(
     prefix="/payments",
     tags=["Płatności"]
 )
 
+def _claim_sessions(db: Session, user_id: str, session_ids: List[int]) -> set:
+    """
+    Przełącza opłacalne sesje na PROCESSING jednym warunkowym UPDATE
+    Warunek jest sprawdzany przez bazę w chwili zapisu, więc równoległe
+    żądania nie mogą zlecić dwóch płatności za tę samą sesję
+    Args:
+        db: Sesja bazy danych
+        user_id: Właściciel sesji
+        session_ids: ID sesji do opłacenia
+    Returns:
+        set: ID sesji przejętych przez to żądanie
+    """
+    return set(db.execute(
+        update(models.ChargingSession)
+        .where(
+            models.ChargingSession.id.in_(session_ids),
+            models.ChargingSession.user_id == user_id,
+            models.ChargingSession.status == SESSION_COMPLETED,
+            models.ChargingSession.payment_status.notin_((SESSION_PROCESSING, SESSION_PAID))
+        )
+        .values(payment_status=SESSION_PROCESSING)
+        .returning(models.ChargingSession.id),
+        execution_options={"synchronize_session": False}
+    ).scalars())
+
+def _payment_event(payment_id: int, session_id: int, user_id: str, amount: float, payment_method: str) -> dict:
+    return {
+        "payment_id": payment_id,
+        "session_id": session_id,
+        "user_id": user_id,
+        "amount": amount,
+        "payment_method": payment_method,
+    }
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.PaymentOut)
 def create_payment(
     payment: schemas.PaymentCreate,
@@ -19,7 +67,9 @@ def create_payment(
     discount_code_id: int = Query(None)  # Opcjonalne pole dla kodu rabatowego
 ): 
     """
-    Tworzy nową płatność
+    Tworzy nową płatność i przekazuje ją do asynchronicznego rozliczenia
+    Płatność zapisywana jest ze statusem PENDING, a wynik z bramki
+    płatniczej aktualizuje ją w tle - czas odpowiedzi nie zależy od bramki
     Args:
         payment: Dane płatności do utworzenia
         db: Sesja bazy danych
@@ -27,30 +77,185 @@ def create_payment(
         discount_code_id: Opcjonalny identyfikator kodu rabatowego
     Returns:
         schemas.PaymentOut: Utworzona płatność
+    Raises:
+        HTTPException: Gdy sesja nie istnieje, nie została zakończona lub została już opłacona
     """
-    
+    session = db.query(models.ChargingSession).filter(
+        models.ChargingSession.id == payment.session_id,
+        models.ChargingSession.user_id == current_user.id
+    ).first()
+    if not session:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Nie znaleziono sesji ładowania"
+        )
+    if session.status != SESSION_COMPLETED:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Sesja ładowania nie została zakończona"
+        )
+    if not _claim_sessions(db, current_user.id, [session.id]):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Sesja jest już opłacona lub w trakcie rozliczania"
+        )
+    set_committed_value(session, "payment_status", SESSION_PROCESSING)
+
+    amount = session.total_cost
+    discount_id = None
     if discount_code_id:
         discount_percentage = None
         try:
-            discount_percentage = delete_discount_and_return_percentage(discount_code_id, db)
+            discount_percentage = reserve_discount_percentage(discount_code_id, db)
         except HTTPException:
             discount_percentage = None  
         
         if discount_percentage:
-            payment.price = payment.price * (1 - discount_percentage / 100)
+            amount = amount * (1 - discount_percentage / 100)
+            discount_id = discount_code_id
     
-    new_payment = models.Payment(**payment.dict())
+    # Kwota i rabat zapisywane są w płatności, aby wznowienie po restarcie pobrało tę samą kwotę
+    new_payment = models.Payment(
+        **payment.dict(exclude={"status", "user_id"}),
+        user_id=current_user.id,
+        status=PAYMENT_PENDING,
+        amount=amount,
+        discount_id=discount_id
+    )
     db.add(new_payment)
+    db.flush()
+    record_event(db, PAYMENT_CREATED, new_payment.id, _payment_event(new_payment.id, session.id, new_payment.user_id, amount, new_payment.payment_method))
     db.commit()
     db.refresh(new_payment)
+
+    try:
+        payment_queue.submit(PaymentIntent(
+            payment_id=new_payment.id,
+            session_id=new_payment.session_id,
+            user_id=new_payment.user_id,
+            amount=amount,
+            payment_method=new_payment.payment_method,
+            discount_id=discount_id
+        ))
+    except RuntimeError:
+        # Płatność pozostaje PENDING i zostanie podjęta przy następnym starcie kolejki
+        logger.warning(f"Payment queue not running, payment {new_payment.id} left PENDING")
     
     return new_payment
 
+@router.post("/batch", status_code=status.HTTP_201_CREATED, response_model=schemas.PaymentBatchOut)
+def create_payment_batch(
+    batch: schemas.PaymentBatchCreate,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_user)
+):
+    """
+    Tworzy płatności dla wielu sesji naraz (klienci flotowi)
+    Sesje są walidowane jednym zapytaniem, płatności wstawiane jednym
+    INSERT, a statusy sesji zmieniane jednym UPDATE w jednej transakcji
+    Args:
+        batch: Lista ID sesji i dane płatności
+        db: Sesja bazy danych
+        current_user: Aktualnie zalogowany użytkownik
+    Returns:
+        schemas.PaymentBatchOut: Wynik dla każdej sesji
+    """
+    succeeded = []
+    failed = []
+
+    sessions = {
+        row.id: row
+        for row in db.query(
+            models.ChargingSession.id,
+            models.ChargingSession.status,
+            models.ChargingSession.payment_status,
+            models.ChargingSession.total_cost
+        ).filter(
+            models.ChargingSession.id.in_(set(batch.session_ids)),
+            models.ChargingSession.user_id == current_user.id
+        )
+    }
+
+    payable = []
+    seen = set()
+    for session_id in batch.session_ids:
+        session = sessions.get(session_id)
+        if session_id in seen:
+            error = "Zduplikowane ID sesji"
+        elif session is None:
+            error = "Nie znaleziono sesji ładowania"
+        elif session.status != SESSION_COMPLETED:
+            error = "Sesja ładowania nie została zakończona"
+        elif session.payment_status in (SESSION_PROCESSING, SESSION_PAID):
+            error = "Sesja jest już opłacona lub w trakcie rozliczania"
+        else:
+            error = None
+            payable.append(session)
+        seen.add(session_id)
+        if error:
+            failed.append(schemas.PaymentBatchItem(session_id=session_id, error=error))
+
+    if not payable:
+        return schemas.PaymentBatchOut(succeeded=succeeded, failed=failed)
+
+    try:
+        claimed = _claim_sessions(db, current_user.id, [session.id for session in payable])
+        for session in payable:
+            if session.id not in claimed:
+                # Przejęta w międzyczasie przez inne żądanie
+                failed.append(schemas.PaymentBatchItem(session_id=session.id, error="Sesja jest już opłacona lub w trakcie rozliczania"))
+        payable = [session for session in payable if session.id in claimed]
+        if not payable:
+            db.rollback()
+            return schemas.PaymentBatchOut(succeeded=succeeded, failed=failed)
+
+        inserted = db.execute(
+            insert(models.Payment).returning(models.Payment.id, models.Payment.session_id),
+            [
+                {
+                    "user_id": current_user.id,
+                    "session_id": session.id,
+                    "status": PAYMENT_PENDING,
+                    "transaction_id": batch.transaction_id,
+                    "payment_method": batch.payment_method,
+                    "amount": session.total_cost
+                }
+                for session in payable
+            ]
+        ).all()
+        for row in inserted:
+            session = sessions[row.session_id]
+            record_event(db, PAYMENT_CREATED, row.id, _payment_event(row.id, session.id, current_user.id, session.total_cost, batch.payment_method))
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Błąd podczas tworzenia płatności: {str(e)}"
+        )
+
+    payment_ids = {row.session_id: row.id for row in inserted}
+    for session in payable:
+        payment_id = payment_ids[session.id]
+        succeeded.append(schemas.PaymentBatchItem(session_id=session.id, payment_id=payment_id))
+        try:
+            payment_queue.submit(PaymentIntent(
+                payment_id=payment_id,
+                session_id=session.id,
+                user_id=current_user.id,
+                amount=session.total_cost,
+                payment_method=batch.payment_method
+            ))
+        except RuntimeError:
+            logger.warning(f"Payment queue not running, payment {payment_id} left PENDING")
+
+    return schemas.PaymentBatchOut(succeeded=succeeded, failed=failed)
+
 @router.get("/{id}", response_model=schemas.PaymentOut)
 def get_payment(
     id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader)
 ):
     """
     Pobiera pojedynczą płatność
@@ -73,25 +278,39 @@ def get_payment(
 
 @router.get("/", response_model=List[schemas.PaymentOut])
 async def get_payments(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    from_time: Optional[datetime] = None,
+    to_time: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    current_user: models.User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
     """
-    Pobiera wszystkie płatności użytkownika
+    Pobiera płatności użytkownika z zadanego przedziału czasu
+    Tabela payments jest partycjonowana po miesiącu created_at, więc
+    podany przedział czasu pozwala pominąć niepasujące partycje
     Args:
+        from_time: Najwcześniejsza data utworzenia, domyślnie bez ograniczenia
+        to_time: Najpóźniejsza data utworzenia, domyślnie bez ograniczenia
+        fields: Pola do zwrócenia oddzielone przecinkami, domyślnie wszystkie
         current_user: Aktualnie zalogowany użytkownik
         db: Sesja bazy danych
     Returns:
         List[schemas.PaymentOut]: Lista płatności użytkownika
+    Raises:
+        HTTPException: Gdy fields zawiera nieznane pole
     """
+    schema = sparse_schema(schemas.PaymentOut, fields)
+    filters = [models.Payment.user_id == current_user.id]
+    if from_time is not None:
+        filters.append(models.Payment.created_at >= from_time)
+    if to_time is not None:
+        filters.append(models.Payment.created_at < to_time)
+
     try:
-        payments = (
-            db.query(models.Payment)
-            .filter(models.Payment.user_id == current_user.id)
-            .order_by(models.Payment.created_at.desc())
-            .all()
+        payments = fetch_payments(
+            db, select_payments(schema).where(*filters).order_by(models.Payment.created_at.desc())
         )
-        return payments if payments else []
+        return json_list_response(schema, payments)
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -1,11 +1,16 @@
-from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter
-from typing import List
+from fastapi import FastAPI, Request, Response, status, HTTPException, Depends, APIRouter
+from typing import List, Optional
 from sqlalchemy.orm import Session
 from datetime import date
 from enum import Enum
 from .. import models, schemas
-from ..database import engine, get_db
+from ..database import get_db
+from ..cache import notify, PORT
+from ..http_cache import conditional_response
+from ..serialization import json_list_bytes, sparse_schema
+from ..read_models import fetch, select_rows
 from ..routers.auth import get_current_user
+from ..outbox import record_event, PORT_STATUS_CHANGED
 
 router = APIRouter(
     prefix="/ports",
@@ -34,44 +39,63 @@ def create_port(
     """
     new_port = models.ChargingPort(**charging_port.dict())
     db.add(new_port)
+    db.flush()
+    notify(db, PORT, new_port.id)
     db.commit()
     db.refresh(new_port)
     return new_port
 
 @router.get('/{id}', response_model=schemas.ChargingPortOut)
-def get_port(id: int, db: Session = Depends(get_db)):
+def get_port(id: int, request: Request, db: Session = Depends(get_db)):
     """
-    Pobiera pojedynczy port ładowania
+    Pobiera pojedynczy port ładowania z pamięci podręcznej odpowiedzi workera
+    Przy braku wpisu port czytany jest z bazy głównej, aby opóźniona
+    replika nie zapisała w cache danych sprzed unieważnienia
     Args:
         id: ID portu
+        request: Żądanie, może zawierać If-None-Match
         db: Sesja bazy danych
     Returns:
-        schemas.ChargingPortOut: Znaleziony port
+        Response: Znaleziony port z nagłówkiem ETag lub 304, gdy się nie zmienił
     Raises:
         HTTPException: Gdy port nie zostanie znaleziony
     """
-    port = db.query(models.ChargingPort).filter(models.ChargingPort.id == id).first()
-    if not port:
+    def load():
+        port = db.query(models.ChargingPort).filter(models.ChargingPort.id == id).first()
+        return schemas.ChargingPortOut.model_validate(port).model_dump_json(by_alias=True).encode() if port else None
+
+    response = conditional_response(request, (PORT,), load)
+    if response is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail=f"Nie znaleziono portu o ID: {id}"
         )
-    return port
+    return response
 
 @router.get('/', response_model=List[schemas.ChargingPortOut])
-def get_all_ports(db: Session = Depends(get_db)):
+def get_all_ports(request: Request, fields: Optional[str] = None, db: Session = Depends(get_db)):
     """
-    Pobiera wszystkie porty ładowania
+    Pobiera wszystkie porty ładowania z pamięci podręcznej odpowiedzi workera
     Args:
+        request: Żądanie, może zawierać If-None-Match
+        fields: Pola do zwrócenia oddzielone przecinkami, domyślnie wszystkie
         db: Sesja bazy danych
     Returns:
-        List[schemas.ChargingPortOut]: Lista wszystkich portów
+        Response: Lista wszystkich portów z nagłówkiem ETag lub 304, gdy się nie zmieniła
+    Raises:
+        HTTPException: Gdy fields zawiera nieznane pole
     """
-    ports = db.query(models.ChargingPort).all()
-    for port in ports:
-        if port.last_service_date is None:
-            port.last_service_date = date.today()
-    return ports
+    schema = sparse_schema(schemas.ChargingPortOut, fields)
+
+    def load():
+        ports = fetch(db, select_rows(schema, models.ChargingPort))
+        for port in ports:
+            if "last_service_date" in port and port["last_service_date"] is None:
+                port["last_service_date"] = date.today()
+        return json_list_bytes(schema, ports)
+
+    # Klucz to zweryfikowane nazwy pól, więc równoważne wartości fields= dzielą jeden wpis
+    return conditional_response(request, (PORT,), load, params=tuple(schema.model_fields))
 
 @router.patch("/{id}/status", response_model=schemas.ChargingPortOut)
 def update_port_status(
@@ -107,6 +131,12 @@ def update_port_status(
         )
 
     port.status = new_status
+    record_event(db, PORT_STATUS_CHANGED, port.id, {
+        "port_id": port.id,
+        "station_id": port.station_id,
+        "status": new_status,
+    })
+    notify(db, PORT, port.id)
     db.commit()
     db.refresh(port)
     return port
@@ -146,6 +176,7 @@ def update_port(
         setattr(port, key, value)
     
     try:
+        notify(db, PORT, id)
         db.commit()
         db.refresh(port)
         return port
@@ -193,6 +224,7 @@ def delete_port(
 
     try:
         port_query.delete(synchronize_session=False)
+        notify(db, PORT, id)
         db.commit()
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     except Exception as e:
@@ -1,15 +1,38 @@
-from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Request, status, BackgroundTasks
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta, date, timezone
-from typing import List
+from typing import List, Optional
+import csv
+import heapq
+import io
 import logging
 from .. import models, schemas
+from ..archive import iter_archived_sessions, unique_sessions
 from ..database import get_db
-from .auth import get_current_user
-from sqlalchemy import text
+from ..read_routing import get_read_db, open_read_session
+from ..serialization import json_list_response, sparse_schema
+from ..read_models import fetch, select_rows
+from .auth import get_current_user, get_current_reader
+from ..battery_buffer import battery_buffer
+from ..outbox import record_event, SESSION_STARTED, SESSION_STOPPED
+from sqlalchemy import select, text
 
 COST_PER_KWH = 1.0
 
+# charging_sessions is partitioned by start_time month; history queries given a
+# from_time/to_time range let PostgreSQL skip partitions that cannot match. IN_PROGRESS
+# lookups are not bounded, however old the session: every partition has small
+# partial indexes on vehicle_id and port_id WHERE status = 'IN_PROGRESS' and
+# an index on (user_id, status)
+
+EXPORT_COLUMNS = [
+    "id", "vehicle_id", "port_id", "start_time", "end_time",
+    "energy_used_kwh", "total_cost", "status", "payment_status"
+]
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_BATCH_SIZE = 1000
+
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -38,6 +61,7 @@ def end_charging_session(session_id: int, db: Session, end_time: datetime):
             
             vehicle = db.query(models.Vehicle).filter(models.Vehicle.id == session.vehicle_id).first()
             if vehicle:
+                battery_buffer.apply([vehicle])
                 max_charge = vehicle.battery_capacity_kwh
                 current_charge = vehicle.current_battery_capacity_kw
                 charge_rate = min(22, vehicle.max_charging_powerkwh)
@@ -45,16 +69,14 @@ def end_charging_session(session_id: int, db: Session, end_time: datetime):
                 charge_added = charging_time_hours * charge_rate
                 new_charge = min(max_charge, current_charge + charge_added)
                 
-                vehicle.current_battery_capacity_kw = new_charge
-                
                 session.end_time = end_time
                 session.status = "COMPLETED"
                 session.energy_used_kwh = charge_added
                 session.total_cost = calculate_cost(charge_added)
                 
                 db.commit()
-                db.refresh(vehicle)
                 db.refresh(session)
+                battery_buffer.set(vehicle.id, new_charge)
                 
                 return session
             else:
@@ -89,6 +111,25 @@ def add_log(
     Returns:
         schemas.ChargingSessionBase: Created session
     """
+    # Lock the vehicle row so concurrent starts for the same vehicle are serialized
+    vehicle = db.query(models.Vehicle.id).filter(
+        models.Vehicle.id == session_data.vehicle_id
+    ).with_for_update().first()
+    if not vehicle:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Vehicle not found")
+
+    active_session = db.query(models.ChargingSession.id).filter(
+        models.ChargingSession.vehicle_id == session_data.vehicle_id,
+        models.ChargingSession.status == "IN_PROGRESS"
+    ).first()
+    if active_session:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Vehicle already has an active charging session"
+        )
+
     try:
         new_session = models.ChargingSession(
             user_id=str(current_user.id),
@@ -102,6 +143,14 @@ def add_log(
         )
         
         db.add(new_session)
+        db.flush()
+        record_event(db, SESSION_STARTED, new_session.id, {
+            "session_id": new_session.id,
+            "user_id": new_session.user_id,
+            "vehicle_id": new_session.vehicle_id,
+            "port_id": new_session.port_id,
+            "start_time": new_session.start_time,
+        })
         db.commit()
         db.refresh(new_session)
         
@@ -141,23 +190,33 @@ def stop_charging_session_endpoint(
             )
 
         # Get vehicle
-        vehicle = db.query(models.Vehicle).filter(models.Vehicle.id == session.vehicle_id).first()
-        if not vehicle:
+        vehicle_exists = db.query(models.Vehicle.id).filter(models.Vehicle.id == session.vehicle_id).first()
+        if not vehicle_exists:
             raise HTTPException(status_code=404, detail="Vehicle not found")
 
-        # Update vehicle capacity
-        vehicle.current_battery_capacity_kw = new_capacity
-
         # Update session with values from frontend
         session.end_time = datetime.utcnow()
         session.status = "COMPLETED"
         session.energy_used_kwh = energy_used or 0
         session.total_cost = total_cost or 0
+        record_event(db, SESSION_STOPPED, session.id, {
+            "session_id": session.id,
+            "user_id": session.user_id,
+            "vehicle_id": session.vehicle_id,
+            "port_id": session.port_id,
+            "start_time": session.start_time,
+            "end_time": session.end_time,
+            "energy_used_kwh": session.energy_used_kwh,
+            "total_cost": session.total_cost,
+            "current_battery_capacity_kw": float(new_capacity),
+        })
 
         db.commit()
-        db.refresh(vehicle)
         db.refresh(session)
 
+        # Update vehicle capacity (coalesced, flushed in the background)
+        battery_buffer.set(session.vehicle_id, float(new_capacity))
+
         return session
 
     except HTTPException:
@@ -172,23 +231,35 @@ def stop_charging_session_endpoint(
 
 @router.get("/", response_model=List[schemas.ChargingSessionOut])
 async def get_charging_sessions(
-    current_user: models.User = Depends(get_current_user),
-    db: Session = Depends(get_db)
+    from_time: Optional[datetime] = None,
+    to_time: Optional[datetime] = None,
+    fields: Optional[str] = None,
+    current_user: models.User = Depends(get_current_reader),
+    db: Session = Depends(get_read_db)
 ):
+    """
+    Retrieves the current user's charging sessions started in a time range
+    Args:
+        from_time: Earliest start_time, unbounded by default
+        to_time: Latest start_time, unbounded by default
+        fields: Comma separated fields to return, all by default
+        current_user: Currently authenticated user
+        db: Database session
+    Returns:
+        List[schemas.ChargingSessionOut]: Sessions in the range
+    Raises:
+        HTTPException: When fields names an unknown field
+    """
+    schema = sparse_schema(schemas.ChargingSessionOut, fields)
     try:
-        # Update the query to explicitly select all columns
-        sessions = db.query(models.ChargingSession).filter(
-            models.ChargingSession.user_id == str(current_user.id)  # Ensure user_id is string
-        ).all()
-        
-        # Add debug logging
-        logger.info(f"Query result: {sessions}")
-        for session in sessions:
-            logger.info(f"Session ID: {session.id}")
-            logger.info(f"Vehicle ID: {session.vehicle_id}")
-            logger.info(f"Port ID: {session.port_id}")
-            
-        return sessions
+        filters = [models.ChargingSession.user_id == str(current_user.id)]  # Ensure user_id is string
+        if from_time is not None:
+            filters.append(models.ChargingSession.start_time >= from_time)
+        if to_time is not None:
+            filters.append(models.ChargingSession.start_time < to_time)
+
+        sessions = fetch(db, select_rows(schema, models.ChargingSession).where(*filters))
+        return json_list_response(schema, sessions)
         
     except Exception as e:
         logger.error(f"Error fetching charging sessions: {str(e)}")
@@ -199,10 +270,70 @@ async def get_charging_sessions(
             detail=f"Failed to fetch charging sessions: {str(e)}"
         )
 
+@router.get("/export")
+def export_charging_sessions(
+    request: Request,
+    from_time: Optional[datetime] = None,
+    to_time: Optional[datetime] = None,
+    current_user: models.User = Depends(get_current_reader)
+):
+    """
+    Exports the current user's charging sessions as CSV, including archived months
+    Args:
+        request: Incoming request, used for read replica routing
+        from_time: Earliest start_time, unbounded by default
+        to_time: Latest start_time, unbounded by default
+        current_user: Currently authenticated user
+    Returns:
+        StreamingResponse: CSV document ordered by start_time
+    """
+    user_id = str(current_user.id)
+    filters = [models.ChargingSession.user_id == user_id]
+    if from_time is not None:
+        filters.append(models.ChargingSession.start_time >= from_time)
+    if to_time is not None:
+        filters.append(models.ChargingSession.start_time < to_time)
+    statement = (
+        select(*(getattr(models.ChargingSession, name) for name in EXPORT_COLUMNS))
+        .where(*filters)
+        .order_by(models.ChargingSession.start_time)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    def start_key(row):
+        return row.start_time if row.start_time.tzinfo else row.start_time.replace(tzinfo=timezone.utc)
+
+    def generate():
+        # The request's own session is closed before the body is sent
+        db = open_read_session(request)
+        try:
+            live = db.execute(statement)
+            # Unpaid sessions are never archived, so both sources can overlap in time
+            archived = iter_archived_sessions(from_time, to_time, user_id=user_id)
+            rows = unique_sessions(heapq.merge(archived, live, key=start_key), key=start_key)
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(EXPORT_COLUMNS)
+            for row in rows:
+                writer.writerow([getattr(row, name) for name in EXPORT_COLUMNS])
+                if buffer.tell() >= EXPORT_CHUNK_SIZE:
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+            yield buffer.getvalue()
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        generate(),
+        media_type="text/csv",
+        headers={"Content-Disposition": 'attachment; filename="charging_sessions.csv"'}
+    )
+
 @router.get("/active", response_model=schemas.ChargingSessionBase)
 def get_active_session(
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader)
 ):
     session = db.query(models.ChargingSession).filter(
         models.ChargingSession.user_id == current_user.id,
@@ -220,18 +351,20 @@ def get_active_session(
 @router.get("/active/{port_id}", response_model=List[schemas.ChargingSessionOut])
 def get_active_sessions_for_port(
     port_id: int,
-    db: Session = Depends(get_db),
-    current_user: models.User = Depends(get_current_user)
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader)
 ):
-    active_sessions = db.query(models.ChargingSession).filter(
+    schema = sparse_schema(schemas.ChargingSessionOut, fields)
+    active_sessions = fetch(db, select_rows(schema, models.ChargingSession).where(
         models.ChargingSession.port_id == port_id,
         models.ChargingSession.status == "IN_PROGRESS"
-    ).all()
+    ))
     
-    return active_sessions
+    return json_list_response(schema, active_sessions)
 
 @router.get("/{session_id}", response_model=schemas.ChargingSessionBase)
-def get_session(session_id: int, db: Session = Depends(get_db)):
+def get_session(session_id: int, db: Session = Depends(get_read_db)):
     session = db.query(models.ChargingSession).filter(models.ChargingSession.id == session_id).first()
     if not session:
         raise HTTPException(status_code=404, detail="Session not found")
@@ -267,16 +400,12 @@ def update_session_state(
         session.energy_used_kwh = float(session_update.energy_used_kwh)
         session.total_cost = float(session_update.total_cost)
         
-        # If current_battery_level is provided, update vehicle battery level
-        if session_update.current_battery_level is not None:
-            vehicle = db.query(models.Vehicle).filter(
-                models.Vehicle.id == session.vehicle_id
-            ).first()
-            if vehicle:
-                vehicle.current_battery_capacity_kw = float(session_update.current_battery_level)
-        
         db.commit()
         db.refresh(session)
+
+        # If current_battery_level is provided, update vehicle battery level (coalesced)
+        if session_update.current_battery_level is not None:
+            battery_buffer.set(session.vehicle_id, float(session_update.current_battery_level))
             
         return session
         
@@ -1,8 +1,12 @@
-from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter
-from typing import List
+from fastapi import FastAPI, Request, Response, status, HTTPException, Depends, APIRouter
+from typing import List, Optional
 from sqlalchemy.orm import Session
 from .. import models, schemas
-from ..database import engine, get_db
+from ..database import get_db
+from ..cache import notify, STATION, PORT
+from ..http_cache import conditional_response
+from ..serialization import json_list_bytes, sparse_schema
+from ..read_models import fetch, select_rows
 
 router = APIRouter(
     prefix="/stations",
@@ -21,41 +25,57 @@ def create_station(charging_station: schemas.ChargingStationCreate, db: Session
     """
     new_station = models.ChargingStation(**charging_station.dict())
     db.add(new_station)
+    db.flush()
+    notify(db, STATION, new_station.id)
     db.commit()
     db.refresh(new_station)
     return new_station
 
 @router.get('/{id}', response_model=schemas.ChargingStationOut)
-def get_station(id: str, db: Session = Depends(get_db)):
+def get_station(id: str, request: Request, db: Session = Depends(get_db)):
     """
-    Gets a single charging station by ID
+    Gets a single charging station by ID, served from the worker response cache
+    Misses load from the primary so a lagging replica cannot refill the
+    cache with data older than the last invalidation
     Args:
         id: Station ID
+        request: Incoming request, may carry If-None-Match
         db: Database session
     Returns:
-        schemas.ChargingStationOut: Found station
+        Response: Found station with its ETag, or 304 when unchanged
     Raises:
         HTTPException: When station is not found
     """
-    station = db.query(models.ChargingStation).filter(models.ChargingStation.id == id).first()
-    if not station:
+    def load():
+        station = db.query(models.ChargingStation).filter(models.ChargingStation.id == id).first()
+        return schemas.ChargingStationOut.model_validate(station).model_dump_json(by_alias=True).encode() if station else None
+
+    response = conditional_response(request, (STATION,), load)
+    if response is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, 
             detail=f"Station with id: {id} does not exist"
         )
-    return station
+    return response
 
 @router.get('/', response_model=List[schemas.ChargingStationOut])
-def get_all_stations(db: Session = Depends(get_db)):
+def get_all_stations(request: Request, fields: Optional[str] = None, db: Session = Depends(get_db)):
     """
-    Gets all charging stations
+    Gets all charging stations, served from the worker response cache
     Args:
+        request: Incoming request, may carry If-None-Match
+        fields: Comma separated fields to return, all by default
         db: Database session
     Returns:
-        List[schemas.ChargingStationOut]: List of all stations
+        Response: List of all stations with its ETag, or 304 when unchanged
+    Raises:
+        HTTPException: When fields names an unknown field
     """
-    stations = db.query(models.ChargingStation)
-    return stations.all()
+    schema = sparse_schema(schemas.ChargingStationOut, fields)
+    # Keyed by the validated field names, so equivalent fields= values share one entry
+    return conditional_response(request, (STATION,), lambda: json_list_bytes(
+        schema, fetch(db, select_rows(schema, models.ChargingStation))
+    ), params=tuple(schema.model_fields))
 
 @router.delete('/{id}', status_code=status.HTTP_204_NO_CONTENT)
 def delete_station(id: int, db: Session = Depends(get_db)):
@@ -79,6 +99,9 @@ def delete_station(id: int, db: Session = Depends(get_db)):
         )
 
     station_query.delete(synchronize_session=False)
+    notify(db, STATION, id)
+    # Ports of the station are removed with it
+    notify(db, PORT)
     db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
 
@@ -105,5 +128,6 @@ def update_station(id: int, updated_station: schemas.ChargingStationUpdate, db:
         )
 
     station_query.update(updated_station.dict(exclude_unset=True), synchronize_session=False)
+    notify(db, STATION, id)
     db.commit()
     return station_query.first()
\ No newline at end of file
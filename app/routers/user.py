@@ -2,7 +2,10 @@ from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter
 from typing import List
 from sqlalchemy.orm import Session
 from .. import models, schemas
-from ..database import engine, get_db
+from ..database import get_db
+from ..cache import cache, ALL, USER
+from ..serialization import json_list_response
+from ..read_models import fetch, select_rows
 
 router = APIRouter(
     prefix="/User",
@@ -12,7 +15,10 @@ router = APIRouter(
 @router.get('/{id}', response_model=schemas.UserOut)
 def get_user(id: str, db: Session = Depends(get_db)):
     """
-    Retrieves a single user by ID
+    Retrieves a single user by ID, served from the worker cache
+    Users are written by the authentication frontend, which invalidates
+    them with NOTIFY cache_invalidation, 'user:<id>'; without it entries
+    expire after the cache TTL
     Args:
         id: User ID to find
         db: Database session
@@ -21,7 +27,11 @@ def get_user(id: str, db: Session = Depends(get_db)):
     Raises:
         HTTPException: When user is not found
     """
-    user = db.query(models.User).filter(models.User.id == id).first()
+    def load():
+        user = db.query(models.User).filter(models.User.id == id).first()
+        return schemas.UserOut.model_validate(user) if user else None
+
+    user = cache.get_or_load(USER, id, load)
 
     if not user:
         raise HTTPException(
@@ -34,11 +44,11 @@ def get_user(id: str, db: Session = Depends(get_db)):
 @router.get('/', response_model=List[schemas.UserOut])
 def get_all_users(db: Session = Depends(get_db)):
     """
-    Retrieves all users from the database
+    Retrieves all users, served from the worker cache
     Args:
         db: Database session
     Returns:
         List[schemas.UserOut]: List of all users
     """
-    users = db.query(models.User)
-    return users.all()
\ No newline at end of file
+    users = cache.get_or_load(USER, ALL, lambda: fetch(db, select_rows(schemas.UserOut, models.User)))
+    return json_list_response(schemas.UserOut, users)
\ No newline at end of file
@@ -1,16 +1,32 @@
-from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter
-from typing import List
+from fastapi import FastAPI, Response, status, HTTPException, Depends, APIRouter, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from anyio import from_thread
+from pydantic import ValidationError
+from typing import AsyncIterator, Iterable, Iterator, List, Optional, Union
+import csv
+import json
+import numpy as np
 from sqlalchemy.orm import Session
 from .. import models, schemas
-from ..database import engine, get_db
-from ..routers.auth import get_current_user
-from sqlalchemy import text
+from ..database import get_db
+from ..read_routing import get_read_db
+from ..routers.auth import get_current_user, get_current_reader
+from ..battery_buffer import battery_buffer
+from ..serialization import json_list_response, sparse_schema
+from ..read_models import fetch, select_rows
+from sqlalchemy import text, insert, select
+from sqlalchemy.exc import IntegrityError
 
 router = APIRouter(
     prefix="/vehicles",
     tags=['Vehicles']
 )
 
+BULK_CHUNK_SIZE = 1000
+BULK_MAX_REPORTED_ERRORS = 1000
+BULK_MAX_LINE_BYTES = 64 * 1024
+INVALID_UTF8 = "Row is not valid UTF-8"
+
 @router.post("/", status_code=status.HTTP_201_CREATED, response_model=schemas.VehicleCreate)
 def create_vehicle(vehicle: schemas.VehicleCreate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     """
@@ -31,6 +47,221 @@ def create_vehicle(vehicle: schemas.VehicleCreate, db: Session = Depends(get_db)
 
     return new_vehicle
 
+def _check_line_length(size: int):
+    if size > BULK_MAX_LINE_BYTES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Upload lines are limited to {BULK_MAX_LINE_BYTES} bytes"
+        )
+
+def _decode(line: bytes) -> str:
+    _check_line_length(len(line))
+    # Invalid bytes survive as lone surrogates and are reported per row by _is_utf8
+    return line.decode("utf-8", errors="surrogateescape")
+
+def _is_utf8(text: str) -> bool:
+    try:
+        text.encode("utf-8")
+        return True
+    except UnicodeEncodeError:
+        return False
+
+def _iter_lines(stream: AsyncIterator[bytes]) -> Iterator[str]:
+    """
+    Splits a streamed request body into decoded lines, keeping the line endings for the CSV reader
+    Must run in a worker thread; chunks are awaited on the event loop
+    Raises:
+        HTTPException: When a line exceeds BULK_MAX_LINE_BYTES
+    """
+    buffer = b""
+    while True:
+        try:
+            chunk = from_thread.run(stream.__anext__)
+        except StopAsyncIteration:
+            break
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            yield _decode(line + b"\n")
+        # A body without newlines must not grow the buffer without limit
+        _check_line_length(len(buffer))
+    if buffer:
+        yield _decode(buffer)
+
+def _csv_rows(lines: Iterable[str]) -> Iterator[Union[dict, str]]:
+    """
+    Parses CSV lines with one reader, so quoted fields may contain newlines
+    Yields:
+        Union[dict, str]: Row keyed by the header, or an error message
+    Raises:
+        HTTPException: When the header row is missing or not valid UTF-8
+    """
+    reader = csv.reader(lines)
+    header = None
+    while True:
+        try:
+            values = next(reader)
+        except StopIteration:
+            break
+        except csv.Error as e:
+            if header is None:
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid CSV header: {str(e)}")
+            yield f"Invalid CSV: {str(e)}"
+            continue
+        if not values or not any(value.strip() for value in values):
+            continue
+        if header is None:
+            if not all(_is_utf8(value) for value in values):
+                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="CSV header is not valid UTF-8")
+            header = [name.strip() for name in values]
+        elif not all(_is_utf8(value) for value in values):
+            yield INVALID_UTF8
+        elif len(values) != len(header):
+            yield f"Expected {len(header)} columns, got {len(values)}"
+        else:
+            yield {name: (value if value != "" else None) for name, value in zip(header, values)}
+
+def _ndjson_rows(lines: Iterable[str]) -> Iterator[Union[dict, str]]:
+    """
+    Parses NDJSON lines
+    Yields:
+        Union[dict, str]: Row object, or an error message
+    """
+    for line in lines:
+        if not line.strip():
+            continue
+        if not _is_utf8(line):
+            yield INVALID_UTF8
+            continue
+        try:
+            raw = json.loads(line)
+            yield raw if isinstance(raw, dict) else "Row must be a JSON object"
+        except ValueError as e:
+            yield f"Invalid JSON: {str(e)}"
+
+def _insert_vehicle_chunk(db: Session, user_id: str, chunk: List[tuple], report: schemas.VehicleBulkReport):
+    """
+    Validates and inserts a chunk of uploaded rows
+    Args:
+        db: Database session
+        user_id: Owner of the uploaded vehicles
+        chunk: (row number, raw row dict or parse error) pairs
+        report: Report updated in place
+    Raises:
+        IntegrityError: When a row violates a constraint other than the unique license plate
+    """
+    def reject(row_number: int, license_plate: Optional[str], error: str):
+        report.failed += 1
+        if len(report.errors) < BULK_MAX_REPORTED_ERRORS:
+            report.errors.append(schemas.VehicleBulkError(row=row_number, license_plate=license_plate, error=error))
+        else:
+            report.errors_truncated = True
+
+    valid = {}
+    for row_number, raw in chunk:
+        if isinstance(raw, str):
+            reject(row_number, None, raw)
+            continue
+        try:
+            vehicle = schemas.VehicleCreate(**{**raw, "user_id": user_id})
+        except ValidationError as e:
+            error = "; ".join(f"{'.'.join(map(str, err['loc']))}: {err['msg']}" for err in e.errors())
+            reject(row_number, raw.get("license_plate"), error)
+            continue
+        if vehicle.license_plate in valid:
+            reject(row_number, vehicle.license_plate, "Duplicate license plate in upload")
+            continue
+        valid[vehicle.license_plate] = (row_number, vehicle)
+
+    if valid:
+        existing = set(db.scalars(
+            select(models.Vehicle.license_plate).where(models.Vehicle.license_plate.in_(list(valid)))
+        ))
+        for license_plate in sorted(existing, key=lambda plate: valid[plate][0]):
+            row_number, _ = valid.pop(license_plate)
+            reject(row_number, license_plate, "License plate already registered")
+
+    if not valid:
+        return
+    try:
+        db.execute(insert(models.Vehicle), [
+            vehicle.dict(exclude={"id", "created_at"}) for _, vehicle in valid.values()
+        ])
+        db.commit()
+        report.inserted += len(valid)
+        return
+    except IntegrityError:
+        db.rollback()
+
+    # A concurrent upload registered some of the plates after the check above
+    for license_plate, (row_number, vehicle) in valid.items():
+        try:
+            db.execute(insert(models.Vehicle), [vehicle.dict(exclude={"id", "created_at"})])
+            db.commit()
+            report.inserted += 1
+        except IntegrityError:
+            db.rollback()
+            registered = db.scalar(
+                select(models.Vehicle.id).where(models.Vehicle.license_plate == license_plate)
+            )
+            if registered is None:
+                # Not a plate conflict (e.g. a foreign key violation) - do not hide it as one
+                raise
+            reject(row_number, license_plate, "License plate already registered")
+
+@router.post("/bulk", response_model=schemas.VehicleBulkReport)
+async def create_vehicles_bulk(request: Request, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    """
+    Registers vehicles from a streamed NDJSON or CSV upload
+    The body is parsed incrementally and inserted in chunks, so memory stays
+    bounded regardless of the upload size. Each chunk is committed separately
+    Args:
+        request: Request with an application/x-ndjson or text/csv body
+        db: Database session
+        current_user: Currently authenticated user
+    Returns:
+        schemas.VehicleBulkReport: Number of inserted vehicles and per-row errors
+    Raises:
+        HTTPException: When the content type is not supported, a line is too long or the CSV header is invalid
+    """
+    content_type = request.headers.get("content-type", "")
+    if "csv" in content_type:
+        is_csv = True
+    elif "json" in content_type:
+        is_csv = False
+    else:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Upload must be application/x-ndjson or text/csv"
+        )
+
+    return await run_in_threadpool(_import_vehicles, request.stream(), is_csv, db, current_user.id)
+
+def _import_vehicles(stream: AsyncIterator[bytes], is_csv: bool, db: Session, user_id: str) -> schemas.VehicleBulkReport:
+    """
+    Parses an upload in a worker thread and inserts it chunk by chunk
+    Args:
+        stream: Request body stream
+        is_csv: CSV upload, NDJSON otherwise
+        db: Database session
+        user_id: Owner of the uploaded vehicles
+    Returns:
+        schemas.VehicleBulkReport: Number of inserted vehicles and per-row errors
+    """
+    report = schemas.VehicleBulkReport()
+    lines = _iter_lines(stream)
+    chunk = []
+    for row_number, raw in enumerate(_csv_rows(lines) if is_csv else _ndjson_rows(lines), start=1):
+        chunk.append((row_number, raw))
+        if len(chunk) >= BULK_CHUNK_SIZE:
+            _insert_vehicle_chunk(db, user_id, chunk, report)
+            chunk = []
+
+    if chunk:
+        _insert_vehicle_chunk(db, user_id, chunk, report)
+
+    return report
+
 @router.put("/{license_plate}", response_model=schemas.VehicleOut)
 def update_vehicle(license_plate: str, vehicle_update: schemas.VehicleUpdate, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     """
@@ -60,16 +291,102 @@ def update_vehicle(license_plate: str, vehicle_update: schemas.VehicleUpdate, db
         )
     
     update_data = vehicle_update.dict(exclude_unset=True)
+    if "current_battery_capacity_kw" in update_data:
+        # Before the UPDATE is flushed: discard waits for an in-flight flush that needs the row lock
+        battery_buffer.discard(vehicle.id)
     for key, value in update_data.items():
         setattr(vehicle, key, value)
     
     db.commit()
     db.refresh(vehicle)
+    battery_buffer.apply([vehicle])
     
     return vehicle
 
+@router.get('/fleet/projection', response_model=List[schemas.VehicleProjection])
+def get_fleet_projection(
+    port_id: Optional[int] = None,
+    target_soc: float = Query(1.0, gt=0, le=1),
+    soc_threshold: float = Query(0.3, ge=0, le=1),
+    limit: Optional[int] = Query(None, gt=0),
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader)
+):
+    """
+    Projects state of charge and charging time for all vehicles of the current user
+    The vehicle columns are loaded into arrays and computed in one vectorized pass
+    Args:
+        port_id: Port to charge at, limits power to the port's power_kw
+        target_soc: Target charge level as a fraction of usable capacity
+        soc_threshold: Charge level below which a vehicle needs charging
+        limit: Maximum number of vehicles returned
+        db: Database session
+        current_user: Currently authenticated user
+    Returns:
+        List[schemas.VehicleProjection]: Vehicles sorted by urgency, lowest charge first
+    Raises:
+        HTTPException: When the port is not found
+    """
+    port_power = np.inf
+    if port_id is not None:
+        port = db.query(models.ChargingPort.power_kw).filter(models.ChargingPort.id == port_id).first()
+        if not port:
+            raise HTTPException(status_code=404, detail="Port not found")
+        port_power = float(port.power_kw)
+
+    rows = db.query(
+        models.Vehicle.id,
+        models.Vehicle.license_plate,
+        models.Vehicle.battery_capacity_kwh,
+        models.Vehicle.battery_condition,
+        models.Vehicle.max_charging_powerkwh,
+        models.Vehicle.current_battery_capacity_kw
+    ).filter(models.Vehicle.user_id == current_user.id).all()
+    if not rows:
+        return []
+
+    ids, plates, capacity, condition, max_power, current = zip(*rows)
+    pending = battery_buffer.pending()
+    if pending:
+        current = [pending.get(vehicle_id, value) for vehicle_id, value in zip(ids, current)]
+    capacity = np.array(capacity, dtype=float)
+    condition = np.array(condition, dtype=float)
+    max_power = np.array(max_power, dtype=float)
+    current = np.nan_to_num(np.array(current, dtype=float))
+
+    # battery_condition is stored either as a fraction or as a percentage
+    condition = np.where(np.isnan(condition), 1.0, condition)
+    condition = np.clip(np.where(condition > 1, condition / 100, condition), 0, 1)
+    usable = np.nan_to_num(capacity) * condition
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        soc = np.clip(np.where(usable > 0, current / usable, np.nan), 0, 1)
+        needed = np.maximum(usable * target_soc - current, 0.0)
+        power = np.minimum(max_power, port_power)
+        power = np.where(power > 0, power, np.nan)
+        hours = needed / power
+
+    # Lowest charge first, longer charging time breaks ties, unknown capacity last
+    order = np.lexsort((-np.nan_to_num(hours, nan=np.inf), soc))
+    if limit is not None:
+        order = order[:limit]
+
+    return json_list_response(schemas.VehicleProjection, [
+        {
+            "id": ids[i],
+            "license_plate": plates[i],
+            "state_of_charge": None if np.isnan(soc[i]) else round(float(soc[i]), 4),
+            "usable_capacity_kwh": round(float(usable[i]), 3),
+            "energy_needed_kwh": round(float(needed[i]), 3),
+            "charging_power_kw": None if np.isnan(power[i]) else float(power[i]),
+            "hours_to_full": None if np.isnan(hours[i]) else round(float(hours[i]), 3),
+            "needs_charging": bool(soc[i] < soc_threshold)
+        }
+        for i in order.tolist()
+    ])
+
 @router.get('/{id}', response_model=schemas.VehicleOut)
-def get_vehicle(id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_vehicle(id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
     """
     Retrieves a single vehicle
     Args:
@@ -89,20 +406,36 @@ def get_vehicle(id: int, db: Session = Depends(get_db), current_user: models.Use
             detail=f"Vehicle with id: {id} does not exist"
         )
     
+    battery_buffer.apply([vehicle])
     return vehicle
 
 @router.get('/', response_model=List[schemas.VehicleOut])
-def get_all_vehicles(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_all_vehicles(
+    fields: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+    current_user: models.User = Depends(get_current_reader)
+):
     """
     Retrieves all vehicles for the current user
     Args:
+        fields: Comma separated fields to return, all by default
         db: Database session
         current_user: Currently authenticated user
     Returns:
         List[schemas.VehicleOut]: List of user's vehicles
+    Raises:
+        HTTPException: When fields names an unknown field
     """
-    vehicles = db.query(models.Vehicle).filter(models.Vehicle.user_id == current_user.id).all()
-    return vehicles
+    schema = sparse_schema(schemas.VehicleOut, fields)
+    statement = select_rows(schema, models.Vehicle).where(models.Vehicle.user_id == current_user.id)
+    with_battery = "current_battery_capacity_kw" in schema.model_fields
+    if with_battery and "id" not in schema.model_fields:
+        # Pending battery levels are matched by vehicle ID
+        statement = statement.add_columns(models.Vehicle.id)
+    vehicles = fetch(db, statement)
+    if with_battery:
+        battery_buffer.apply_rows(vehicles)
+    return json_list_response(schema, vehicles)
 
 @router.patch("/{vehicle_id}/capacity")
 def update_vehicle_capacity(
@@ -113,6 +446,7 @@ def update_vehicle_capacity(
 ):
     """
     Updates vehicle battery capacity
+    The write is coalesced with other battery updates and flushed in the background
     Args:
         vehicle_id: Vehicle ID
         capacity_update: New capacity data
@@ -140,9 +474,7 @@ def update_vehicle_capacity(
                 detail=f"Invalid battery capacity value. Must be between 0 and {vehicle.battery_capacity_kwh}"
             )
             
-        vehicle.current_battery_capacity_kw = new_capacity
-        db.commit()
-        db.refresh(vehicle)
+        battery_buffer.set(vehicle.id, new_capacity)
         
         return {
             "id": vehicle.id,
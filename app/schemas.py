@@ -1,7 +1,8 @@
 from pydantic import BaseModel, EmailStr
 from pydantic.types import conint
 from datetime import datetime, date
-from typing import Optional
+from typing import Optional, List
+from pydantic import Field
 from .models import UserRoleEnum
 
 class Token(BaseModel):
@@ -102,6 +103,46 @@ class VehicleOut(VehicleBase):
     class Config:
         from_attributes = True
 
+class VehicleBulkError(BaseModel):
+    """Rejected row of a bulk vehicle upload"""
+    row: int
+    license_plate: Optional[str] = None
+    error: str
+
+class VehicleBulkReport(BaseModel):
+    """
+    Bulk vehicle upload report
+    Attributes:
+        inserted: Number of vehicles created
+        failed: Number of rejected rows
+        errors: Per-row errors, capped at the first rejected rows
+        errors_truncated: Whether more rows failed than are listed
+    """
+    inserted: int = 0
+    failed: int = 0
+    errors: List[VehicleBulkError] = []
+    errors_truncated: bool = False
+
+class VehicleProjection(BaseModel):
+    """
+    Fleet battery and charging time projection for a single vehicle
+    Attributes:
+        state_of_charge: Current charge as a fraction of usable capacity, None when capacity is unknown
+        usable_capacity_kwh: Capacity adjusted by battery condition
+        energy_needed_kwh: Energy missing to the target charge level
+        charging_power_kw: Effective charging power at the chosen port
+        hours_to_full: Charging time to the target level, None when power is unknown
+        needs_charging: Whether the charge is below the threshold
+    """
+    id: int
+    license_plate: str
+    state_of_charge: Optional[float] = None
+    usable_capacity_kwh: float
+    energy_needed_kwh: float
+    charging_power_kw: Optional[float] = None
+    hours_to_full: Optional[float] = None
+    needs_charging: bool
+
 class ChargingStationBase(BaseModel):
     """Base charging station schema"""
     name: str
@@ -145,7 +186,7 @@ class ChargingPortUpdate(BaseModel):
     status: str | None = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class ChargingPortOut(BaseModel):
     """Charging port response schema"""
@@ -156,7 +197,7 @@ class ChargingPortOut(BaseModel):
     last_service_date: Optional[date] = None
 
     class Config:
-        orm_mode = True
+        from_attributes = True
 
 class ChargingSessionBase(BaseModel):
     """Base charging session schema"""
@@ -231,11 +272,34 @@ class PaymentOut(BaseModel):
     transaction_id: int
     payment_method: str
     created_at: datetime
-    charging_session: ChargingSessionBase
+    charging_session: Optional[ChargingSessionBase] = None
 
     class Config:
         from_attributes = True
 
+class PaymentBatchCreate(BaseModel):
+    """
+    Batch payment schema for fleet customers
+    Attributes:
+        session_ids: Charging sessions to pay for
+        transaction_id: External payment reference shared by the batch
+        payment_method: Method of payment
+    """
+    session_ids: List[int] = Field(min_length=1, max_length=1000)
+    transaction_id: int
+    payment_method: str
+
+class PaymentBatchItem(BaseModel):
+    """Per-session result of a batch payment"""
+    session_id: int
+    payment_id: Optional[int] = None
+    error: Optional[str] = None
+
+class PaymentBatchOut(BaseModel):
+    """Batch payment response schema"""
+    succeeded: List[PaymentBatchItem]
+    failed: List[PaymentBatchItem]
+
 
 class DiscountIn(BaseModel):
     code: str 
@@ -251,4 +315,4 @@ class DiscountOut(BaseModel):
     created_at: datetime
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        from_attributes = True
\ No newline at end of file
@@ -0,0 +1,106 @@
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple, Type
+from fastapi import HTTPException, Response, status
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+
+"""
+Fast JSON path for list responses
+For a returned list FastAPI validates every item against response_model,
+converts the result with jsonable_encoder and then encodes it. List routes
+instead validate their rows with a precompiled TypeAdapter and let
+pydantic-core write the JSON bytes in one call; response_model stays on
+the route for the OpenAPI schema. A fields= query parameter narrows a
+list to a subset of the schema; each subset becomes its own schema
+class, so select_rows() projects only its columns and its adapter is
+compiled once. Subsets are kept in a small LRU, so clients cycling through
+field combinations cannot grow memory without bound; the field names of
+the returned schema are the normalized form of fields=
+"""
+
+FIELDS_SEPARATOR = ","
+MAX_SUBSETS = 256
+
+_adapters: Dict[type, TypeAdapter] = {}
+# Keys are validated and in schema order; evicted subsets drop their adapter too
+_subsets: "OrderedDict[Tuple[type, Tuple[str, ...]], type]" = OrderedDict()
+_subsets_lock = threading.Lock()
+
+def list_adapter(schema: type) -> TypeAdapter:
+    """
+    Returns the cached TypeAdapter for List[schema]
+    Args:
+        schema: Pydantic response schema
+    Returns:
+        TypeAdapter: Adapter building and serializing the list
+    """
+    adapter = _adapters.get(schema)
+    if adapter is None:
+        adapter = _adapters[schema] = TypeAdapter(List[schema])
+    return adapter
+
+def sparse_schema(schema: Type[BaseModel], fields: Optional[str]) -> Type[BaseModel]:
+    """
+    Narrows a response schema to the fields requested by the client
+    Args:
+        schema: Pydantic response schema of one item
+        fields: Comma separated field names, None or empty for all fields
+    Returns:
+        Type[BaseModel]: Schema with only the requested fields, or schema itself
+    Raises:
+        HTTPException: When a requested field is not part of the schema
+    """
+    if not fields:
+        return schema
+    requested = {name.strip() for name in fields.split(FIELDS_SEPARATOR) if name.strip()}
+    unknown = requested - schema.model_fields.keys()
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(sorted(unknown))}. Allowed fields: {', '.join(schema.model_fields)}"
+        )
+    names = tuple(name for name in schema.model_fields if name in requested)
+    if not names or len(names) == len(schema.model_fields):
+        return schema
+
+    with _subsets_lock:
+        subset = _subsets.get((schema, names))
+        if subset is not None:
+            _subsets.move_to_end((schema, names))
+            return subset
+    subset = create_model(
+        f"{schema.__name__}Fields",
+        __config__=ConfigDict(from_attributes=True),
+        **{name: (schema.model_fields[name].annotation, schema.model_fields[name]) for name in names}
+    )
+    with _subsets_lock:
+        subset = _subsets.setdefault((schema, names), subset)
+        _subsets.move_to_end((schema, names))
+        while len(_subsets) > MAX_SUBSETS:
+            _, evicted = _subsets.popitem(last=False)
+            _adapters.pop(evicted, None)
+    return subset
+
+def json_list_bytes(schema: type, items: Iterable) -> bytes:
+    """
+    Serializes ORM objects, dicts or schema instances as JSON list bytes
+    Args:
+        schema: Pydantic response schema of one item
+        items: Items to serialize
+    Returns:
+        bytes: Encoded list
+    """
+    adapter = list_adapter(schema)
+    return adapter.dump_json(adapter.validate_python(items, from_attributes=True), by_alias=True)
+
+def json_list_response(schema: type, items: Iterable, status_code: int = status.HTTP_200_OK) -> Response:
+    """
+    Serializes ORM objects, dicts or schema instances as a JSON list
+    Args:
+        schema: Pydantic response schema of one item
+        items: Items to serialize
+        status_code: Response status
+    Returns:
+        Response: application/json response with the encoded list
+    """
+    return Response(content=json_list_bytes(schema, items), status_code=status_code, media_type="application/json")
@@ -0,0 +1,230 @@
+import hashlib
+import logging
+import queue
+import re
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Optional
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from .config import settings
+from .query_stats import current_stats
+
+"""
+Slow-query log with EXPLAIN capture
+Statements running longer than the threshold are kept in a bounded ring
+buffer, one entry per statement fingerprint. Parameter values are
+redacted before they are stored. On PostgreSQL a background thread runs
+EXPLAIN for the first occurrence of each fingerprint, outside the request
+that hit the slow statement
+"""
+
+logger = logging.getLogger(__name__)
+
+EXPLAINABLE = ("select", "insert", "update", "delete", "with")
+
+_WHITESPACE = re.compile(r"\s+")
+_PLACEHOLDER = r"(?:%\(\w+\)s|\?|\$\d+|%s|:\w+)"
+# Expanded IN lists differ only in their number of placeholders
+_IN_LIST = re.compile(rf"\bIN\s*\((?:\s*{_PLACEHOLDER}\s*,)*\s*{_PLACEHOLDER}\s*\)", re.IGNORECASE)
+
+def fingerprint(statement: str) -> str:
+    """
+    Normalizes a SQL statement to its shape
+    Args:
+        statement: SQL text with placeholders
+    Returns:
+        str: Short hash identifying the statement shape
+    """
+    normalized = _IN_LIST.sub("IN (...)", _WHITESPACE.sub(" ", statement).strip())
+    return hashlib.sha1(normalized.encode()).hexdigest()[:16]
+
+def _redact_value(value: Any) -> str:
+    return "NULL" if value is None else f"<{type(value).__name__}>"
+
+def redact(parameters: Any) -> Any:
+    """
+    Replaces bound parameter values with their type names
+    Args:
+        parameters: DBAPI parameters (mapping, sequence or a list of them for executemany)
+    Returns:
+        Any: Parameters of the same layout without values
+    """
+    if isinstance(parameters, dict):
+        return {key: _redact_value(value) for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (dict, list, tuple)):
+            return {"executemany": len(parameters), "first": redact(parameters[0])}
+        return [_redact_value(value) for value in parameters]
+    return parameters
+
+class SlowQuery:
+    """
+    Slow statements sharing one fingerprint
+    Attributes:
+        fingerprint: Hash of the normalized statement
+        statement: SQL text of the latest occurrence
+        parameters: Redacted parameters of the latest occurrence
+        route: Route template that ran the latest occurrence, None outside requests
+        count: Number of slow executions
+        last_ms: Duration of the latest occurrence
+        max_ms: Longest duration
+        total_ms: Summed duration of all slow executions
+        last_seen: Time of the latest occurrence
+        plan: EXPLAIN output, None until captured or when unavailable
+    """
+
+    def __init__(self, fingerprint: str, statement: str):
+        self.fingerprint = fingerprint
+        self.statement = statement
+        self.parameters = None
+        self.route = None
+        self.count = 0
+        self.last_ms = 0.0
+        self.max_ms = 0.0
+        self.total_ms = 0.0
+        self.last_seen = None
+        self.plan: Optional[str] = None
+
+    def as_dict(self) -> dict:
+        return {
+            "fingerprint": self.fingerprint,
+            "statement": self.statement,
+            "parameters": self.parameters,
+            "route": self.route,
+            "count": self.count,
+            "last_ms": round(self.last_ms, 3),
+            "max_ms": round(self.max_ms, 3),
+            "avg_ms": round(self.total_ms / self.count, 3),
+            "last_seen": self.last_seen.isoformat(),
+            "plan": self.plan,
+        }
+
+class SlowQueryLog:
+    """
+    Ring buffer of slow statements, deduplicated by fingerprint
+    Attributes:
+        threshold_ms: Duration above which a statement is recorded
+        max_entries: Maximum number of fingerprints kept, least recently seen are dropped
+        explain: Capture EXPLAIN plans on PostgreSQL
+    """
+
+    def __init__(self, threshold_ms: float = 200, max_entries: int = 100, explain: bool = True):
+        self.threshold_ms = threshold_ms
+        self.max_entries = max_entries
+        self.explain = explain
+        self._entries: "OrderedDict[str, SlowQuery]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._explains: "queue.Queue" = queue.Queue(maxsize=100)
+        self._explainer: Optional[threading.Thread] = None
+
+    def instrument(self, engine: Engine):
+        """
+        Registers the cursor execution hooks on an engine
+        Args:
+            engine: SQLAlchemy engine
+        """
+        if not event.contains(engine, "before_cursor_execute", self._before_cursor_execute):
+            event.listen(engine, "before_cursor_execute", self._before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._slow_query_start = time.perf_counter()
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, "_slow_query_start", None)
+        if start is None:
+            return
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms >= self.threshold_ms and not conn.info.get("slow_query_explain"):
+            stats = current_stats.get()
+            self.record(conn.engine, statement, parameters, executemany, elapsed_ms, stats.route if stats else None)
+
+    def record(self, engine: Engine, statement: str, parameters: Any, executemany: bool, elapsed_ms: float,
+               route: Optional[str] = None):
+        """
+        Records one slow execution and queues its EXPLAIN for a new fingerprint
+        Args:
+            engine: Engine that ran the statement
+            statement: SQL text with placeholders
+            parameters: DBAPI parameters, only passed on to EXPLAIN
+            executemany: Whether the statement ran with a list of parameter sets
+            elapsed_ms: Duration in milliseconds
+            route: Route template of the request
+        """
+        key = fingerprint(statement)
+        with self._lock:
+            entry = self._entries.get(key)
+            is_new = entry is None
+            if is_new:
+                entry = self._entries[key] = SlowQuery(key, statement)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            entry.statement = statement
+            entry.parameters = redact(parameters)
+            entry.route = route
+            entry.count += 1
+            entry.last_ms = elapsed_ms
+            entry.max_ms = max(entry.max_ms, elapsed_ms)
+            entry.total_ms += elapsed_ms
+            entry.last_seen = datetime.now(timezone.utc)
+
+        logger.warning(f"Slow query {key} ({elapsed_ms:.1f} ms, route {route}): {_WHITESPACE.sub(' ', statement)[:200]}")
+        if is_new and self.explain and not executemany and engine.dialect.name == "postgresql" \
+                and statement.lstrip().lower().startswith(EXPLAINABLE):
+            self._queue_explain(engine, key, statement, parameters)
+
+    def entries(self) -> list:
+        """
+        Returns the recorded statements, most recently seen first
+        Returns:
+            list: One dict per fingerprint
+        """
+        with self._lock:
+            return [entry.as_dict() for entry in reversed(self._entries.values())]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _queue_explain(self, engine: Engine, key: str, statement: str, parameters: Any):
+        try:
+            self._explains.put_nowait((engine, key, statement, parameters))
+        except queue.Full:
+            return
+        if self._explainer is None or not self._explainer.is_alive():
+            self._explainer = threading.Thread(target=self._explain_loop, name="slow-query-explain", daemon=True)
+            self._explainer.start()
+
+    def _explain_loop(self):
+        while True:
+            engine, key, statement, parameters = self._explains.get()
+            try:
+                plan = self._run_explain(engine, statement, parameters)
+            except Exception as e:
+                plan = f"EXPLAIN failed: {str(e)}"
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry.plan = plan
+
+    def _run_explain(self, engine: Engine, statement: str, parameters: Any) -> str:
+        with engine.connect() as connection:
+            # Keeps the EXPLAIN itself out of the log
+            connection.info["slow_query_explain"] = True
+            try:
+                rows = connection.exec_driver_sql(f"EXPLAIN (ANALYZE off) {statement}", parameters).all()
+                connection.rollback()
+            finally:
+                connection.info.pop("slow_query_explain", None)
+        return "\n".join(row[0] for row in rows)
+
+slow_query_log = SlowQueryLog(
+    threshold_ms=settings.slow_query_ms,
+    max_entries=settings.slow_query_log_size,
+    explain=settings.slow_query_explain,
+)
@@ -0,0 +1,86 @@
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List
+from fastapi.responses import JSONResponse, ORJSONResponse
+from fastapi.routing import serialize_response
+from fastapi.utils import create_model_field
+from app import models, schemas
+from app.serialization import json_list_response
+
+"""
+Compares the serialization cost of large list responses
+Each variant turns the same ORM objects into JSON response bytes:
+  fastapi-json    response_model validation + jsonable_encoder + json.dumps (previous default)
+  fastapi-orjson  response_model validation + jsonable_encoder + orjson (new default response class)
+  typeadapter     precompiled TypeAdapter validation and pydantic-core JSON (list fast path)
+Usage:
+    python -m scripts.benchmark_serialization [--rows 10000] [--repeat 5]
+"""
+
+def build_sessions(rows: int) -> List[models.ChargingSession]:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    return [
+        models.ChargingSession(
+            id=i, user_id=f"user-{i % 100}", vehicle_id=i % 500, port_id=i % 50,
+            start_time=start + timedelta(minutes=i), end_time=start + timedelta(minutes=i + 45),
+            energy_used_kwh=12.5 + i % 30, total_cost=20.0 + i % 17,
+            status="COMPLETED", payment_status="PAID"
+        )
+        for i in range(rows)
+    ]
+
+def build_payments(sessions: List[models.ChargingSession]) -> List[models.Payment]:
+    return [
+        models.Payment(
+            id=session.id, user_id=session.user_id, session_id=session.id, status="COMPLETED",
+            transaction_id=1_000_000 + session.id, payment_method="card",
+            created_at=session.end_time, charging_session=session
+        )
+        for session in sessions
+    ]
+
+def _fastapi(schema, items, response_class) -> bytes:
+    field = create_model_field(name="Response", type_=List[schema], mode="serialization")
+    content = asyncio.run(serialize_response(field=field, response_content=items))
+    return response_class(content).body
+
+VARIANTS = {
+    "fastapi-json": lambda schema, items: _fastapi(schema, items, JSONResponse),
+    "fastapi-orjson": lambda schema, items: _fastapi(schema, items, ORJSONResponse),
+    "typeadapter": lambda schema, items: json_list_response(schema, items).body,
+}
+
+def measure(schema, items, repeat: int) -> dict:
+    results = {}
+    for name, variant in VARIANTS.items():
+        variant(schema, items)
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            body = variant(schema, items)
+            timings.append(time.perf_counter() - start)
+        results[name] = (min(timings), len(body))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark list response serialization")
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    sessions = build_sessions(args.rows)
+    payments = build_payments(sessions)
+    for label, schema, items in [
+        ("GET /sessions/", schemas.ChargingSessionOut, sessions),
+        ("GET /payments/", schemas.PaymentOut, payments),
+    ]:
+        results = measure(schema, items, args.repeat)
+        baseline = results["fastapi-json"][0]
+        print(f"{label} ({args.rows} rows, best of {args.repeat})")
+        for name, (seconds, size) in results.items():
+            print(f"  {name:<15} {seconds * 1000:8.1f} ms  {baseline / seconds:5.1f}x  {size} bytes")
+
+if __name__ == "__main__":
+    main()
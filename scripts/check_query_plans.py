@@ -0,0 +1,82 @@
+import sys
+import json
+from sqlalchemy import select, text
+from app import models
+from app.database import init_engine
+
+"""
+Checks EXPLAIN plans of the hot queries against the migrated database
+Sequential scans are disabled for the check, so a remaining Seq Scan on
+the queried table means no index can serve the query
+Usage:
+    alembic upgrade head && python -m scripts.check_query_plans
+"""
+
+HOT_QUERIES = {
+    "sessions by user": select(models.ChargingSession).where(
+        models.ChargingSession.user_id == "user"
+    ),
+    "active session by user": select(models.ChargingSession).where(
+        models.ChargingSession.user_id == "user",
+        models.ChargingSession.status == "IN_PROGRESS"
+    ),
+    "active sessions by port": select(models.ChargingSession).where(
+        models.ChargingSession.port_id == 1,
+        models.ChargingSession.status == "IN_PROGRESS"
+    ),
+    "active session by vehicle": select(models.ChargingSession).where(
+        models.ChargingSession.vehicle_id == 1,
+        models.ChargingSession.status == "IN_PROGRESS"
+    ),
+    "payments by user": select(models.Payment.__table__).where(
+        models.Payment.user_id == "user"
+    ).order_by(models.Payment.created_at.desc()),
+    "vehicles by user": select(models.Vehicle).where(
+        models.Vehicle.user_id == "user"
+    ),
+    "ports by station": select(models.ChargingPort).where(
+        models.ChargingPort.station_id == 1
+    ),
+    "discount by code": select(models.Discount).where(
+        models.Discount.code == "CODE"
+    ),
+}
+
+def _seq_scans(plan: dict):
+    """Yields relation names of all Seq Scan nodes in a JSON plan"""
+    if plan.get("Node Type") == "Seq Scan":
+        yield plan.get("Relation Name")
+    for child in plan.get("Plans", []):
+        yield from _seq_scans(child)
+
+def check_plans() -> list:
+    """
+    Runs EXPLAIN for every hot query with sequential scans disabled
+    Returns:
+        list: (query name, table, plan) for every query that still scans its table
+    """
+    failures = []
+    engine = init_engine()
+    with engine.connect() as connection:
+        connection.execute(text("SET enable_seqscan = off"))
+        for name, statement in HOT_QUERIES.items():
+            table = statement.get_final_froms()[0].name
+            sql = statement.compile(engine, compile_kwargs={"literal_binds": True})
+            plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+            if isinstance(plan, str):
+                plan = json.loads(plan)
+            root = plan[0]["Plan"]
+            if table in _seq_scans(root):
+                failures.append((name, table, root))
+    return failures
+
+def main():
+    failures = check_plans()
+    for name, table, plan in failures:
+        print(f"FAIL {name}: sequential scan on {table}")
+        print(json.dumps(plan, indent=2))
+    print(f"{len(HOT_QUERIES) - len(failures)}/{len(HOT_QUERIES)} hot queries use an index")
+    sys.exit(1 if failures else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import argparse
+import asyncio
+import json
+import math
+import random
+import sys
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+import httpx
+from jose import jwt
+from app.config import settings
+from scripts.seed_dataset import discount_code, user_id
+
+"""
+HTTP load test of the charging session flow
+Every virtual user is one seeded bench user driving its own vehicle
+through the scripted scenarios below against a running server, so
+concurrent users never contend for the same vehicle. Latencies are
+grouped by route template; the report lists throughput and
+p50/p95/p99 per route and can be saved as a baseline or compared
+against one
+Usage:
+    uvicorn app.main:app --workers 4 &
+    python -m scripts.loadtest [--users 50] [--duration 60] [--baseline loadtest-baseline.json] [--save-baseline]
+"""
+
+PERCENTILES = (50, 95, 99)
+
+class Recorder:
+    """
+    Latencies and errors per route template
+    Attributes:
+        latencies: Seconds of each successful request per route
+        errors: Failed requests per route
+    """
+
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+
+    async def request(self, client: httpx.AsyncClient, route: str, method: str, url: str,
+                      expected: tuple = (200,), **kwargs) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, url, **kwargs)
+        except httpx.HTTPError:
+            self.errors[route] += 1
+            return None
+        elapsed = time.perf_counter() - start
+        if response.status_code not in expected:
+            self.errors[route] += 1
+            return None
+        self.latencies[route].append(elapsed)
+        return response
+
+async def charging_session(recorder: Recorder, client: httpx.AsyncClient, rng: random.Random,
+                           vehicle: dict, port_id: int, updates: int, **_):
+    """Start, telemetry updates and stop of one charging session"""
+    response = await recorder.request(client, "POST /sessions/start", "POST", "/sessions/start", json={
+        "vehicle_id": vehicle["id"], "port_id": port_id, "duration_minutes": 30
+    })
+    if response is None:
+        return
+    session_id = response.json()["id"]
+    capacity = vehicle["battery_capacity_kwh"] or 60
+    level = rng.uniform(0.1, 0.5) * capacity
+    energy = 0.0
+    for _ in range(updates):
+        step = rng.uniform(0.5, 2.0)
+        level, energy = min(level + step, capacity), energy + step
+        await recorder.request(client, "PATCH /sessions/{session_id}/update", "PATCH",
+                               f"/sessions/{session_id}/update", json={
+                                   "energy_used_kwh": round(energy, 2), "total_cost": round(energy * 2.5, 2),
+                                   "current_battery_level": round(level, 2)
+                               })
+    await recorder.request(client, "POST /sessions/{session_id}/stop", "POST", f"/sessions/{session_id}/stop", json={
+        "current_battery_capacity_kw": round(level, 2), "energy_used_kwh": round(energy, 2),
+        "total_cost": round(energy * 2.5, 2)
+    })
+
+async def session_history(recorder: Recorder, client: httpx.AsyncClient, rng: random.Random, **_):
+    """History list of the last year"""
+    await recorder.request(client, "GET /sessions/", "GET", "/sessions/")
+
+async def verify_discount(recorder: Recorder, client: httpx.AsyncClient, rng: random.Random, discounts: int, **_):
+    """Discount verification, one in ten codes expired"""
+    code = discount_code(rng.randrange(discounts))
+    await recorder.request(client, "POST /discounts/verify/{code}", "POST", f"/discounts/verify/{code}")
+
+# Relative weights of the scenarios in the mix
+SCENARIOS = [
+    (charging_session, 2),
+    (session_history, 5),
+    (verify_discount, 3),
+]
+
+def _token(index: int) -> str:
+    return jwt.encode({"sub": user_id(index)}, settings.secret_key, algorithm=settings.algorithm)
+
+async def virtual_user(index: int, args, recorder: Recorder, ports: List[int], deadline: float):
+    rng = random.Random(args.seed * 100003 + index)
+    headers = {"Authorization": f"Bearer {_token(args.first_user + index)}"}
+    async with httpx.AsyncClient(base_url=args.base_url, headers=headers, timeout=args.timeout) as client:
+        vehicles = (await client.get("/vehicles/")).json()
+        if not vehicles:
+            raise RuntimeError(f"{user_id(args.first_user + index)} has no vehicles, run scripts.seed_dataset first")
+        scenarios, weights = zip(*SCENARIOS)
+        while time.monotonic() < deadline:
+            scenario = rng.choices(scenarios, weights)[0]
+            await scenario(recorder, client, rng, vehicle=vehicles[0], port_id=rng.choice(ports),
+                           updates=args.updates, discounts=args.discounts)
+            if args.think_time:
+                await asyncio.sleep(rng.uniform(0, 2 * args.think_time))
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    # Nearest-rank percentile
+    return ordered[max(0, math.ceil(p / 100 * len(ordered)) - 1)]
+
+def summarize(recorder: Recorder, elapsed: float) -> dict:
+    """
+    Builds the per-route report
+    Returns:
+        dict: Route template -> requests, errors, rps and percentiles in milliseconds
+    """
+    report = {}
+    for route in sorted(set(recorder.latencies) | set(recorder.errors)):
+        latencies = recorder.latencies.get(route, [])
+        entry = {"requests": len(latencies), "errors": recorder.errors.get(route, 0), "rps": round(len(latencies) / elapsed, 2)}
+        for p in PERCENTILES:
+            entry[f"p{p}_ms"] = round(percentile(latencies, p) * 1000, 2) if latencies else None
+        report[route] = entry
+    return report
+
+def compare(report: dict, baseline: dict, tolerance: float) -> List[str]:
+    """
+    Lists regressions against a baseline
+    Args:
+        report: Current report
+        baseline: Stored report
+        tolerance: Allowed relative slowdown of p95 and drop of throughput
+    Returns:
+        List[str]: One line per regressed route and metric
+    """
+    regressions = []
+    for route, current in report.items():
+        previous = baseline.get(route)
+        if previous is None:
+            continue
+        if current["p95_ms"] and previous.get("p95_ms") and current["p95_ms"] > previous["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {previous['p95_ms']} ms -> {current['p95_ms']} ms")
+        if previous.get("rps") and current["rps"] < previous["rps"] * (1 - tolerance):
+            regressions.append(f"{route}: throughput {previous['rps']} -> {current['rps']} req/s")
+    return regressions
+
+def print_report(report: dict, baseline: Optional[dict]):
+    print(f"{'route':<36} {'req':>7} {'err':>5} {'req/s':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  vs baseline p95")
+    for route, entry in report.items():
+        delta = ""
+        previous = (baseline or {}).get(route)
+        if previous and previous.get("p95_ms") and entry["p95_ms"]:
+            delta = f"{(entry['p95_ms'] / previous['p95_ms'] - 1) * 100:+.1f}%"
+        print(f"{route:<36} {entry['requests']:>7} {entry['errors']:>5} {entry['rps']:>8} "
+              f"{entry['p50_ms'] or '-':>9} {entry['p95_ms'] or '-':>9} {entry['p99_ms'] or '-':>9}  {delta}")
+
+async def run(args) -> dict:
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout) as client:
+        ports = [port["id"] for port in (await client.get("/ports/")).json()]
+    if not ports:
+        raise RuntimeError("No charging ports, run scripts.seed_dataset first")
+
+    recorder = Recorder()
+    start = time.monotonic()
+    deadline = start + args.duration
+    await asyncio.gather(*[virtual_user(i, args, recorder, ports, deadline) for i in range(args.users)])
+    return summarize(recorder, time.monotonic() - start)
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test the charging session API")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--users", type=int, default=50, help="Concurrent virtual users")
+    parser.add_argument("--first-user", type=int, default=0, help="Index of the first seeded bench user")
+    parser.add_argument("--duration", type=float, default=60, help="Seconds to run")
+    parser.add_argument("--updates", type=int, default=5, help="Telemetry updates per charging session")
+    parser.add_argument("--discounts", type=int, default=1000, help="Number of seeded discount codes")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between scenarios in seconds")
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--baseline", default="loadtest-baseline.json")
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression against the baseline")
+    parser.add_argument("--output", help="Also write the report as JSON to this file")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args))
+    baseline = None
+    if not args.save_baseline:
+        try:
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        except FileNotFoundError:
+            pass
+    print_report(report, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return
+    if baseline is not None:
+        regressions = compare(report, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,166 @@
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List
+from jose import jwt
+from sqlalchemy import Column, MetaData, Table, create_engine, insert, select
+from sqlalchemy.orm import Session
+from sqlalchemy.pool import StaticPool
+from app import models, schemas
+from app.config import settings
+from app.read_models import fetch, select_rows
+from app.routers.auth import decode_jwt_token, get_current_user
+from app.routers.sessions import calculate_cost
+from app.serialization import list_adapter
+from scripts.benchmark_serialization import build_payments, build_sessions
+
+"""
+Microbenchmarks of the hot inner costs of a request
+Each benchmark reports the best per-call time over several repeats.
+Results are appended to a JSON lines history together with the commit,
+and every run is compared with the median of the last --window runs, so
+a regression in one of these paths fails the run before deploy. The ORM
+and Core benchmarks use an in-memory SQLite copy of the tables
+Usage:
+    python -m scripts.microbenchmarks [--history microbenchmarks.jsonl] [--tolerance 0.2]
+"""
+
+ROWS = 10000
+
+def _sqlite_engine(*tables):
+    """In-memory SQLite database with plain copies of the given tables, without server defaults and foreign keys"""
+    metadata = MetaData()
+    for table in tables:
+        Table(table.name, metadata, *[
+            Column(column.name, column.type, primary_key=column.primary_key) for column in table.columns
+        ])
+    engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+    metadata.create_all(engine)
+    return engine
+
+def build_benchmarks() -> Dict[str, tuple]:
+    """
+    Prepares the fixtures of every benchmark
+    Returns:
+        Dict[str, tuple]: Name -> (callable, calls per repeat)
+    """
+    engine = _sqlite_engine(models.User.__table__, models.ChargingSession.__table__)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with engine.begin() as connection:
+        connection.execute(insert(models.User), [{"id": "bench-user", "email": "bench@bench.local",
+                                                  "role": models.UserRoleEnum.USER, "isTwoFactorEnabled": False}])
+        connection.execute(insert(models.ChargingSession), [
+            {"id": i, "user_id": "bench-user", "vehicle_id": i % 500, "port_id": i % 50,
+             "start_time": start + timedelta(minutes=i), "end_time": start + timedelta(minutes=i + 45),
+             "energy_used_kwh": 12.5 + i % 30, "total_cost": 20.0 + i % 17,
+             "status": "COMPLETED", "payment_status": "PAID"}
+            for i in range(ROWS)
+        ])
+    db = Session(engine)
+    token = jwt.encode({"sub": "bench-user"}, settings.secret_key, algorithm=settings.algorithm)
+
+    sessions = build_sessions(ROWS)
+    payments = build_payments(sessions)
+    session_rows = [{column: getattr(session, column) for column in schemas.ChargingSessionOut.model_fields} for session in sessions]
+    session_adapter = list_adapter(schemas.ChargingSessionOut)
+    payment_adapter = list_adapter(schemas.PaymentOut)
+    session_query = select(models.ChargingSession)
+    session_projection = select_rows(schemas.ChargingSessionOut, models.ChargingSession)
+
+    def orm_hydration():
+        db.expunge_all()
+        return db.execute(session_query).scalars().all()
+
+    return {
+        "decode_jwt_token": (lambda: decode_jwt_token(token), 2000),
+        "get_current_user": (lambda: get_current_user(token, db), 500),
+        "calculate_cost": (lambda: calculate_cost(42.5), 100000),
+        "validate ChargingSessionOut x10k (ORM objects)":
+            (lambda: session_adapter.validate_python(sessions, from_attributes=True), 3),
+        "validate ChargingSessionOut x10k (dicts)":
+            (lambda: session_adapter.validate_python(session_rows), 3),
+        "validate PaymentOut x10k (ORM objects)":
+            (lambda: payment_adapter.validate_python(payments, from_attributes=True), 3),
+        "ORM hydration ChargingSession x10k": (orm_hydration, 3),
+        "Core rows ChargingSession x10k": (lambda: fetch(db, session_projection), 3),
+    }
+
+def measure(function: Callable, number: int, repeat: int) -> float:
+    """
+    Returns the best per-call time in microseconds
+    Args:
+        function: Benchmarked callable
+        number: Calls per repeat
+        repeat: Number of repeats
+    """
+    function()
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            function()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best * 1e6
+
+def _commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+def load_history(path: str) -> List[dict]:
+    try:
+        with open(path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the microbenchmarks and track them over time")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--filter", default="", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--history", default="microbenchmarks.jsonl", help="JSON lines file the results are appended to")
+    parser.add_argument("--window", type=int, default=5, help="Number of previous runs the result is compared with")
+    parser.add_argument("--tolerance", type=float, default=0.20, help="Allowed slowdown against the previous runs")
+    parser.add_argument("--no-record", action="store_true", help="Compare without appending this run")
+    args = parser.parse_args()
+
+    history = [run for run in load_history(args.history) if run.get("python") == platform.python_version()]
+    previous = history[-args.window:]
+
+    results = {}
+    regressions = []
+    print(f"{'benchmark':<48} {'per call':>14} {'vs median':>10}")
+    for name, (function, number) in build_benchmarks().items():
+        if args.filter not in name:
+            continue
+        results[name] = round(measure(function, number, args.repeat), 3)
+        earlier = [run["results"][name] for run in previous if name in run["results"]]
+        delta = ""
+        if earlier:
+            reference = statistics.median(earlier)
+            change = results[name] / reference - 1
+            delta = f"{change * 100:+.1f}%"
+            if change > args.tolerance:
+                regressions.append(f"{name}: {reference:.3f} us -> {results[name]:.3f} us")
+        print(f"{name:<48} {results[name]:>11.3f} us {delta:>10}")
+
+    if not args.no_record:
+        with open(args.history, "a") as f:
+            f.write(json.dumps({
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "commit": _commit(),
+                "python": platform.python_version(),
+                "results": results,
+            }) + "\n")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import argparse
+import random
+import time
+from datetime import date, datetime, timedelta, timezone
+from sqlalchemy import insert, select, text
+from app import models
+from app.database import init_engine
+from app.partitions import MONTHS_AHEAD, PARTITIONED_TABLES
+
+"""
+Fills an empty database with a reproducible benchmark dataset
+Users are named bench-0000000, bench-0000001, ... and discount codes
+BENCH00000, BENCH00001, ..., so scripts.loadtest can address them
+without a manifest. The same --seed and --now always produce the same
+rows; --now defaults to today (UTC midnight). Sessions are spread over
+the --days days before it with about one in fifty recent sessions
+unpaid; paid sessions get a COMPLETED payment
+Usage:
+    alembic upgrade head && python -m scripts.seed_dataset [--sessions 2000000] [--seed 42]
+"""
+
+USER_PREFIX = "bench-"
+DISCOUNT_PREFIX = "BENCH"
+BRANDS = ["Tesla", "Volkswagen", "Hyundai", "Kia", "BMW", "Renault", "Skoda", "Nissan"]
+PORT_POWERS = [11, 22, 50, 100, 150, 350]
+PAYMENT_METHODS = ["card", "blik", "transfer"]
+
+def user_id(index: int) -> str:
+    return f"{USER_PREFIX}{index:07d}"
+
+def discount_code(index: int) -> str:
+    return f"{DISCOUNT_PREFIX}{index:05d}"
+
+def _insert(connection, model, rows: list, batch_size: int):
+    for start in range(0, len(rows), batch_size):
+        connection.execute(insert(model), rows[start:start + batch_size])
+
+def _ensure_partitions(connection, since: datetime):
+    for table in PARTITIONED_TABLES:
+        connection.execute(
+            text("SELECT create_monthly_partitions(:parent, :since, :months_ahead)"),
+            {"parent": table, "since": since, "months_ahead": MONTHS_AHEAD}
+        )
+
+def seed_catalog(connection, rng: random.Random, args, now: datetime) -> tuple:
+    """
+    Inserts users, vehicles, stations, ports and discounts
+    Returns:
+        tuple: (vehicles as (id, user_id, capacity) tuples, port IDs with their power)
+    """
+    _insert(connection, models.User, [
+        {"id": user_id(i), "name": f"Bench User {i}", "email": f"{user_id(i)}@bench.local",
+         "role": models.UserRoleEnum.USER, "isTwoFactorEnabled": False}
+        for i in range(args.users)
+    ], args.batch_size)
+
+    vehicles = []
+    for i in range(args.users):
+        for j in range(args.vehicles_per_user):
+            capacity = rng.choice([40, 52, 58, 64, 77, 82, 100])
+            vehicles.append({
+                "user_id": user_id(i),
+                "license_plate": f"BN{i:07d}{j:02d}",
+                "brand": rng.choice(BRANDS),
+                "battery_capacity_kwh": capacity,
+                "battery_condition": round(rng.uniform(0.8, 1.0), 3),
+                "max_charging_powerkwh": rng.choice([50, 100, 150, 250]),
+                "current_battery_capacity_kw": round(rng.uniform(0.1, 0.9) * capacity, 1),
+                "created_at": now - timedelta(days=args.days + rng.randint(0, 365)),
+            })
+    _insert(connection, models.Vehicle, vehicles, args.batch_size)
+
+    _insert(connection, models.ChargingStation, [
+        {"name": f"Bench Station {i}", "latitude": round(rng.uniform(49.0, 54.8), 6),
+         "longitude": round(rng.uniform(14.1, 24.1), 6), "created_at": now - timedelta(days=args.days)}
+        for i in range(args.stations)
+    ], args.batch_size)
+    station_ids = connection.execute(
+        select(models.ChargingStation.id).where(models.ChargingStation.name.like("Bench Station %"))
+        .order_by(models.ChargingStation.id)
+    ).scalars().all()
+    _insert(connection, models.ChargingPort, [
+        {"station_id": station_id, "power_kw": rng.choice(PORT_POWERS), "status": "wolny",
+         "last_service_date": date.today() - timedelta(days=rng.randint(0, 365)),
+         "created_at": now - timedelta(days=args.days)}
+        for station_id in station_ids
+        for _ in range(args.ports_per_station)
+    ], args.batch_size)
+
+    _insert(connection, models.Discount, [
+        {"code": discount_code(i), "description": f"Benchmark discount {i}",
+         "discount_percentage": rng.choice([5, 10, 15, 20]),
+         # Every tenth code is expired, so verification covers both branches
+         "expiration_date": now + timedelta(days=-30 if i % 10 == 9 else 365),
+         "created_at": now - timedelta(days=60)}
+        for i in range(args.discounts)
+    ], args.batch_size)
+
+    vehicle_rows = connection.execute(
+        select(models.Vehicle.id, models.Vehicle.user_id, models.Vehicle.battery_capacity_kwh)
+        .where(models.Vehicle.user_id.like(f"{USER_PREFIX}%"))
+        .order_by(models.Vehicle.id)
+    ).all()
+    port_rows = connection.execute(
+        select(models.ChargingPort.id, models.ChargingPort.power_kw).where(models.ChargingPort.station_id.in_(station_ids))
+        .order_by(models.ChargingPort.id)
+    ).all()
+    return [tuple(row) for row in vehicle_rows], [tuple(row) for row in port_rows]
+
+def seed_sessions(engine, rng: random.Random, args, now: datetime, vehicles: list, ports: list) -> tuple:
+    """
+    Inserts completed sessions and the payments of the paid ones, one transaction per batch
+    Returns:
+        tuple: (sessions inserted, payments inserted)
+    """
+    span = args.days * 86400
+    session_count = payment_count = 0
+    session_table = models.ChargingSession.__table__
+    for start in range(0, args.sessions, args.batch_size):
+        rows = []
+        for _ in range(min(args.batch_size, args.sessions - start)):
+            vehicle_id, owner, capacity = rng.choice(vehicles)
+            port_id, power = rng.choice(ports)
+            started = now - timedelta(seconds=rng.randint(3600, span))
+            energy = round(rng.uniform(0.1, 0.8) * (capacity or 60), 2)
+            minutes = max(5, int(energy / min(power, 150) * 60 * rng.uniform(1.0, 1.4)))
+            unpaid = started > now - timedelta(days=30) and rng.random() < 0.02
+            rows.append({
+                "user_id": owner, "vehicle_id": vehicle_id, "port_id": port_id,
+                "start_time": started, "end_time": started + timedelta(minutes=minutes),
+                "energy_used_kwh": energy, "total_cost": round(energy * 2.5, 2),
+                "status": "COMPLETED", "payment_status": "PENDING" if unpaid else "PAID",
+            })
+        with engine.begin() as connection:
+            inserted = connection.execute(
+                insert(session_table).returning(
+                    session_table.c.id, session_table.c.user_id, session_table.c.end_time, session_table.c.payment_status
+                ),
+                rows
+            ).all()
+            payments = [
+                {"user_id": row.user_id, "session_id": row.id, "status": "COMPLETED",
+                 "transaction_id": rng.randint(10**9, 10**12), "payment_method": rng.choice(PAYMENT_METHODS),
+                 "created_at": row.end_time}
+                for row in inserted if row.payment_status == "PAID"
+            ]
+            if payments:
+                connection.execute(insert(models.Payment.__table__), payments)
+        session_count += len(rows)
+        payment_count += len(payments)
+        print(f"  {session_count}/{args.sessions} sessions", end="\r", flush=True)
+    print()
+    return session_count, payment_count
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a benchmark dataset")
+    parser.add_argument("--users", type=int, default=10000)
+    parser.add_argument("--vehicles-per-user", type=int, default=2)
+    parser.add_argument("--stations", type=int, default=500)
+    parser.add_argument("--ports-per-station", type=int, default=4)
+    parser.add_argument("--sessions", type=int, default=2000000)
+    parser.add_argument("--discounts", type=int, default=1000)
+    parser.add_argument("--days", type=int, default=400, help="History covered by the sessions")
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--now", type=date.fromisoformat, default=None,
+                        help="Day the history ends at, YYYY-MM-DD, defaults to today (UTC)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    # Truncated to the day so reruns on the same UTC day, or with the same --now, produce the same timestamps
+    day = args.now or datetime.now(timezone.utc).date()
+    now = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+    engine = init_engine()
+    started = time.perf_counter()
+
+    with engine.begin() as connection:
+        if engine.dialect.name == "postgresql":
+            _ensure_partitions(connection, now - timedelta(days=args.days + 1))
+        vehicles, ports = seed_catalog(connection, rng, args, now)
+    print(f"Catalog: {args.users} users, {len(vehicles)} vehicles, {len(ports)} ports, {args.discounts} discounts")
+
+    sessions, payments = seed_sessions(engine, rng, args, now, vehicles, ports)
+    print(f"History: {sessions} sessions, {payments} payments in {time.perf_counter() - started:.1f} s")
+
+    if engine.dialect.name == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text("ANALYZE"))
+
+if __name__ == "__main__":
+    main()